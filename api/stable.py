@@ -5,6 +5,8 @@ import json
 import jwt
 import datetime
 
+from app.repository import InMemoryProductRepository
+
 app = FastAPI(title="Inventory Management Tool")
 
 # CORS middleware
@@ -24,7 +26,7 @@ users_db = {
     "User1": {"username": "User1", "role": "user", "email": "user@inventory.com"}
 }
 
-products_db = [
+products_db = InMemoryProductRepository([
     {
         "id": 1, 
         "name": "iPhone 15 Pro", 
@@ -43,7 +45,7 @@ products_db = [
         "price": 1299.99,
         "created_at": "2024-01-20T14:45:00Z"
     }
-]
+])
 
 @app.get("/")
 def read_root():
@@ -101,24 +103,20 @@ def get_users():
     ]
 
 @app.get("/products")
-def get_products():
-    return products_db
+def get_products(skip: int = 0, limit: int = 100):
+    return products_db.get_products(skip=skip, limit=limit)
 
 @app.post("/products")
 def add_product(product_data: dict):
-    new_id = len(products_db) + 1
-    current_time = datetime.datetime.utcnow().isoformat() + "Z"
-    product = {
-        "id": new_id,
-        "name": product_data.get("name"),
-        "type": product_data.get("type"),
-        "sku": product_data.get("sku"),
-        "quantity": product_data.get("quantity", 0),
-        "price": product_data.get("price", 0.0),
-        "created_at": current_time
-    }
-    products_db.append(product)
-    return {"message": "Product added", "product_id": new_id}
+    product = products_db.create_product(product_data)
+    return {"message": "Product added", "product_id": product["id"]}
+
+@app.put("/products/{product_id}/quantity")
+def update_product_quantity(product_id: int, update_data: dict):
+    quantity = update_data.get("quantity")
+    if quantity is None:
+        raise HTTPException(status_code=400, detail="Quantity is required")
+    return products_db.update_product_quantity(product_id, quantity)
 
 @app.get("/auth/google/url")
 def get_google_auth_url():
@@ -4,6 +4,8 @@ from datetime import timedelta
 import os
 import json
 
+from app.repository import InMemoryProductRepository
+
 app = FastAPI(title="Inventory Management Tool")
 
 # CORS middleware
@@ -38,7 +40,7 @@ users_db = {
     }
 }
 
-products_db = [
+products_db = InMemoryProductRepository([
     {
         "id": 1,
         "name": "iPhone 15 Pro",
@@ -57,7 +59,7 @@ products_db = [
         "quantity": 25,
         "price": 1299.99
     }
-]
+])
 
 @app.get("/")
 def read_root():
@@ -125,41 +127,31 @@ def register_user(user_data: dict):
     return {"message": "User registered successfully", "username": username}
 
 @app.get("/products")
-def get_products():
+def get_products(skip: int = 0, limit: int = 100):
     """
     Get all products
     """
-    return products_db
+    return products_db.get_products(skip=skip, limit=limit)
 
 @app.post("/products")
 def add_product(product_data: dict):
     """
     Add a new product
     """
-    new_id = len(products_db) + 1
-    product = {
-        "id": new_id,
-        "name": product_data.get("name"),
-        "type": product_data.get("type"),
-        "sku": product_data.get("sku"),
-        "description": product_data.get("description"),
-        "quantity": product_data.get("quantity", 0),
-        "price": product_data.get("price", 0.0)
-    }
-    products_db.append(product)
-    return {"message": "Product added successfully", "product_id": new_id}
+    product = products_db.create_product(product_data)
+    return {"message": "Product added successfully", "product_id": product["id"]}
 
 @app.put("/products/{product_id}/quantity")
 def update_product_quantity(product_id: int, update_data: dict):
     """
     Update product quantity
     """
-    for product in products_db:
-        if product["id"] == product_id:
-            product["quantity"] = update_data.get("quantity", product["quantity"])
-            return {"message": "Product quantity updated", "product": product}
-    
-    raise HTTPException(status_code=404, detail="Product not found")
+    existing = products_db.get_product_by_id(product_id)
+    if not existing:
+        raise HTTPException(status_code=404, detail="Product not found")
+    quantity = update_data.get("quantity", existing["quantity"])
+    product = products_db.update_product_quantity(product_id, quantity)
+    return {"message": "Product quantity updated", "product": product}
 
 @app.get("/users")
 def get_users():
@@ -0,0 +1,334 @@
+"""
+Adaptive admission control.
+
+When the database slows down, requests queue up in the threadpool behind
+get_db until clients time out and latency climbs for everyone. This
+middleware admits only as many concurrent requests per route as the route
+can serve at its normal latency, queues a bounded number of the rest, and
+turns the others away at once with 503 and a `Retry-After` header.
+
+Each route (method + path template) gets an AIMD limit. Every finished
+request is a latency sample: while the short-term latency (an average over
+about the last 20 requests) stays within ADMISSION_LATENCY_TOLERANCE times
+the route's baseline the limit grows by about one per limit's worth of
+requests, and when it rises above that, or the route answers 503, the limit
+is cut by ADMISSION_BACKOFF, never below ADMISSION_MIN_LIMIT. The baseline
+is the lowest mean latency of the route's recent blocks of
+BASELINE_BLOCK_SAMPLES requests. Comparing averages rather than the fastest
+single request means a route that steadily mixes cache hits and slow
+misses keeps its limit. It is off by default (ADMISSION_CONTROL_ENABLED).
+
+Routes are also prioritized: health checks are never limited, reads come
+first, then writes, then expensive requests (logins, registrations, bulk
+imports, jobs, image uploads). Lower priorities may only use part of the
+ADMISSION_MAX_INFLIGHT requests running at once, so they are held back
+before reads, waiting requests are let in highest priority first, and a
+full queue drops its lowest-priority request to make room for a better one.
+"""
+import asyncio
+import bisect
+import collections
+import itertools
+import json
+import math
+import os
+import time
+
+from starlette.routing import Match
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "false").lower() == "true"
+ADMISSION_MAX_INFLIGHT = int(os.getenv("ADMISSION_MAX_INFLIGHT", "64"))
+ADMISSION_INITIAL_LIMIT = int(os.getenv("ADMISSION_INITIAL_LIMIT", "10"))
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "4"))
+ADMISSION_MAX_LIMIT = int(os.getenv("ADMISSION_MAX_LIMIT", "64"))
+ADMISSION_QUEUE_SIZE = int(os.getenv("ADMISSION_QUEUE_SIZE", "100"))
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "500"))
+ADMISSION_LATENCY_TOLERANCE = float(os.getenv("ADMISSION_LATENCY_TOLERANCE", "2.0"))
+ADMISSION_BACKOFF = float(os.getenv("ADMISSION_BACKOFF", "0.9"))
+
+# Priorities, best first
+CRITICAL, READ, WRITE, EXPENSIVE = 0, 1, 2, 3
+PRIORITY_NAMES = {CRITICAL: "critical", READ: "read", WRITE: "write", EXPENSIVE: "expensive"}
+# Share of ADMISSION_MAX_INFLIGHT each priority may fill
+PRIORITY_SHARES = {READ: 1.0, WRITE: 0.75, EXPENSIVE: 0.4}
+
+CRITICAL_ROUTES = {("GET", "/"), ("GET", "/health")}
+EXPENSIVE_ROUTES = {
+    ("POST", "/login"), ("POST", "/register"), ("POST", "/token/refresh"), ("POST", "/auth/google"),
+    ("POST", "/users/bulk"), ("POST", "/jobs"), ("POST", "/products/{product_id}/image"),
+}
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+# Baseline latency is the lowest mean latency of a block of this many
+# requests among the last BASELINE_BLOCKS blocks
+BASELINE_BLOCK_SAMPLES = 200
+BASELINE_BLOCKS = 5
+BASELINE_MIN_SAMPLES = 20
+# Weight of each request in the short-term latency, about 1 / 20 requests
+LATENCY_SMOOTHING = 0.05
+# Latency below this never counts as slow, however fast the baseline
+LATENCY_SLACK_SECONDS = 0.005
+
+
+def route_priority(method: str, route: str) -> int:
+    if (method, route) in CRITICAL_ROUTES:
+        return CRITICAL
+    if (method, route) in EXPENSIVE_ROUTES:
+        return EXPENSIVE
+    return READ if method in READ_METHODS else WRITE
+
+
+class AIMDLimit:
+    """
+    Concurrency limit for one route, adapted to its latency.
+    """
+
+    def __init__(self, initial: int = ADMISSION_INITIAL_LIMIT, min_limit: int = ADMISSION_MIN_LIMIT,
+                 max_limit: int = ADMISSION_MAX_LIMIT, tolerance: float = ADMISSION_LATENCY_TOLERANCE,
+                 backoff: float = ADMISSION_BACKOFF):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.inflight = 0
+        self.latency = None  # short-term EWMA, seconds
+        self._blocks = collections.deque(maxlen=BASELINE_BLOCKS)  # mean latency of finished blocks
+        self._block_sum = 0.0
+        self._block_samples = 0
+        self._since_decrease = 0
+
+    @property
+    def baseline(self):
+        means = list(self._blocks)
+        # The block being filled counts once past its first few requests,
+        # or from the start for a new route
+        if self._block_samples >= BASELINE_MIN_SAMPLES or (self._block_samples and not means):
+            means.append(self._block_sum / self._block_samples)
+        return min(means) if means else None
+
+    def available(self):
+        return self.inflight < int(self.limit)
+
+    def on_sample(self, latency: float, overloaded: bool = False):
+        self.latency = latency if self.latency is None else self.latency + LATENCY_SMOOTHING * (latency - self.latency)
+        self._block_sum += latency
+        self._block_samples += 1
+        if self._block_samples == BASELINE_BLOCK_SAMPLES:
+            self._blocks.append(self._block_sum / self._block_samples)
+            self._block_sum, self._block_samples = 0.0, 0
+
+        self._since_decrease += 1
+        if overloaded or self.latency > self.baseline * self.tolerance + LATENCY_SLACK_SECONDS:
+            # Requests admitted before the last cut are still finishing slowly;
+            # wait for a limit's worth of samples before cutting again
+            if self._since_decrease >= self.limit:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+                self._since_decrease = 0
+        elif self.inflight + 1 >= self.limit / 2:
+            # Only grow while the limit is actually being used
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def stats(self):
+        return {
+            "limit": int(self.limit),
+            "inflight": self.inflight,
+            "latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None,
+            "baseline_ms": round(self.baseline * 1000, 2) if self.baseline is not None else None,
+        }
+
+
+class AdmissionController:
+    """
+    Per-route limits, a shared ceiling split by priority and one bounded
+    priority queue. Runs on the event loop, so it needs no locks.
+    """
+
+    def __init__(self, max_inflight: int = ADMISSION_MAX_INFLIGHT, queue_size: int = ADMISSION_QUEUE_SIZE,
+                 queue_timeout_seconds: float = ADMISSION_QUEUE_TIMEOUT_MS / 1000):
+        self.max_inflight = max_inflight
+        self.queue_size = queue_size
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self.limits = {}
+        self.inflight = 0
+        self._queue = []  # sorted [(priority, seq, route, future)]
+        self._seq = itertools.count()
+        self.admitted = 0
+        self.queued = 0
+        self.shed = {name: 0 for name in PRIORITY_NAMES.values()}
+
+    def _limit(self, route):
+        limit = self.limits.get(route)
+        if limit is None:
+            limit = self.limits[route] = AIMDLimit()
+        return limit
+
+    def _can_admit(self, route, priority):
+        limit = self.limits[route]
+        if not limit.available() or self.inflight >= self.max_inflight * PRIORITY_SHARES[priority]:
+            return False
+        # Better-priority requests waiting hold back worse ones, except that
+        # every route may run one request so none is starved outright
+        return limit.inflight == 0 or not self._queue or self._queue[0][0] >= priority
+
+    def _admit(self, route):
+        self.limits[route].inflight += 1
+        self.inflight += 1
+        self.admitted += 1
+
+    async def acquire(self, route, priority):
+        """
+        Wait for a slot. Returns False when the request should be shed.
+        """
+        self._limit(route)
+        # Waiters are only left queued when they can't be admitted, so a
+        # request that can go now isn't jumping ahead of anyone who could
+        if self._can_admit(route, priority):
+            self._admit(route)
+            return True
+
+        entry = (priority, next(self._seq), route, asyncio.get_running_loop().create_future())
+        if len(self._queue) >= self.queue_size:
+            worst = self._queue[-1] if self._queue else None
+            if worst is None or worst[0] <= priority:
+                self._shed(priority)
+                return False
+            # Make room by dropping the lowest-priority waiter
+            self._queue.pop()
+            self._shed(worst[0])
+            worst[3].set_result(False)
+        bisect.insort(self._queue, entry, key=lambda e: e[:2])
+        self.queued += 1
+        self._dispatch()
+        try:
+            return await asyncio.wait_for(asyncio.shield(entry[3]), self.queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            if entry[3].done():
+                return entry[3].result()
+            self._queue.remove(entry)
+            self._shed(priority)
+            return False
+        except asyncio.CancelledError:
+            # Client went away; give back a slot it may just have been handed
+            if entry in self._queue:
+                self._queue.remove(entry)
+            elif entry[3].done() and entry[3].result():
+                self.release(route, None)
+            raise
+
+    def release(self, route, latency, overloaded=False):
+        limit = self.limits[route]
+        limit.inflight -= 1
+        self.inflight -= 1
+        if latency is not None:
+            limit.on_sample(latency, overloaded)
+        self._dispatch()
+
+    def _dispatch(self):
+        """
+        Let in waiters, best priority first, skipping those whose route is full.
+        """
+        index = 0
+        while index < len(self._queue) and self.inflight < self.max_inflight:
+            priority, _, route, future = self._queue[index]
+            if self._can_admit(route, priority):
+                self._queue.pop(index)
+                self._admit(route)
+                future.set_result(True)
+            else:
+                index += 1
+
+    def _shed(self, priority):
+        self.shed[PRIORITY_NAMES[priority]] += 1
+
+    def retry_after(self, route):
+        """
+        Seconds until the route's queue has likely drained, at least 1.
+        """
+        limit = self.limits[route]
+        waiting = sum(1 for entry in self._queue if entry[2] == route) + 1
+        return max(1, min(30, math.ceil(waiting * (limit.latency or 1) / max(limit.limit, 1))))
+
+    def stats(self):
+        return {
+            "inflight": self.inflight,
+            "max_inflight": self.max_inflight,
+            "queue_length": len(self._queue),
+            "queue_size": self.queue_size,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": dict(self.shed),
+            "routes": {route: limit.stats() for route, limit in sorted(self.limits.items())},
+        }
+
+
+class AdmissionMiddleware:
+    """
+    Applies the AdmissionController to HTTP requests. Needs the app's router
+    to key limits by path template rather than by raw path.
+    """
+
+    def __init__(self, app, router, controller: AdmissionController = None):
+        self.app = app
+        self.router = router
+        self.controller = controller or admission_controller
+
+    def _route(self, scope):
+        partial = None
+        for route in self.router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                return getattr(route, "path", scope["path"])
+            if match == Match.PARTIAL and partial is None:
+                partial = getattr(route, "path", scope["path"])
+        return partial
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        path = self._route(scope)
+        priority = route_priority(method, path)
+        if path is None or priority == CRITICAL:
+            await self.app(scope, receive, send)
+            return
+
+        route = f"{method} {path}"
+        if not await self.controller.acquire(route, priority):
+            await self._reject(send, self.controller.retry_after(route))
+            return
+
+        status_code = None
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        latency = None
+        try:
+            await self.app(scope, receive, send_with_status)
+            latency = time.perf_counter() - start
+        finally:
+            # A request that failed outright says nothing useful about latency
+            self.controller.release(route, latency, overloaded=status_code == 503)
+
+    @staticmethod
+    async def _reject(send, retry_after):
+        body = json.dumps({"detail": "Server is busy, retry later"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+admission_controller = AdmissionController()
@@ -0,0 +1,321 @@
+"""
+Low-stock alerts.
+
+Each product has a reorder threshold (Product.reorder_threshold, or
+LOW_STOCK_THRESHOLD when unset). A product is low on stock while its
+quantity is below it. Alerts fire only when a write moves a product across
+its threshold: `low_stock` on the way down, `restocked` on the way back up.
+Nothing ever scans the catalog.
+
+Stock mutations call `track_stock_change(db, product_id, delta)` next to the
+write, like `audit` and `publish` (and threshold updates
+`track_threshold_change`). The change is held on the session; just
+before commit one query reads the current quantity and threshold of the
+touched products, works out the state before the transaction from the
+deltas, and the resulting alerts are handed to the dispatcher only once the
+commit succeeds. Relative updates (`quantity = quantity - n`) are covered
+too, since the query sees the row after them.
+
+The dispatcher delivers every alert to each configured sink (ALERT_SINKS)
+on that sink's own background thread and bounded queue, so a slow webhook
+delays neither the write path nor the other sinks. Sinks are registered
+with `@alert_sink("name")`; built in are `log`, `webhook` (POST JSON to
+ALERT_WEBHOOK_URL, retried with exponential backoff) and `memory` (keeps
+recent alerts for tests and GET /alerts/stats).
+"""
+import collections
+import contextlib
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.models import Product
+
+logger = logging.getLogger(__name__)
+
+LOW_STOCK_THRESHOLD = int(os.getenv("LOW_STOCK_THRESHOLD", "10"))
+ALERT_SINKS = [name.strip() for name in os.getenv("ALERT_SINKS", "log").split(",") if name.strip()]
+ALERT_QUEUE_SIZE = int(os.getenv("ALERT_QUEUE_SIZE", "10000"))
+ALERT_WEBHOOK_URL = os.getenv("ALERT_WEBHOOK_URL", "")
+ALERT_WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("ALERT_WEBHOOK_TIMEOUT_SECONDS", "5"))
+ALERT_WEBHOOK_RETRIES = int(os.getenv("ALERT_WEBHOOK_RETRIES", "5"))
+ALERT_WEBHOOK_BACKOFF_SECONDS = float(os.getenv("ALERT_WEBHOOK_BACKOFF_SECONDS", "0.5"))
+ALERT_WEBHOOK_MAX_BACKOFF_SECONDS = 30
+
+LOW_STOCK, RESTOCKED = "low_stock", "restocked"
+
+alert_sink_types = {}
+
+
+def alert_sink(name):
+    """
+    Register a sink class under `name` for ALERT_SINKS. It is constructed
+    without arguments and its `send(alert)` is called with each alert dict;
+    raising marks the delivery as failed.
+    """
+    def register(cls):
+        alert_sink_types[name] = cls
+        cls.name = name
+        return cls
+    return register
+
+
+@alert_sink("log")
+class LogSink:
+    def send(self, alert: dict):
+        logger.warning("Stock alert %s: product %s (%s) at %s, threshold %s", alert["type"],
+                       alert["product_id"], alert["sku"], alert["quantity"], alert["threshold"])
+
+
+@alert_sink("memory")
+class MemorySink:
+    def __init__(self, size: int = 1000):
+        self.alerts = collections.deque(maxlen=size)
+
+    def send(self, alert: dict):
+        self.alerts.append(alert)
+
+    def stats(self):
+        return {"recent": list(self.alerts)[-20:]}
+
+
+class WebhookError(Exception):
+    pass
+
+
+@alert_sink("webhook")
+class WebhookSink:
+    """
+    POSTs each alert as JSON. Connection errors, timeouts, 429 and 5xx
+    responses are retried up to `retries` times, waiting `backoff` seconds
+    doubled on every attempt (with jitter); other 4xx are not retried.
+    """
+
+    def __init__(self, url: str = ALERT_WEBHOOK_URL, timeout: float = ALERT_WEBHOOK_TIMEOUT_SECONDS,
+                 retries: int = ALERT_WEBHOOK_RETRIES, backoff: float = ALERT_WEBHOOK_BACKOFF_SECONDS):
+        if not url:
+            raise ValueError("ALERT_WEBHOOK_URL must be set to use the webhook alert sink")
+        # httpx is only needed when this sink is configured
+        import httpx
+
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.retried = 0
+        self._client = httpx.Client(timeout=timeout)
+        self._transient = (httpx.TransportError,)
+
+    def send(self, alert: dict):
+        for attempt in range(self.retries + 1):
+            try:
+                response = self._client.post(self.url, json=alert)
+                if response.status_code < 400:
+                    return
+                error = WebhookError(f"Webhook answered {response.status_code}")
+                if response.status_code != 429 and response.status_code < 500:
+                    raise error
+            except self._transient as e:
+                error = e
+            if attempt == self.retries:
+                raise error
+            self.retried += 1
+            delay = min(ALERT_WEBHOOK_MAX_BACKOFF_SECONDS, self.backoff * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def close(self):
+        self._client.close()
+
+    def stats(self):
+        return {"retried": self.retried}
+
+
+class SinkWorker:
+    """
+    Feeds one sink from its own bounded queue on a daemon thread.
+    """
+
+    def __init__(self, sink, queue_size: int = ALERT_QUEUE_SIZE):
+        self.sink = sink
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self.delivered = 0
+        self.failed = 0
+        self.dropped = 0
+
+    def put(self, alert: dict):
+        try:
+            self._queue.put_nowait(alert)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning("Alert queue of sink %s full; %s alerts dropped so far", self.sink.name, self.dropped)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=f"alerts-{self.sink.name}", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float):
+        """
+        Deliver what is already queued (within `timeout`), then stop.
+        """
+        if self._thread is not None:
+            with contextlib.suppress(queue.Full):
+                self._queue.put(None, timeout=timeout)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            alert = self._queue.get()
+            if alert is None:
+                return
+            try:
+                self.sink.send(alert)
+                self.delivered += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Delivering %s alert for product %s to sink %s failed",
+                                 alert["type"], alert["product_id"], self.sink.name)
+
+    def stats(self):
+        stats = {
+            "queued": self._queue.qsize(),
+            "delivered": self.delivered,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+        if hasattr(self.sink, "stats"):
+            stats.update(self.sink.stats())
+        return stats
+
+
+class AlertDispatcher:
+    def __init__(self, sink_names=ALERT_SINKS):
+        self.sink_names = list(sink_names)
+        self.workers = []
+        self.alerts = {LOW_STOCK: 0, RESTOCKED: 0}
+
+    def start(self):
+        """
+        Build the configured sinks and start a worker for each. An unknown
+        or misconfigured sink is logged and skipped rather than failing startup.
+        """
+        for name in self.sink_names:
+            sink_type = alert_sink_types.get(name)
+            if sink_type is None:
+                logger.error("Unknown alert sink %s; available: %s", name, ", ".join(sorted(alert_sink_types)))
+                continue
+            try:
+                worker = SinkWorker(sink_type())
+            except Exception:
+                logger.exception("Alert sink %s could not be created", name)
+                continue
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self, timeout: float = 5.0):
+        for worker in self.workers:
+            worker.stop(timeout)
+            if hasattr(worker.sink, "close"):
+                worker.sink.close()
+        self.workers = []
+
+    def sink(self, name):
+        """
+        The running sink registered as `name`, or None.
+        """
+        return next((worker.sink for worker in self.workers if worker.sink.name == name), None)
+
+    def dispatch(self, alert: dict):
+        self.alerts[alert["type"]] += 1
+        for worker in self.workers:
+            worker.put(alert)
+
+    def stats(self):
+        return {
+            "alerts": dict(self.alerts),
+            "sinks": {worker.sink.name: worker.stats() for worker in self.workers},
+        }
+
+
+alert_dispatcher = AlertDispatcher()
+
+
+# Marks a pending change that leaves the threshold alone
+_UNCHANGED = object()
+
+
+def _pending_change(db: Session, product_id: int):
+    pending = db.info.setdefault("pending_stock_changes", {})
+    return pending.setdefault(product_id, {"delta": 0, "old_threshold": _UNCHANGED})
+
+
+def track_stock_change(db: Session, product_id: int, delta: int):
+    """
+    Note that a product's quantity changes by `delta` in this transaction.
+    Checked for a threshold crossing when the session commits.
+    """
+    _pending_change(db, product_id)["delta"] += delta
+
+
+def track_threshold_change(db: Session, product_id: int, old_threshold):
+    """
+    Note that a product's reorder threshold changes from `old_threshold`
+    (None for the default) in this transaction.
+    """
+    change = _pending_change(db, product_id)
+    if change["old_threshold"] is _UNCHANGED:
+        change["old_threshold"] = old_threshold
+
+
+def _threshold(value):
+    return LOW_STOCK_THRESHOLD if value is None else value
+
+
+@event.listens_for(Session, "before_commit")
+def _evaluate_stock_changes(session):
+    pending = session.info.get("pending_stock_changes")
+    if not pending:
+        return
+    session.flush()
+    rows = (
+        session.query(Product.id, Product.sku, Product.name, Product.quantity, Product.reorder_threshold)
+        .filter(Product.id.in_(list(pending)))
+        .all()
+    )
+    alerts = []
+    now = datetime.now(timezone.utc).isoformat()
+    for product_id, sku, name, quantity, reorder_threshold in rows:
+        change = pending[product_id]
+        threshold = _threshold(reorder_threshold)
+        old_threshold = threshold if change["old_threshold"] is _UNCHANGED else _threshold(change["old_threshold"])
+        previous = quantity - change["delta"]
+        was_low, is_low = previous < old_threshold, quantity < threshold
+        if was_low != is_low:
+            alerts.append({
+                "type": LOW_STOCK if is_low else RESTOCKED,
+                "product_id": product_id, "sku": sku, "name": name,
+                "quantity": quantity, "previous_quantity": previous, "threshold": threshold,
+                "at": now,
+            })
+    session.info["pending_stock_alerts"] = alerts
+
+
+@event.listens_for(Session, "after_commit")
+def _dispatch_stock_alerts(session):
+    session.info.pop("pending_stock_changes", None)
+    for alert in session.info.pop("pending_stock_alerts", ()):
+        alert_dispatcher.dispatch(alert)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_stock_changes(session):
+    session.info.pop("pending_stock_changes", None)
+    session.info.pop("pending_stock_alerts", None)
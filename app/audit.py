@@ -0,0 +1,156 @@
+"""
+Audit trail of who changed what.
+
+CRUD functions call `audit(db, ...)` next to the write; like invalidation
+events, the entry is held on the session and only queued once the
+transaction commits, so rolled-back writes leave no trace. A background
+thread drains the queue and writes entries in batches, one multi-row INSERT
+and one commit per batch, so a request never waits on the audit table.
+
+The queue is bounded (AUDIT_QUEUE_SIZE); if the database falls that far
+behind, new entries are dropped and counted rather than growing memory or
+blocking writes. The queue is flushed when the app shuts down.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import AuditLog
+
+logger = logging.getLogger(__name__)
+
+AUDIT_QUEUE_SIZE = int(os.getenv("AUDIT_QUEUE_SIZE", "10000"))
+AUDIT_BATCH_SIZE = int(os.getenv("AUDIT_BATCH_SIZE", "500"))
+AUDIT_FLUSH_SECONDS = float(os.getenv("AUDIT_FLUSH_SECONDS", "1"))
+
+
+class AuditWriter:
+    def __init__(self, queue_size: int = AUDIT_QUEUE_SIZE, batch_size: int = AUDIT_BATCH_SIZE,
+                 flush_seconds: float = AUDIT_FLUSH_SECONDS, retries: int = 3):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retries = retries
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+
+    def enqueue(self, entry: dict):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped % 1000 == 1:
+                logger.warning("Audit queue full; %s entries dropped so far", self.dropped)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Write everything still queued, then stop the writer thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch:
+                self._write(batch)
+            elif self._stop.is_set():
+                return
+
+    def _take_batch(self):
+        """
+        Wait for an entry, then keep collecting until the batch is full or
+        `flush_seconds` have passed (group commit). When stopping, take what's
+        queued without waiting.
+        """
+        try:
+            batch = [self._queue.get(timeout=0 if self._stop.is_set() else self.flush_seconds)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_seconds
+        while len(batch) < self.batch_size:
+            remaining = 0 if self._stop.is_set() else deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        for attempt in range(1, self.retries + 1):
+            db = SessionLocal()
+            try:
+                # executemany; SQLAlchemy sends it as multi-row INSERT ... VALUES
+                db.execute(insert(AuditLog), batch)
+                db.commit()
+                self.written += len(batch)
+                self.batches += 1
+                return
+            except Exception:
+                db.rollback()
+                logger.exception("Writing %s audit entries failed (attempt %s)", len(batch), attempt)
+                self._stop.wait(min(2 ** attempt, 10))
+            finally:
+                db.close()
+        self.dropped += len(batch)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "written": self.written,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
+
+
+audit_writer = AuditWriter()
+
+
+def audit(db: Session, action: str, entity: str, entity_id: int = None, actor: tuple = None, **details):
+    """
+    Record `action` (e.g. "product.create") on an entity, attributed to
+    `actor` (user id, username) or else the user of the current request.
+    Written after `db` commits.
+    """
+    if actor is None:
+        # Set by get_current_user on the request the session belongs to
+        actor = getattr(db.info.get("request_state"), "actor", None)
+    db.info.setdefault("pending_audit", []).append({
+        "created_at": datetime.now(timezone.utc),
+        "actor_id": actor[0] if actor else None,
+        "actor": actor[1] if actor else None,
+        "action": action,
+        "entity": entity,
+        "entity_id": entity_id,
+        "details": json.dumps(details, default=str) if details else None,
+    })
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_pending_audit(session):
+    for entry in session.info.pop("pending_audit", ()):
+        audit_writer.enqueue(entry)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_audit(session):
+    session.info.pop("pending_audit", None)
+
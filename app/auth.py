@@ -1,14 +1,18 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
-from jose import JWTError, jwt
-from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import get_read_db
 from app.models import User, UserRole
 from app.schemas import TokenData
+from app.revocation import revocation_list, revoke_token, revoke_user_tokens
+from app.tracing import start_span
 import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -16,16 +20,63 @@ load_dotenv()
 # Security configuration
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
+# Access tokens are short-lived; clients get a new one with their refresh
+# token. Revoked tokens are rejected by app.revocation before they expire.
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "15"))
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "7"))
+# Processes hashing passwords for bulk user imports (0 = one per CPU)
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or os.cpu_count() or 1
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 security = HTTPBearer()
 
+# passlib/bcrypt and jose are loaded on first use so that importing the app
+# (a serverless cold start) doesn't pay for them before a request needs them.
+_pwd_context = None
+
+def get_pwd_context():
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+        _pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return _pwd_context
+
 def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+    with start_span("password.verify"):
+        return get_pwd_context().verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    return pwd_context.hash(password)
+    with start_span("password.hash"):
+        return get_pwd_context().hash(password)
+
+_hash_executor = None
+
+def get_hash_executor():
+    global _hash_executor
+    if _hash_executor is None:
+        _hash_executor = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+    return _hash_executor
+
+def shutdown_hash_executor():
+    global _hash_executor
+    if _hash_executor is not None:
+        _hash_executor.shutdown(wait=False, cancel_futures=True)
+        _hash_executor = None
+
+def _hash_password(password):
+    return get_pwd_context().hash(password)
+
+def get_password_hashes(passwords):
+    """
+    Hash many passwords at once, spread over a process pool: bcrypt is
+    deliberately slow, so a batch takes about len(passwords) / workers
+    hash times instead of len(passwords).
+    """
+    passwords = list(passwords)
+    if len(passwords) <= 1:
+        return [get_password_hash(password) for password in passwords]
+    with start_span("password.hash_batch", count=len(passwords), workers=PASSWORD_HASH_WORKERS):
+        chunksize = max(1, len(passwords) // (PASSWORD_HASH_WORKERS * 4))
+        return list(get_hash_executor().map(_hash_password, passwords, chunksize=chunksize))
 
 def authenticate_user(db: Session, username: str, password: str):
     user = db.query(User).filter(User.username == username).first()
@@ -42,27 +93,87 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     else:
         expire = datetime.utcnow() + timedelta(minutes=15)
     to_encode.update({"exp": expire})
+    # jti identifies the token for revocation; iat is compared against
+    # per-user revocation cutoffs, so it keeps sub-second precision
+    to_encode.setdefault("type", "access")
+    to_encode.setdefault("jti", uuid.uuid4().hex)
+    to_encode.setdefault("iat", time.time())
+    from jose import jwt
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def create_refresh_token(username: str):
+    return create_access_token(
+        data={"sub": username, "type": "refresh"},
+        expires_delta=timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    )
+
+def issue_tokens(user: User):
+    """
+    Access and refresh token pair for a login or refresh response.
+    """
+    access_token = create_access_token(
+        data={"sub": user.username, "role": user.role},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {
+        "access_token": access_token,
+        "refresh_token": create_refresh_token(user.username),
+        "token_type": "bearer",
+        "expires_in": ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    }
+
+def decode_token(token: str, token_type: str = "access"):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    from jose import JWTError, jwt
     try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         username: str = payload.get("sub")
         role: str = payload.get("role")
-        if username is None:
+        if username is None or payload.get("type", "access") != token_type:
             raise credentials_exception
-        token_data = TokenData(username=username, role=UserRole(role) if role else None)
+        # In-memory lookup; see app.revocation
+        if revocation_list.is_revoked(payload.get("jti"), username, payload.get("iat")):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has been revoked",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        token_data = TokenData(
+            username=username,
+            role=UserRole(role) if role else None,
+            jti=payload.get("jti"),
+            expires_at=datetime.fromtimestamp(payload["exp"], timezone.utc),
+        )
     except JWTError:
         raise credentials_exception
     return token_data
 
-def get_current_user(token_data: TokenData = Depends(verify_token), db: Session = Depends(get_db)):
+def token_subject(token: str) -> Optional[str]:
+    """
+    The username of a validly signed, unexpired access or refresh token, or
+    None. Skips the revocation check, so it never touches the database.
+    """
+    from jose import JWTError, jwt
+    try:
+        return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM]).get("sub")
+    except JWTError:
+        return None
+
+def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    with start_span("verify_token"):
+        return decode_token(credentials.credentials)
+
+def refresh_tokens(db: Session, refresh_token: str):
+    """
+    Exchange a refresh token for a new token pair. The refresh token is
+    rotated: the old one is revoked, so a replayed copy is rejected.
+    """
+    token_data = decode_token(refresh_token, token_type="refresh")
     user = db.query(User).filter(User.username == token_data.username).first()
     if user is None:
         raise HTTPException(
@@ -70,6 +181,55 @@ def get_current_user(token_data: TokenData = Depends(verify_token), db: Session
             detail="User not found",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    try:
+        if token_data.jti is not None:
+            revoke_token(db, token_data.jti, token_data.expires_at, user.username, reason="refresh")
+        db.commit()
+    except IntegrityError:
+        # A concurrent refresh of the same token revoked it first
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has been revoked",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return issue_tokens(user)
+
+def logout(db: Session, token_data: TokenData, refresh_token: Optional[str] = None):
+    """
+    Revoke the access token used for the request and, if given, the refresh
+    token issued with it.
+    """
+    if token_data.jti is not None:
+        revoke_token(db, token_data.jti, token_data.expires_at, token_data.username, reason="logout")
+    if refresh_token:
+        refresh_data = decode_token(refresh_token, token_type="refresh")
+        if refresh_data.username != token_data.username:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Refresh token belongs to another user"
+            )
+        if refresh_data.jti is not None:
+            revoke_token(db, refresh_data.jti, refresh_data.expires_at, refresh_data.username, reason="logout")
+    db.commit()
+
+def revoke_all_tokens(db: Session, username: str, reason: str = None):
+    """
+    Revoke every token issued to `username` so far, e.g. after a role change.
+    The caller commits.
+    """
+    return revoke_user_tokens(db, username, timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS), reason=reason)
+
+def get_current_user(request: Request, token_data: TokenData = Depends(verify_token), db: Session = Depends(get_read_db)):
+    with start_span("get_current_user", **{"enduser.id": token_data.username}):
+        user = db.query(User).filter(User.username == token_data.username).first()
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User not found",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    request.state.actor = (user.id, user.username)
     return user
 
 # Role-based access control functions
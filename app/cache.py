@@ -0,0 +1,148 @@
+"""
+In-process result cache with tag-based invalidation.
+
+Entries are tagged with the entities they were built from (e.g.
+"product:12" for a page containing product 12, "product-list" for anything
+whose membership depends on inserts and deletes). Invalidation events from
+app.invalidation evict only the entries carrying a matching tag, so a
+quantity update drops the pages showing that product and nothing else.
+
+The cache is bounded by an approximate byte size and evicts least recently
+used entries first. A read that started before an invalidation of one of
+its tags is not stored, so a slow read can't put stale rows back.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from app.database import DATABASE_REPLICA_URLS, READ_YOUR_WRITES_SECONDS
+from app.invalidation import invalidation_bus, InvalidationEvent
+
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESULT_CACHE_TTL_SECONDS = float(os.getenv("RESULT_CACHE_TTL_SECONDS", "600"))
+SKU_CACHE_MAX_BYTES = int(os.getenv("SKU_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+
+
+class TaggedLRUCache:
+    def __init__(self, max_bytes: int = RESULT_CACHE_MAX_BYTES, ttl_seconds: float = RESULT_CACHE_TTL_SECONDS,
+                 replica_lag_seconds: float = 0.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        # With replicas, a read right after a write may still see old rows
+        self.replica_lag_seconds = replica_lag_seconds
+        self._entries = OrderedDict()  # key -> (value, size, tags, expires_at)
+        self._tag_index = {}  # tag -> set of keys
+        self._invalidated = {}  # tag -> (sequence, monotonic time) of its last invalidation
+        self._sequence = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def begin(self):
+        """
+        Token to pass to put(); taken before reading from the database.
+        """
+        return self._sequence
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[3] <= time.monotonic():
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, tags, size: int, token: int):
+        now = time.monotonic()
+        with self._lock:
+            for tag in tags:
+                invalidated = self._invalidated.get(tag)
+                if invalidated and (invalidated[0] > token or now - invalidated[1] < self.replica_lag_seconds):
+                    return False
+            if size > self.max_bytes:
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, tuple(tags), now + self.ttl_seconds)
+            self._bytes += size
+            for tag in tags:
+                self._tag_index.setdefault(tag, set()).add(key)
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            return True
+
+    def _remove(self, key):
+        value, size, tags, _ = self._entries.pop(key)
+        self._bytes -= size
+        for tag in tags:
+            keys = self._tag_index.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tag_index[tag]
+
+    def invalidate_tags(self, tags):
+        now = time.monotonic()
+        with self._lock:
+            self._sequence += 1
+            for tag in tags:
+                self._invalidated[tag] = (self._sequence, now)
+                for key in list(self._tag_index.get(tag, ())):
+                    self._remove(key)
+                    self.invalidations += 1
+            if len(self._invalidated) > 100000:
+                # Only recent invalidations can still race with a read in flight
+                cutoff = now - max(self.replica_lag_seconds, 60)
+                self._invalidated = {t: v for t, v in self._invalidated.items() if v[1] >= cutoff}
+
+    def clear(self):
+        with self._lock:
+            self._sequence += 1
+            self._entries.clear()
+            self._tag_index.clear()
+            self._bytes = 0
+
+    def on_invalidation(self, invalidation: InvalidationEvent):
+        if invalidation.entity == "*":
+            self.clear()
+            return
+        entity = invalidation.entity
+        tags = [f"{entity}:{id}" for id in invalidation.ids]
+        tags += [f"{entity}-key:{key}" for key in invalidation.keys]
+        if not invalidation.ids:
+            tags.append(entity)
+        if invalidation.action in ("create", "delete"):
+            tags.append(f"{entity}-list")
+        self.invalidate_tags(tags)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+_replica_lag = READ_YOUR_WRITES_SECONDS if DATABASE_REPLICA_URLS else 0.0
+
+result_cache = TaggedLRUCache(replica_lag_seconds=_replica_lag)
+invalidation_bus.subscribe(result_cache.on_invalidation)
+
+# Barcode lookups get their own LRU so large list pages can't evict hot SKUs
+sku_cache = TaggedLRUCache(max_bytes=SKU_CACHE_MAX_BYTES, replica_lag_seconds=_replica_lag)
+invalidation_bus.subscribe(sku_cache.on_invalidation)
@@ -0,0 +1,441 @@
+"""
+In-process columnar snapshot of the product catalog.
+
+With CATALOG_SNAPSHOT_ENABLED=true each worker keeps the numeric columns of
+every product in NumPy arrays (id, quantity, reserved quantity, price and
+a type code) with a dict from id to row. Top-k, filtered rankings,
+per-type aggregates and histograms then run as vectorized operations over
+the arrays in microseconds, instead of full-table scans in SQL or the
+browser.
+
+The snapshot follows writes through the invalidation bus: product events
+name the changed ids, and a background thread re-reads just those rows and
+patches the arrays in place (deleted rows are masked out and compacted
+away once they pile up). Events without ids, and a periodic resync, reload
+everything. Queries may briefly lag a commit, like the result cache.
+
+Memory is accounted per row and capped at CATALOG_SNAPSHOT_MAX_BYTES; a
+catalog that outgrows it drops the snapshot and queries answer 503 until
+it fits again. NumPy is only imported when the snapshot is enabled.
+"""
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import select
+
+from app.database import SessionLocal
+from app.invalidation import InvalidationEvent, invalidation_bus
+from app.models import Product
+
+logger = logging.getLogger(__name__)
+
+CATALOG_SNAPSHOT_ENABLED = os.getenv("CATALOG_SNAPSHOT_ENABLED", "false").lower() == "true"
+CATALOG_SNAPSHOT_MAX_BYTES = int(os.getenv("CATALOG_SNAPSHOT_MAX_BYTES", str(64 * 1024 * 1024)))
+CATALOG_SNAPSHOT_RESYNC_SECONDS = float(os.getenv("CATALOG_SNAPSHOT_RESYNC_SECONDS", "600"))
+
+# int64 id, quantity and reserved quantity, float64 price, int32 type code, bool live flag
+ARRAY_BYTES_PER_ROW = 8 + 8 + 8 + 8 + 4 + 1
+# Rough cost of one id -> row entry in the index dict
+INDEX_BYTES_PER_ROW = 100
+BATCH_SIZE = 5000
+SORT_COLUMNS = ("quantity", "available", "price", "value")
+
+
+class CatalogUnavailable(Exception):
+    pass
+
+
+def _numpy():
+    import numpy
+    return numpy
+
+
+class CatalogSnapshot:
+    def __init__(self, max_bytes: int = CATALOG_SNAPSHOT_MAX_BYTES,
+                 resync_seconds: float = CATALOG_SNAPSHOT_RESYNC_SECONDS):
+        self.max_bytes = max_bytes
+        self.resync_seconds = resync_seconds
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._dirty = set()
+        self._reload = True
+        self._clear()
+        self.unavailable_reason = "not loaded yet"
+        self.version = 0
+        self.refreshed_at = None
+        self.rebuilt_at = None
+        self.rows_refreshed = 0
+
+    def _clear(self):
+        self._size = 0  # rows used, live or not
+        self._dead = 0
+        self._index = {}  # product id -> row
+        self._types = []
+        self._type_codes = {}
+        self._columns = None
+
+    # Lifecycle
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="catalog-snapshot", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._wake.set()
+            self._thread.join()
+            self._thread = None
+
+    def on_invalidation(self, invalidation: InvalidationEvent):
+        if invalidation.entity == "*" or (invalidation.entity == "product" and not invalidation.ids):
+            self._reload = True
+        elif invalidation.entity == "product":
+            with self._lock:
+                self._dirty.update(invalidation.ids)
+        else:
+            return
+        self._wake.set()
+
+    def _run(self):
+        last_rebuild = 0.0
+        while not self._stop.is_set():
+            if time.monotonic() - last_rebuild >= self.resync_seconds:
+                self._reload = True
+            try:
+                if self._reload:
+                    self._reload = False
+                    self.rebuild()
+                    last_rebuild = time.monotonic()
+                else:
+                    self.refresh()
+            except Exception:
+                logger.exception("Catalog snapshot refresh failed")
+                self._reload = True
+                self._stop.wait(1)
+            self._wake.wait(max(0.0, self.resync_seconds - (time.monotonic() - last_rebuild)))
+            self._wake.clear()
+
+    # Loading
+
+    def _max_rows(self):
+        return self.max_bytes // (ARRAY_BYTES_PER_ROW + INDEX_BYTES_PER_ROW)
+
+    def _fits(self, rows):
+        return rows <= self._max_rows()
+
+    def _allocate(self, capacity):
+        np = _numpy()
+        return {
+            "id": np.zeros(capacity, dtype=np.int64),
+            "quantity": np.zeros(capacity, dtype=np.int64),
+            "reserved": np.zeros(capacity, dtype=np.int64),
+            "price": np.zeros(capacity, dtype=np.float64),
+            "type": np.zeros(capacity, dtype=np.int32),
+            "live": np.zeros(capacity, dtype=bool),
+        }
+
+    def _type_code(self, name):
+        code = self._type_codes.get(name)
+        if code is None:
+            code = self._type_codes[name] = len(self._types)
+            self._types.append(name)
+        return code
+
+    def _columns_query(self):
+        return select(Product.id, Product.quantity, Product.reserved_quantity, Product.price, Product.type)
+
+    def rebuild(self):
+        """
+        Load every product, in keyset-paginated batches, into fresh arrays
+        and swap them in.
+        """
+        # Events from here on are applied by the next refresh, on top of what's loaded
+        with self._lock:
+            self._dirty.clear()
+        db = SessionLocal()
+        try:
+            rows, last_id = [], 0
+            while True:
+                batch = db.execute(
+                    self._columns_query().where(Product.id > last_id).order_by(Product.id).limit(BATCH_SIZE)
+                ).all()
+                rows.extend(batch)
+                if len(batch) < BATCH_SIZE:
+                    break
+                last_id = batch[-1].id
+                if not self._fits(len(rows)):
+                    break
+        finally:
+            db.close()
+
+        with self._lock:
+            self._clear()
+            if not self._fits(len(rows)):
+                self.unavailable_reason = (
+                    f"catalog needs more than CATALOG_SNAPSHOT_MAX_BYTES ({self.max_bytes} bytes)"
+                )
+                return
+            headroom = min(max(1024, len(rows) + len(rows) // 4), self._max_rows())
+            self._columns = self._allocate(max(len(rows), headroom))
+            self._append(rows)
+            self.unavailable_reason = None
+            self.version += 1
+            self.rebuilt_at = self.refreshed_at = time.time()
+
+    def refresh(self):
+        """
+        Re-read the products named by events since the last refresh.
+        """
+        with self._lock:
+            ids, self._dirty = self._dirty, set()
+        if not ids or self._columns is None:
+            return
+        db = SessionLocal()
+        try:
+            rows = []
+            pending = list(ids)
+            for start in range(0, len(pending), BATCH_SIZE):
+                chunk = pending[start:start + BATCH_SIZE]
+                rows.extend(db.execute(self._columns_query().where(Product.id.in_(chunk))).all())
+        finally:
+            db.close()
+
+        with self._lock:
+            if self._columns is None:
+                return
+            found = set()
+            new_rows = []
+            for row in rows:
+                found.add(row.id)
+                index = self._index.get(row.id)
+                if index is None:
+                    new_rows.append(row)
+                else:
+                    self._set(index, row)
+            for product_id in ids - found:
+                index = self._index.pop(product_id, None)
+                if index is not None:
+                    self._columns["live"][index] = False
+                    self._dead += 1
+            if new_rows:
+                if not self._fits(len(self._index) + len(new_rows)):
+                    self._clear()
+                    self.unavailable_reason = (
+                        f"catalog needs more than CATALOG_SNAPSHOT_MAX_BYTES ({self.max_bytes} bytes)"
+                    )
+                    return
+                self._append(new_rows)
+            if self._dead > max(1024, self._size // 4):
+                self._compact()
+            self.rows_refreshed += len(ids)
+            self.version += 1
+            self.refreshed_at = time.time()
+
+    def _set(self, index, row):
+        columns = self._columns
+        columns["id"][index] = row.id
+        columns["quantity"][index] = row.quantity
+        columns["reserved"][index] = row.reserved_quantity or 0
+        columns["price"][index] = row.price
+        columns["type"][index] = self._type_code(row.type)
+        columns["live"][index] = True
+
+    def _append(self, rows):
+        needed = self._size + len(rows)
+        capacity = len(self._columns["id"])
+        if needed > capacity:
+            # Grow geometrically, but never past what the budget allows
+            grown = self._allocate(max(needed, min(capacity * 2, self._max_rows())))
+            for name, column in self._columns.items():
+                grown[name][:self._size] = column[:self._size]
+            self._columns = grown
+        for row in rows:
+            self._index[row.id] = self._size
+            self._set(self._size, row)
+            self._size += 1
+
+    def _compact(self):
+        live = self._columns["live"][:self._size].copy()
+        kept = int(live.sum())
+        for column in self._columns.values():
+            column[:kept] = column[:self._size][live]
+            column[kept:self._size] = 0
+        self._size = kept
+        self._dead = 0
+        self._index = {product_id: row for row, product_id in enumerate(self._columns["id"][:kept].tolist())}
+
+    # Queries
+
+    def _view(self):
+        if self._columns is None:
+            raise CatalogUnavailable(self.unavailable_reason)
+        return {name: column[:self._size] for name, column in self._columns.items()}
+
+    def _mask(self, columns, type: str = None, min_price: float = None, max_price: float = None,
+              min_quantity: int = None, max_quantity: int = None, max_available: int = None):
+        mask = columns["live"].copy()
+        if type is not None:
+            code = self._type_codes.get(type)
+            if code is None:
+                mask[:] = False
+            else:
+                mask &= columns["type"] == code
+        if min_price is not None:
+            mask &= columns["price"] >= min_price
+        if max_price is not None:
+            mask &= columns["price"] <= max_price
+        if min_quantity is not None:
+            mask &= columns["quantity"] >= min_quantity
+        if max_quantity is not None:
+            mask &= columns["quantity"] <= max_quantity
+        if max_available is not None:
+            mask &= columns["quantity"] - columns["reserved"] <= max_available
+        return mask
+
+    @staticmethod
+    def _values(columns, name, rows):
+        if name == "available":
+            return columns["quantity"][rows] - columns["reserved"][rows]
+        if name == "value":
+            return columns["quantity"][rows] * columns["price"][rows]
+        return columns[name][rows]
+
+    def rank(self, by: str = "value", descending: bool = True, offset: int = 0, limit: int = 10, **filters):
+        """
+        Products matching the filters ordered by `by` (quantity, available,
+        price or value = quantity * price), one page of them. Only the first
+        offset + limit are sorted (argpartition), so top-k is O(n).
+        """
+        if by not in SORT_COLUMNS:
+            raise ValueError(f"Can't sort by {by}; use one of {', '.join(SORT_COLUMNS)}")
+        np = _numpy()
+        with self._lock:
+            columns = self._view()
+            rows = np.flatnonzero(self._mask(columns, **filters))
+            keys = self._values(columns, by, rows)
+            if descending:
+                keys = -keys
+            wanted = min(offset + limit, len(rows))
+            if wanted < len(rows):
+                candidates = np.argpartition(keys, wanted - 1)[:wanted] if wanted else np.empty(0, dtype=np.int64)
+            else:
+                candidates = np.arange(len(rows))
+            page = rows[candidates[np.argsort(keys[candidates], kind="stable")]][offset:wanted]
+            quantity = columns["quantity"][page]
+            available = quantity - columns["reserved"][page]
+            price = columns["price"][page]
+            return {
+                "total": len(rows),
+                "items": [
+                    {
+                        "id": product_id, "type": self._types[code], "quantity": q, "available": a,
+                        "price": p, "value": round(q * p, 2),
+                    }
+                    for product_id, code, q, a, p in zip(
+                        columns["id"][page].tolist(), columns["type"][page].tolist(),
+                        quantity.tolist(), available.tolist(), price.tolist(),
+                    )
+                ],
+            }
+
+    def aggregate(self, low_stock_threshold: int = 10, **filters):
+        """
+        Totals and per-type distribution of the products matching the filters.
+        """
+        np = _numpy()
+        with self._lock:
+            columns = self._view()
+            mask = self._mask(columns, **filters)
+            codes = columns["type"][mask]
+            quantity = columns["quantity"][mask]
+            available = quantity - columns["reserved"][mask]
+            price = columns["price"][mask]
+            value = quantity * price
+            types = list(self._types)
+
+        groups = len(types)
+        count = np.bincount(codes, minlength=groups)
+        sums = {
+            "quantity": np.bincount(codes, weights=quantity, minlength=groups),
+            "available": np.bincount(codes, weights=available, minlength=groups),
+            "value": np.bincount(codes, weights=value, minlength=groups),
+            "price": np.bincount(codes, weights=price, minlength=groups),
+        }
+        low_stock = np.bincount(codes, weights=available < low_stock_threshold, minlength=groups)
+        min_price = np.full(groups, np.inf)
+        max_price = np.full(groups, -np.inf)
+        np.minimum.at(min_price, codes, price)
+        np.maximum.at(max_price, codes, price)
+
+        by_type = [
+            {
+                "type": types[code],
+                "products": int(count[code]),
+                "quantity": int(sums["quantity"][code]),
+                "available": int(sums["available"][code]),
+                "value": round(float(sums["value"][code]), 2),
+                "low_stock": int(low_stock[code]),
+                "avg_price": round(float(sums["price"][code] / count[code]), 2),
+                "min_price": float(min_price[code]),
+                "max_price": float(max_price[code]),
+            }
+            for code in np.flatnonzero(count)
+        ]
+        by_type.sort(key=lambda group: group["value"], reverse=True)
+        return {
+            "products": int(count.sum()),
+            "quantity": int(quantity.sum()),
+            "available": int(available.sum()),
+            "value": round(float(value.sum()), 2),
+            "low_stock": int((available < low_stock_threshold).sum()),
+            "by_type": by_type,
+        }
+
+    def histogram(self, column: str = "price", bins: int = 20, **filters):
+        """
+        Counts of matching products in `bins` equal-width buckets of `column`.
+        """
+        if column not in SORT_COLUMNS:
+            raise ValueError(f"No histogram for {column}; use one of {', '.join(SORT_COLUMNS)}")
+        np = _numpy()
+        with self._lock:
+            columns = self._view()
+            values = self._values(columns, column, np.flatnonzero(self._mask(columns, **filters)))
+        if len(values) == 0:
+            return {"column": column, "edges": [], "counts": []}
+        counts, edges = np.histogram(values, bins=bins)
+        return {"column": column, "edges": [round(edge, 4) for edge in edges.tolist()], "counts": counts.tolist()}
+
+    def memory_bytes(self):
+        capacity = len(self._columns["id"]) if self._columns is not None else 0
+        return capacity * ARRAY_BYTES_PER_ROW + len(self._index) * INDEX_BYTES_PER_ROW
+
+    def stats(self):
+        with self._lock:
+            return {
+                "available": self._columns is not None,
+                "unavailable_reason": self.unavailable_reason,
+                "products": len(self._index),
+                "dead_rows": self._dead,
+                "capacity": len(self._columns["id"]) if self._columns is not None else 0,
+                "types": len(self._types),
+                "memory_bytes": self.memory_bytes(),
+                "max_bytes": self.max_bytes,
+                "pending_ids": len(self._dirty),
+                "version": self.version,
+                "rows_refreshed": self.rows_refreshed,
+                "refreshed_at": self.refreshed_at,
+                "rebuilt_at": self.rebuilt_at,
+            }
+
+
+catalog_snapshot = CatalogSnapshot()
+if CATALOG_SNAPSHOT_ENABLED:
+    invalidation_bus.subscribe(catalog_snapshot.on_invalidation)
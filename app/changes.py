@@ -0,0 +1,109 @@
+"""
+Change sequence numbers for delta sync.
+
+Every transaction that changes products is stamped with the next number
+from the `product` counter in change_sequences: changed rows get it in
+Product.change_seq, deleted ones a ProductTombstone carrying it. Clients
+ask for everything after the last (change_seq, id) they saw, which the
+(change_seq, id) indexes serve as a range scan, so a sync costs the
+number of changes rather than the catalog size.
+
+Writes already publish a product invalidation event naming the rows they
+touch (app.invalidation), so stamping hooks into the commit instead of
+every write site. The counter row is updated last, just before the commit,
+and its row lock is held until the commit completes: transactions get
+their numbers in commit order, and a reader that has seen number N can't
+later find a newly committed row numbered below N.
+"""
+from sqlalchemy import delete, event, insert, literal, select, tuple_, update, union_all
+from sqlalchemy.orm import Session
+
+from app.models import ChangeSequence, Product, ProductTombstone
+
+PRODUCT_SEQUENCE = "product"
+
+
+def next_change_seq(db: Session, name: str = PRODUCT_SEQUENCE) -> int:
+    bumped = db.execute(
+        update(ChangeSequence).where(ChangeSequence.name == name).values(value=ChangeSequence.value + 1)
+    )
+    if bumped.rowcount == 0:
+        db.execute(insert(ChangeSequence).values(name=name, value=1))
+        return 1
+    return db.execute(select(ChangeSequence.value).where(ChangeSequence.name == name)).scalar_one()
+
+
+@event.listens_for(Session, "before_commit")
+def _stamp_product_changes(session):
+    events = [
+        invalidation for invalidation in session.info.get("pending_invalidations", ())
+        if invalidation.entity == "product" and invalidation.ids
+    ]
+    if not events:
+        return
+    # Take the row locks of our own writes before the counter's, never after
+    session.flush()
+
+    changed, deleted = set(), {}
+    for invalidation in events:
+        if invalidation.action == "delete":
+            deleted.update(zip(invalidation.ids, invalidation.keys or (None,) * len(invalidation.ids)))
+        else:
+            changed.update(invalidation.ids)
+    changed -= deleted.keys()
+
+    seq = next_change_seq(session)
+    if changed:
+        session.execute(
+            update(Product).where(Product.id.in_(changed)).values(change_seq=seq),
+            execution_options={"synchronize_session": False},
+        )
+    # A re-used id (SQLite can hand out the id of a deleted max row) replaces its tombstone
+    session.execute(delete(ProductTombstone).where(ProductTombstone.id.in_(changed | deleted.keys())))
+    if deleted:
+        session.execute(insert(ProductTombstone), [
+            {"id": product_id, "sku": sku, "change_seq": seq} for product_id, sku in deleted.items()
+        ])
+
+
+def parse_change_token(token: str):
+    """
+    "<change_seq>:<id>" -> (change_seq, id). Raises ValueError.
+    """
+    seq, _, last_id = token.partition(":")
+    return int(seq), int(last_id or 0)
+
+
+def get_product_changes(db: Session, since: str = None, limit: int = 500):
+    """
+    Products created or updated and ids deleted after the `since` token, in
+    (change_seq, id) order, plus the token to pass next time.
+    """
+    seq, last_id = parse_change_token(since) if since else (-1, 0)
+
+    def page(model, deleted):
+        # A row-value comparison is a range scan of the (change_seq, id)
+        # index, so each side reads at most `limit` rows past the watermark
+        page = (
+            select(model.id, model.change_seq, model.sku, literal(deleted).label("deleted"))
+            .where(tuple_(model.change_seq, model.id) > tuple_(seq, last_id))
+            .order_by(model.change_seq, model.id)
+            .limit(limit)
+            .subquery()
+        )
+        return select(page)
+
+    rows = db.execute(
+        union_all(page(Product, False), page(ProductTombstone, True)).order_by("change_seq", "id").limit(limit)
+    ).all()
+
+    live_ids = [row.id for row in rows if not row.deleted]
+    products = {p.id: p for p in db.query(Product).filter(Product.id.in_(live_ids))} if live_ids else {}
+    next_token = f"{rows[-1].change_seq}:{rows[-1].id}" if rows else f"{seq}:{last_id}"
+    return {
+        # A row deleted between the two queries shows up as a tombstone next time
+        "changes": [products[product_id] for product_id in live_ids if product_id in products],
+        "deleted": [{"id": row.id, "sku": row.sku} for row in rows if row.deleted],
+        "next": next_token,
+        "has_more": len(rows) == limit,
+    }
@@ -0,0 +1,180 @@
+"""
+Write coalescing for high-frequency quantity updates.
+
+Scanners can set the quantity of the same product many times a second.
+With QUANTITY_COALESCE_MS > 0, PUT /products/{id}/quantity hands the update
+to the coalescer instead of committing it. Updates arriving within one
+window are merged per product, last write wins, and the whole window is
+flushed in one transaction: a single executemany UPDATE with one row per
+product, then one commit. Each request waits until the flush that includes
+its update has committed and gets the product as it was written. Before
+start() and from stop() on, submit() returns None and the endpoint writes
+the update itself, so no request waits on a window that will never flush.
+
+Off by default: with coalescing, a request's own value may be superseded
+by a later one in the same window, which is what scanners want but not
+necessarily other clients.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Optional
+
+from sqlalchemy import update
+
+from app.audit import audit
+from app.database import SessionLocal
+from app.alerts import track_stock_change
+from app.rollups import track_inventory_change
+from app.forecasting import record_decrease
+from app.invalidation import publish, InvalidationEvent
+from app.models import Product
+from app.repository import product_not_found, below_reserved
+from app.schemas import Product as ProductSchema
+
+logger = logging.getLogger(__name__)
+
+QUANTITY_COALESCE_MS = float(os.getenv("QUANTITY_COALESCE_MS", "0"))
+
+
+class QuantityCoalescer:
+    def __init__(self, window_seconds: float = QUANTITY_COALESCE_MS / 1000):
+        self.window_seconds = window_seconds
+        self._pending = {}  # product_id -> [quantity, actor, futures]
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._accepting = False
+        self.updates = 0
+        self.flushes = 0
+        self.rows_written = 0
+
+    @property
+    def enabled(self):
+        return self.window_seconds > 0
+
+    def submit(self, product_id: int, quantity: int, actor: tuple = None) -> Optional[Future]:
+        """
+        Queue a quantity update. The returned future resolves to the written
+        Product once the flush commits, or raises its HTTPException. Returns
+        None when the flusher isn't running; the caller writes directly.
+        """
+        future = Future()
+        with self._lock:
+            if not self._accepting:
+                return None
+            entry = self._pending.get(product_id)
+            if entry is None:
+                self._pending[product_id] = [quantity, actor, [future]]
+            else:
+                entry[0], entry[1] = quantity, actor
+                entry[2].append(future)
+            self.updates += 1
+            self._wakeup.set()
+        return future
+
+    def start(self):
+        self._stop.clear()
+        with self._lock:
+            self._accepting = True
+        self._thread = threading.Thread(target=self._run, name="quantity-coalescer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """
+        Flush what's pending and stop the flusher thread.
+        """
+        # Refused before the flusher is told to stop, so its last batch holds everything
+        with self._lock:
+            self._accepting = False
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            # The first update of a window starts the clock
+            stopping = self._stop.wait(self.window_seconds)
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._wakeup.clear()
+            if batch:
+                self.flush(batch)
+            if stopping:
+                return
+
+    def flush(self, batch: dict):
+        try:
+            results = self._write(batch)
+        except Exception as e:
+            logger.exception("Flushing %s coalesced quantity updates failed", len(batch))
+            for _, _, futures in batch.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+        for product_id, (_, _, futures) in batch.items():
+            result = results.get(product_id) or product_not_found(product_id)
+            for future in futures:
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _write(self, batch: dict):
+        db = SessionLocal()
+        try:
+            current = {
+                row.id: row for row in
+                db.query(Product.id, Product.sku, Product.quantity, Product.reserved_quantity,
+                         Product.type, Product.price)
+                .filter(Product.id.in_(list(batch)))
+                # Locked in id order, so deltas come from the committed quantity
+                .order_by(Product.id)
+                .with_for_update()
+            }
+            # Updates that would leave reserved units uncovered are rejected
+            rejected = {
+                product_id: below_reserved(product_id, batch[product_id][0], row.reserved_quantity)
+                for product_id, row in current.items() if batch[product_id][0] < row.reserved_quantity
+            }
+            current = {product_id: row for product_id, row in current.items() if product_id not in rejected}
+            if current:
+                db.execute(update(Product), [
+                    {"id": product_id, "quantity": batch[product_id][0]} for product_id in current
+                ])
+                for product_id, row in current.items():
+                    quantity, actor, futures = batch[product_id]
+                    publish(db, InvalidationEvent("product", (product_id,), (row.sku,)))
+                    audit(db, "product.quantity", "product", product_id, actor=actor,
+                          sku=row.sku, old=row.quantity, new=quantity, coalesced=len(futures))
+                    record_decrease(db, product_id, row.quantity - quantity)
+                    track_stock_change(db, product_id, quantity - row.quantity)
+                    track_inventory_change(db, row.type, quantity - row.quantity, (quantity - row.quantity) * row.price)
+                db.commit()
+                self.rows_written += len(current)
+            self.flushes += 1
+            results = {
+                product.id: ProductSchema.model_validate(product)
+                for product in db.query(Product).filter(Product.id.in_(list(current)))
+            }
+            results.update(rejected)
+            return results
+        finally:
+            db.close()
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "window_ms": self.window_seconds * 1000,
+            "updates": self.updates,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+        }
+
+
+quantity_coalescer = QuantityCoalescer()
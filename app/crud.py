@@ -1,7 +1,19 @@
-from sqlalchemy.orm import Session
-from app.models import User, Product, UserRole
-from app.schemas import UserCreate, ProductCreate, ProductUpdate
-from app.auth import get_password_hash
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timedelta, timezone
+import json
+from typing import List
+from app.models import User, Product, UserRole, Location, ProductStock, StockReservation, ReservationStatus, Job, JobStatus, AuditLog
+from app.schemas import UserCreate, ProductCreate, ProductUpdate, LocationCreate, Product as ProductSchema
+from app.cache import result_cache, sku_cache
+from app.auth import get_password_hash, get_password_hashes, revoke_all_tokens
+from app.repository import ProductRepository, product_not_found, duplicate_sku, below_reserved
+from app.invalidation import publish, product_changed, user_changed, InvalidationEvent
+from app.audit import audit
+from app.forecasting import record_decrease
+from app.alerts import track_stock_change, track_threshold_change
+from app.rollups import track_inventory_change, track_product
+import app.changes  # noqa: F401  stamps change sequence numbers on product writes
 from fastapi import HTTPException, status
 
 # User CRUD operations
@@ -13,13 +25,76 @@ def create_user(db: Session, user: UserCreate):
     db_user = User(
         username=user.username, 
         hashed_password=hashed_password,
-        role=user.role.value if user.role else "user"
+        role=user.role or "user"
     )
     db.add(db_user)
+    db.flush()
+    publish(db, user_changed(db_user, "create"))
+    audit(db, "user.create", "user", db_user.id, username=db_user.username, role=db_user.role)
     db.commit()
     db.refresh(db_user)
     return db_user
 
+def bulk_create_users(db: Session, users: List[UserCreate]):
+    """
+    Create many users in one transaction. Rows whose username is taken,
+    repeated earlier in the batch or that are otherwise invalid are
+    reported and skipped; the rest are created together. Passwords are
+    hashed in parallel (get_password_hashes), and only for rows that will
+    actually be inserted.
+    """
+    roles = {role.value for role in UserRole}
+    results, accepted, seen = [], [], set()
+    for row, user in enumerate(users):
+        result = {"row": row, "username": user.username, "status": "created"}
+        role = user.role or "user"
+        if not user.username.strip() or not user.password:
+            result.update(status="invalid", detail="Username and password are required")
+        elif role not in roles:
+            result.update(status="invalid", detail=f"Unknown role '{role}'")
+        elif user.username in seen:
+            result.update(status="duplicate", detail="Username repeated earlier in the batch")
+        else:
+            seen.add(user.username)
+            accepted.append((result, user, role))
+        results.append(result)
+
+    hashes = get_password_hashes(user.password for _, user, _ in accepted)
+    # A concurrent registration can take a username after the conflict check;
+    # the unique index catches it and the check runs again against the winner.
+    for attempt in range(2):
+        usernames = [user.username for _, user, _ in accepted]
+        taken = {
+            username for (username,) in
+            db.query(User.username).filter(User.username.in_(usernames))
+        } if usernames else set()
+        rows = []
+        for (result, user, role), hashed_password in zip(accepted, hashes):
+            result.pop("id", None)
+            if user.username in taken:
+                result.update(status="conflict", detail="Username already registered")
+            else:
+                rows.append((result, User(username=user.username, hashed_password=hashed_password, role=role)))
+        try:
+            db.add_all([db_user for _, db_user in rows])
+            db.flush()
+            for result, db_user in rows:
+                result["id"] = db_user.id
+                publish(db, user_changed(db_user, "create"))
+                audit(db, "user.create", "user", db_user.id, username=db_user.username, role=db_user.role, bulk=True)
+            db.commit()
+            break
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail="Usernames changed during the import, retry it"
+                )
+
+    created = sum(result["status"] == "created" for result in results)
+    return {"created": created, "failed": len(results) - created, "results": results}
+
 def get_all_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(User).offset(skip).limit(limit).all()
 
@@ -30,7 +105,11 @@ def update_user_role(db: Session, user_id: int, new_role: UserRole):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with ID {user_id} not found"
         )
+    audit(db, "user.role", "user", user.id, username=user.username, old=user.role, new=new_role.value)
     user.role = new_role.value
+    # Tokens carry the role; make the user log in again to pick up the new one
+    revoke_all_tokens(db, user.username, reason="role change")
+    publish(db, user_changed(user))
     db.commit()
     db.refresh(user)
     return user
@@ -42,6 +121,9 @@ def delete_user(db: Session, user_id: int):
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"User with ID {user_id} not found"
         )
+    revoke_all_tokens(db, user.username, reason="user deleted")
+    audit(db, "user.delete", "user", user.id, username=user.username)
+    publish(db, user_changed(user, "delete"))
     db.delete(user)
     db.commit()
     return {"message": "User deleted successfully"}
@@ -53,33 +135,485 @@ def get_products(db: Session, skip: int = 0, limit: int = 100):
 def get_product_by_id(db: Session, product_id: int):
     return db.query(Product).filter(Product.id == product_id).first()
 
+def lock_product(db: Session, product_id: int):
+    """
+    Read a product with its row locked until commit, for writes that derive
+    a delta from its current quantity.
+    """
+    return db.query(Product).filter(Product.id == product_id).with_for_update().populate_existing().first()
+
 def get_product_by_sku(db: Session, sku: str):
     return db.query(Product).filter(Product.sku == sku).first()
 
+# Cached product reads. Results are returned as Product schemas (not
+# session-bound ORM objects) so they can be shared between requests.
+def _cache_product_lookup(key, db_product, tags, token, cache=result_cache):
+    product = ProductSchema.model_validate(db_product) if db_product else None
+    if db_product:
+        tags.append(f"product:{db_product.id}")
+    size = len(product.model_dump_json()) if product else 64
+    # Misses are cached too (as (None,)) until a product with the key is created
+    cache.put(key, (product,), tags, size, token)
+    return product
+
+def get_products_cached(db: Session, skip: int = 0, limit: int = 100):
+    """
+    A page of products from the result cache. The page is invalidated when
+    one of its products changes or when a product is created or deleted.
+    """
+    key = ("products", skip, limit)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached
+    token = result_cache.begin()
+    products = [ProductSchema.model_validate(p) for p in get_products(db, skip=skip, limit=limit)]
+    tags = ["product", "product-list"] + [f"product:{p.id}" for p in products]
+    result_cache.put(key, products, tags, sum(len(p.model_dump_json()) for p in products) + 64, token)
+    return products
+
+def get_product_by_id_cached(db: Session, product_id: int):
+    key = ("product-id", product_id)
+    cached = result_cache.get(key)
+    if cached is not None:
+        return cached[0]
+    token = result_cache.begin()
+    return _cache_product_lookup(key, get_product_by_id(db, product_id), ["product", f"product:{product_id}"], token)
+
+def get_product_by_sku_cached(db: Session, sku: str):
+    key = ("product-sku", sku)
+    cached = sku_cache.get(key)
+    if cached is not None:
+        return cached[0]
+    token = sku_cache.begin()
+    return _cache_product_lookup(key, get_product_by_sku(db, sku), ["product", f"product-key:{sku}"], token, sku_cache)
+
+def get_products_by_skus_cached(db: Session, skus: List[str]):
+    """
+    Look up many SKUs at once: cached ones from the SKU cache, the rest with
+    a single IN query. Returns {sku: Product or None} in request order.
+    """
+    results = {}
+    missing = []
+    for sku in dict.fromkeys(skus):
+        cached = sku_cache.get(("product-sku", sku))
+        if cached is not None:
+            results[sku] = cached[0]
+        else:
+            results[sku] = None
+            missing.append(sku)
+    if missing:
+        token = sku_cache.begin()
+        found = {p.sku: p for p in db.query(Product).filter(Product.sku.in_(missing))}
+        for sku in missing:
+            results[sku] = _cache_product_lookup(
+                ("product-sku", sku), found.get(sku), ["product", f"product-key:{sku}"], token, sku_cache
+            )
+    return results
+
 def create_product(db: Session, product: ProductCreate):
     # Check if SKU already exists
     existing_product = get_product_by_sku(db, product.sku)
     if existing_product:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Product with SKU {product.sku} already exists"
-        )
+        raise duplicate_sku(product.sku)
     
     db_product = Product(**product.dict())
     db.add(db_product)
+    db.flush()
+    publish(db, product_changed(db_product, "create"))
+    audit(db, "product.create", "product", db_product.id, sku=db_product.sku, quantity=db_product.quantity)
+    track_product(db, db_product)
     db.commit()
     db.refresh(db_product)
     return db_product
 
 def update_product_quantity(db: Session, product_id: int, quantity: int):
+    # Locked so concurrent updates each see the quantity the other left
+    db_product = lock_product(db, product_id)
+    if not db_product:
+        raise product_not_found(product_id)
+    # Reserved units must stay covered, or available stock would go negative
+    if quantity < db_product.reserved_quantity:
+        raise below_reserved(product_id, quantity, db_product.reserved_quantity)
+    
+    audit(db, "product.quantity", "product", product_id, sku=db_product.sku, old=db_product.quantity, new=quantity)
+    record_decrease(db, product_id, db_product.quantity - quantity)
+    track_stock_change(db, product_id, quantity - db_product.quantity)
+    delta = quantity - db_product.quantity
+    track_inventory_change(db, db_product.type, delta, delta * db_product.price)
+    db_product.quantity = quantity
+    publish(db, product_changed(db_product))
+    db.commit()
+    db.refresh(db_product)
+    return db_product
+
+def set_reorder_threshold(db: Session, product_id: int, reorder_threshold: int = None):
+    db_product = get_product_by_id(db, product_id)
+    if not db_product:
+        raise product_not_found(product_id)
+    audit(db, "product.reorder_threshold", "product", product_id, sku=db_product.sku,
+          old=db_product.reorder_threshold, new=reorder_threshold)
+    track_threshold_change(db, product_id, db_product.reorder_threshold)
+    db_product.reorder_threshold = reorder_threshold
+    publish(db, product_changed(db_product))
+    db.commit()
+    db.refresh(db_product)
+    return db_product
+
+def set_product_image(db: Session, product_id: int, image_url: str, thumbnail_url: str):
+    db_product = get_product_by_id(db, product_id)
+    if not db_product:
+        raise product_not_found(product_id)
+    db_product.image_url = image_url
+    db_product.thumbnail_url = thumbnail_url
+    publish(db, product_changed(db_product))
+    audit(db, "product.image", "product", product_id, image_url=image_url)
+    db.commit()
+    db.refresh(db_product)
+    return db_product
+
+def delete_product(db: Session, product_id: int):
     db_product = get_product_by_id(db, product_id)
     if not db_product:
+        raise product_not_found(product_id)
+    publish(db, product_changed(db_product, "delete"))
+    audit(db, "product.delete", "product", product_id, sku=db_product.sku)
+    track_product(db, db_product, -1)
+    db.delete(db_product)
+    db.commit()
+    return {"message": "Product deleted successfully"}
+
+# Location CRUD operations
+def get_locations(db: Session, skip: int = 0, limit: int = 100):
+    return db.query(Location).order_by(Location.id).offset(skip).limit(limit).all()
+
+def get_location_by_id(db: Session, location_id: int):
+    return db.query(Location).filter(Location.id == location_id).first()
+
+def create_location(db: Session, location: LocationCreate):
+    if db.query(Location).filter(Location.name == location.name).first():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Location {location.name} already exists"
+        )
+    db_location = Location(**location.dict())
+    db.add(db_location)
+    db.flush()
+    audit(db, "location.create", "location", db_location.id, name=db_location.name)
+    db.commit()
+    db.refresh(db_location)
+    return db_location
+
+def get_product_stock(db: Session, product_id: int):
+    if not get_product_by_id(db, product_id):
+        raise product_not_found(product_id)
+    return (
+        db.query(ProductStock)
+        .filter(ProductStock.product_id == product_id)
+        .order_by(ProductStock.location_id)
+        .all()
+    )
+
+def update_location_quantity(db: Session, product_id: int, location_id: int, quantity: int):
+    """
+    Set the quantity of a product at one location and apply the difference to
+    Product.quantity in the same transaction, so reads of the aggregate never
+    need to SUM over locations.
+    """
+    for attempt in range(2):
+        try:
+            return _set_location_quantity(db, product_id, location_id, quantity)
+        except IntegrityError:
+            # A concurrent first write inserted the stock row; the retry locks it
+            db.rollback()
+            if attempt:
+                raise
+
+def _set_location_quantity(db: Session, product_id: int, location_id: int, quantity: int):
+    db_product = lock_product(db, product_id)
+    if not db_product:
+        raise product_not_found(product_id)
+    if not get_location_by_id(db, location_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail=f"Product with ID {product_id} not found"
+            detail=f"Location with ID {location_id} not found"
         )
-    
-    db_product.quantity = quantity
+
+    stock = (
+        db.query(ProductStock)
+        .filter(ProductStock.product_id == product_id, ProductStock.location_id == location_id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+    if not stock:
+        stock = ProductStock(product_id=product_id, location_id=location_id, quantity=0)
+        db.add(stock)
+
+    delta = quantity - stock.quantity
+    if db_product.quantity + delta < db_product.reserved_quantity:
+        raise below_reserved(product_id, db_product.quantity + delta, db_product.reserved_quantity)
+    audit(db, "product.location_quantity", "product", product_id, location_id=location_id,
+          old=stock.quantity, new=quantity)
+    record_decrease(db, product_id, -delta)
+    track_stock_change(db, product_id, delta)
+    track_inventory_change(db, db_product.type, delta, delta * db_product.price)
+    stock.quantity = quantity
+    # Relative UPDATE so concurrent writes at other locations aren't lost
+    db_product.quantity = Product.quantity + delta
+    publish(db, product_changed(db_product))
     db.commit()
-    db.refresh(db_product)
-    return db_product 
\ No newline at end of file
+    db.refresh(stock)
+    return stock
+
+def get_low_stock_at_location(db: Session, location_id: int, threshold: int = 10, skip: int = 0, limit: int = 100):
+    if not get_location_by_id(db, location_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Location with ID {location_id} not found"
+        )
+    return (
+        db.query(ProductStock)
+        .options(joinedload(ProductStock.product))
+        .filter(ProductStock.location_id == location_id, ProductStock.quantity < threshold)
+        .order_by(ProductStock.quantity, ProductStock.product_id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+# Reservation operations
+def get_product_availability(db: Session, product_id: int):
+    db_product = get_product_by_id(db, product_id)
+    if not db_product:
+        raise product_not_found(product_id)
+    return {
+        "product_id": db_product.id,
+        "quantity": db_product.quantity,
+        "reserved_quantity": db_product.reserved_quantity,
+        "available": db_product.quantity - db_product.reserved_quantity,
+    }
+
+def create_reservation(db: Session, product_id: int, quantity: int, ttl_seconds: int, user_id: int = None):
+    """
+    Hold `quantity` units of a product for `ttl_seconds`.
+
+    The availability check and the increment of reserved_quantity are a single
+    conditional UPDATE, so concurrent holds on the same product serialize on
+    its row and can never oversell.
+    """
+    held = (
+        db.query(Product)
+        .filter(Product.id == product_id, Product.quantity - Product.reserved_quantity >= quantity)
+        .update({Product.reserved_quantity: Product.reserved_quantity + quantity}, synchronize_session=False)
+    )
+    if not held:
+        db.rollback()
+        if not get_product_by_id(db, product_id):
+            raise product_not_found(product_id)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Not enough stock available to reserve {quantity} of product {product_id}"
+        )
+
+    reservation = StockReservation(
+        product_id=product_id,
+        user_id=user_id,
+        quantity=quantity,
+        status=ReservationStatus.ACTIVE.value,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds),
+    )
+    db.add(reservation)
+    db.flush()
+    publish(db, InvalidationEvent("product", (product_id,)))
+    audit(db, "reservation.create", "reservation", reservation.id, product_id=product_id, quantity=quantity)
+    db.commit()
+    db.refresh(reservation)
+    return reservation
+
+def get_reservation(db: Session, reservation_id: int):
+    reservation = db.query(StockReservation).filter(StockReservation.id == reservation_id).first()
+    if not reservation:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Reservation with ID {reservation_id} not found"
+        )
+    return reservation
+
+def _close_reservation(db: Session, reservation: StockReservation, new_status: ReservationStatus, now=None):
+    """
+    Move an active reservation to `new_status` and give back its hold. Returns
+    False if another request or the expiry task already closed it.
+    """
+    query = db.query(StockReservation).filter(
+        StockReservation.id == reservation.id,
+        StockReservation.status == ReservationStatus.ACTIVE.value,
+    )
+    if now is not None:
+        query = query.filter(StockReservation.expires_at > now)
+    if not query.update({StockReservation.status: new_status.value}, synchronize_session=False):
+        return False
+
+    changes = {Product.reserved_quantity: Product.reserved_quantity - reservation.quantity}
+    if new_status == ReservationStatus.CONFIRMED:
+        # Confirming turns the hold into a permanent decrement
+        changes[Product.quantity] = Product.quantity - reservation.quantity
+    db.query(Product).filter(Product.id == reservation.product_id).update(changes, synchronize_session=False)
+    if new_status == ReservationStatus.CONFIRMED:
+        # After the UPDATE, which holds the product's row lock
+        record_decrease(db, reservation.product_id, reservation.quantity)
+        track_stock_change(db, reservation.product_id, -reservation.quantity)
+        product_type, price = db.query(Product.type, Product.price).filter(Product.id == reservation.product_id).one()
+        track_inventory_change(db, product_type, -reservation.quantity, -reservation.quantity * price)
+    publish(db, InvalidationEvent("product", (reservation.product_id,)))
+    return True
+
+def _finish_reservation(db: Session, reservation_id: int, new_status: ReservationStatus):
+    reservation = get_reservation(db, reservation_id)
+    # Only a confirm has to beat the deadline; releasing a due hold early is harmless
+    now = datetime.now(timezone.utc) if new_status == ReservationStatus.CONFIRMED else None
+    if not _close_reservation(db, reservation, new_status, now=now):
+        db.rollback()
+        db.refresh(reservation)
+        current = reservation.status
+        if current == ReservationStatus.ACTIVE.value:
+            current = ReservationStatus.EXPIRED.value
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Reservation {reservation_id} is already {current}"
+        )
+    audit(db, f"reservation.{new_status.value}", "reservation", reservation_id,
+          product_id=reservation.product_id, quantity=reservation.quantity)
+    db.commit()
+    db.refresh(reservation)
+    return reservation
+
+def confirm_reservation(db: Session, reservation_id: int):
+    return _finish_reservation(db, reservation_id, ReservationStatus.CONFIRMED)
+
+def release_reservation(db: Session, reservation_id: int):
+    return _finish_reservation(db, reservation_id, ReservationStatus.RELEASED)
+
+def get_next_reservation_expiry(db: Session):
+    row = (
+        db.query(StockReservation.expires_at)
+        .filter(StockReservation.status == ReservationStatus.ACTIVE.value)
+        .order_by(StockReservation.expires_at)
+        .first()
+    )
+    return row[0] if row else None
+
+def expire_reservations(db: Session, batch_size: int = 500):
+    """
+    Expire active reservations whose deadline has passed. Uses the
+    (status, expires_at) index, so the cost is proportional to the number of
+    due holds rather than the size of the table.
+    """
+    now = datetime.now(timezone.utc)
+    due = (
+        db.query(StockReservation)
+        .filter(
+            StockReservation.status == ReservationStatus.ACTIVE.value,
+            StockReservation.expires_at <= now,
+        )
+        .order_by(StockReservation.expires_at)
+        .limit(batch_size)
+        .all()
+    )
+    expired = sum(_close_reservation(db, reservation, ReservationStatus.EXPIRED) for reservation in due)
+    db.commit()
+    return expired
+
+# Job operations
+def create_job(db: Session, job_type: str, params: dict, user_id: int = None):
+    db_job = Job(type=job_type, params=json.dumps(params), status=JobStatus.QUEUED.value, created_by=user_id)
+    db.add(db_job)
+    db.flush()
+    audit(db, "job.create", "job", db_job.id, type=job_type)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+def get_job(db: Session, job_id: int):
+    db_job = db.query(Job).filter(Job.id == job_id).first()
+    if not db_job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job with ID {job_id} not found"
+        )
+    return db_job
+
+def cancel_job(db: Session, job_id: int):
+    """
+    Cancel a queued job right away; ask a running job to stop at its next
+    progress report.
+    """
+    db_job = get_job(db, job_id)
+    now = datetime.now(timezone.utc)
+    cancelled = db.query(Job).filter(Job.id == job_id, Job.status == JobStatus.QUEUED.value).update(
+        {Job.status: JobStatus.CANCELLED.value, Job.cancel_requested: True, Job.finished_at: now},
+        synchronize_session=False
+    )
+    if not cancelled:
+        db.query(Job).filter(Job.id == job_id, Job.status == JobStatus.RUNNING.value).update(
+            {Job.cancel_requested: True}, synchronize_session=False
+        )
+    audit(db, "job.cancel", "job", job_id)
+    db.commit()
+    db.refresh(db_job)
+    return db_job
+
+# Audit log queries
+def get_audit_entries(db: Session, actor: str = None, action: str = None, entity: str = None,
+                      entity_id: int = None, since: datetime = None, until: datetime = None,
+                      before_id: int = None, limit: int = 100):
+    """
+    Newest entries first, keyset-paginated: pass the last id of a page as
+    `before_id` to get the next one.
+    """
+    query = db.query(AuditLog)
+    if actor is not None:
+        query = query.filter(AuditLog.actor == actor)
+    if action is not None:
+        query = query.filter(AuditLog.action == action)
+    if entity is not None:
+        query = query.filter(AuditLog.entity == entity)
+    if entity_id is not None:
+        query = query.filter(AuditLog.entity_id == entity_id)
+    if since is not None:
+        query = query.filter(AuditLog.created_at >= since)
+    if until is not None:
+        query = query.filter(AuditLog.created_at < until)
+    if before_id is not None:
+        query = query.filter(AuditLog.id < before_id)
+    entries = query.order_by(AuditLog.id.desc()).limit(limit).all()
+    return {
+        "items": entries,
+        "next_before_id": entries[-1].id if len(entries) == limit else None,
+    }
+
+class SQLProductRepository(ProductRepository):
+    """
+    ProductRepository backed by a SQLAlchemy session.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def get_products(self, skip: int = 0, limit: int = 100):
+        return get_products(self.db, skip=skip, limit=limit)
+
+    def get_product_by_id(self, product_id: int):
+        return get_product_by_id(self.db, product_id)
+
+    def get_product_by_sku(self, sku: str):
+        return get_product_by_sku(self.db, sku)
+
+    def create_product(self, product: dict):
+        return create_product(self.db, ProductCreate(**product))
+
+    def update_product_quantity(self, product_id: int, quantity: int):
+        return update_product_quantity(self.db, product_id, quantity)
+
+    def delete_product(self, product_id: int):
+        return delete_product(self.db, product_id)
+ 
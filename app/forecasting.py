@@ -0,0 +1,309 @@
+"""
+Demand forecasting and reorder points.
+
+Every decrease of Product.quantity (a lower count, a confirmed reservation,
+stock taken out at a location, an import) is added next to the write to the
+product's StockDecrease row for the day. That is the product's demand
+history; `run_forecast` deletes rows older than the window as it goes.
+
+`run_forecast` turns the history into reorder suggestions for the whole
+catalog. Products are processed in id-ordered batches of
+FORECAST_BATCH_SIZE: one GROUP BY query per batch sums the last
+FORECAST_HISTORY_DAYS complete days per product into a (products x days)
+NumPy matrix, and the forecast is a few vectorized operations over it:
+
+- daily demand: exponentially weighted (FORECAST_METHOD=ewma, most recent
+  day weighted FORECAST_SMOOTHING) or simple moving average over the days
+  the product has existed within the window
+- safety stock: z * demand std * sqrt(lead time), z from
+  FORECAST_SERVICE_LEVEL
+- reorder point: daily demand * FORECAST_LEAD_TIME_DAYS + safety stock
+- suggested order: enough to cover the reorder point plus
+  FORECAST_REVIEW_DAYS of demand, for products whose available stock
+  (quantity - reserved) is at or below the reorder point
+
+Results for products with demand in the window replace the batch's rows in
+reorder_suggestions, one transaction per batch. Run it as the
+`forecast_reorder_points` job or `python -m app.forecasting`, e.g. nightly.
+NumPy is only imported when a forecast runs.
+"""
+import logging
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Product, ReorderSuggestion, StockDecrease
+
+logger = logging.getLogger(__name__)
+
+FORECAST_HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "90"))
+FORECAST_METHOD = os.getenv("FORECAST_METHOD", "ewma").lower()
+FORECAST_SMOOTHING = float(os.getenv("FORECAST_SMOOTHING", "0.1"))
+FORECAST_LEAD_TIME_DAYS = float(os.getenv("FORECAST_LEAD_TIME_DAYS", "7"))
+FORECAST_REVIEW_DAYS = float(os.getenv("FORECAST_REVIEW_DAYS", "14"))
+FORECAST_SERVICE_LEVEL = float(os.getenv("FORECAST_SERVICE_LEVEL", "0.95"))
+FORECAST_BATCH_SIZE = int(os.getenv("FORECAST_BATCH_SIZE", "50000"))
+
+FORECAST_METHODS = ("ewma", "sma")
+SECONDS_PER_DAY = 86400
+
+
+def _numpy():
+    import numpy
+    return numpy
+
+
+def epoch_day(moment: datetime = None) -> int:
+    moment = moment or datetime.now(timezone.utc)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp() // SECONDS_PER_DAY)
+
+
+def record_decrease(db: Session, product_id: int, units: int):
+    """
+    Add `units` taken out of a product's stock to today's row, in the
+    caller's transaction. Zero or negative changes are not demand and are
+    ignored. Callers hold the product's row lock (or have updated it), so
+    the first decrease of a day can't be inserted twice.
+    """
+    if units <= 0:
+        return
+    day = epoch_day()
+    updated = db.query(StockDecrease).filter(
+        StockDecrease.product_id == product_id, StockDecrease.day == day
+    ).update({StockDecrease.quantity: StockDecrease.quantity + units}, synchronize_session=False)
+    if not updated:
+        db.add(StockDecrease(product_id=product_id, day=day, quantity=units))
+
+
+def forecast(history, age_days, available, method: str = FORECAST_METHOD, smoothing: float = FORECAST_SMOOTHING,
+             lead_time_days: float = FORECAST_LEAD_TIME_DAYS, review_days: float = FORECAST_REVIEW_DAYS,
+             service_level: float = FORECAST_SERVICE_LEVEL):
+    """
+    Vectorized forecast for a batch of products.
+
+    `history` is a (products x days) array of units sold per day, oldest day
+    first; `age_days` how many of the most recent days each product existed
+    (1..days); `available` its current available stock. Returns arrays of
+    daily demand, demand std, safety stock, reorder point and suggested
+    order quantity.
+    """
+    np = _numpy()
+    if method not in FORECAST_METHODS:
+        raise ValueError(f"Unknown forecast method {method}; use one of {', '.join(FORECAST_METHODS)}")
+    days = history.shape[1]
+    age = np.clip(age_days, 1, days)
+
+    if method == "ewma":
+        # Weight of day j (0 = oldest) is a * (1 - a) ** (days - 1 - j). Days
+        # before a product existed are zeros in the matrix, so dividing by
+        # the weight of only its days normalizes young products correctly
+        weights = smoothing * (1 - smoothing) ** np.arange(days - 1, -1, -1)
+    else:
+        weights = np.ones(days)
+    norm = np.cumsum(weights[::-1])[age - 1]
+    mean = history @ weights / norm
+    variance = (history * history) @ weights / norm - mean * mean
+    std = np.sqrt(np.maximum(variance, 0))
+
+    from statistics import NormalDist
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = z * std * math.sqrt(lead_time_days)
+    reorder_point = mean * lead_time_days + safety_stock
+    needs_reorder = (mean > 0) & (available <= reorder_point)
+    suggested = np.where(
+        needs_reorder, np.ceil(np.maximum(reorder_point + mean * review_days - available, 0)), 0
+    ).astype(np.int64)
+    return mean, std, safety_stock, reorder_point, suggested
+
+
+def _columns(db: Session, statement, count):
+    """
+    Columns of a query's result as int64 arrays. Fetches plain tuples from
+    the DBAPI cursor of the session's connection: building a Row per result
+    row costs more than the whole forecast at this size. Parameters are
+    all integers, so they are rendered inline.
+    """
+    np = _numpy()
+    connection = db.connection()
+    sql = str(statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True}))
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(sql)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+    return list(np.array(rows, dtype=np.int64).reshape(len(rows), count).T)
+
+
+def _forecast_batch(db: Session, last_id: int, batch_size: int, first_day: int, today: int, options: dict):
+    """
+    Forecast the next `batch_size` products after `last_id`. Returns their
+    ids and the forecast arrays for them.
+    """
+    np = _numpy()
+    ids, available = _columns(db, (
+        select(Product.id, Product.quantity - Product.reserved_quantity)
+        .where(Product.id > last_id)
+        .order_by(Product.id)
+        .limit(batch_size)
+    ), 2)
+    if not len(ids):
+        return ids, None
+    lower, upper = int(ids[0]), int(ids[-1])
+
+    # Only products created within the window have fewer days of history
+    age_days = np.full(len(ids), today - first_day)
+    young = db.execute(
+        select(Product.id, Product.created_at)
+        .where(Product.id.between(lower, upper), Product.created_at >= datetime.fromtimestamp(
+            first_day * SECONDS_PER_DAY, timezone.utc))
+    ).all()
+    if young:
+        rows = np.searchsorted(ids, [product_id for product_id, _ in young])
+        age_days[rows] = [today - epoch_day(created_at) for _, created_at in young]
+
+    product_ids, days, units = _columns(db, (
+        select(StockDecrease.product_id, StockDecrease.day, func.sum(StockDecrease.quantity))
+        .where(
+            StockDecrease.product_id.between(lower, upper),
+            StockDecrease.day >= first_day,
+            StockDecrease.day < today,
+        )
+        .group_by(StockDecrease.product_id, StockDecrease.day)
+    ), 3)
+    history = np.zeros((len(ids), today - first_day))
+    rows = np.searchsorted(ids, product_ids)
+    # Sales of products deleted since the batch was read match no id
+    found = ids[np.minimum(rows, len(ids) - 1)] == product_ids
+    history[rows[found], days[found] - first_day] = units[found]
+    return ids, forecast(history, age_days, available, **options) + (available,)
+
+
+def run_forecast(batch_size: int = FORECAST_BATCH_SIZE, history_days: int = FORECAST_HISTORY_DAYS,
+                 progress=None, **options):
+    """
+    Recompute reorder_suggestions for every product. `options` override the
+    FORECAST_* settings passed to `forecast`. `progress(done, total)` is
+    called after each batch. Returns counts and timings.
+    """
+    np = _numpy()
+    start = time.perf_counter()
+    today = epoch_day()
+    first_day = today - history_days
+    keep_from = min(first_day, today - FORECAST_HISTORY_DAYS)
+    computed_at = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        total = db.query(func.count(Product.id)).scalar()
+    finally:
+        db.close()
+
+    products_seen = suggestions = reorders = 0
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            ids, result = _forecast_batch(db, last_id, batch_size, first_day, today, options)
+            rows = []
+            if result is not None:
+                mean, std, safety_stock, reorder_point, suggested, available = result
+                selected = np.flatnonzero(mean > 0)
+                rows = [
+                    {
+                        "product_id": product_id, "daily_demand": round(d, 4), "demand_std": round(sd, 4),
+                        "safety_stock": round(ss, 2), "reorder_point": round(rop, 2), "available": a,
+                        "suggested_quantity": q, "needs_reorder": q > 0, "computed_at": computed_at,
+                    }
+                    for product_id, d, sd, ss, rop, a, q in zip(
+                        ids[selected].tolist(), mean[selected].tolist(), std[selected].tolist(),
+                        safety_stock[selected].tolist(), reorder_point[selected].tolist(),
+                        available[selected].tolist(), suggested[selected].tolist(),
+                    )
+                ]
+            # Replaces the batch's id range, which also clears suggestions
+            # of products deleted since the last run
+            table = ReorderSuggestion.__table__
+            clear = delete(table).where(table.c.product_id > last_id)
+            history = delete(StockDecrease).where(StockDecrease.product_id > last_id, StockDecrease.day < keep_from)
+            if len(ids):
+                clear = clear.where(table.c.product_id <= int(ids[-1]))
+                history = history.where(StockDecrease.product_id <= int(ids[-1]))
+            db.execute(clear)
+            # History no forecast will read again
+            db.execute(history)
+            if rows:
+                db.execute(table.insert(), rows)
+            db.commit()
+        finally:
+            db.close()
+        if not len(ids):
+            break
+        last_id = int(ids[-1])
+        products_seen += len(ids)
+        suggestions += len(rows)
+        reorders += int((suggested > 0).sum())
+        if progress is not None:
+            progress(products_seen, total)
+
+    elapsed = time.perf_counter() - start
+    logger.info("Forecast for %s products: %s with demand, %s to reorder, %.2fs",
+                products_seen, suggestions, reorders, elapsed)
+    return {
+        "products": products_seen,
+        "with_demand": suggestions,
+        "needs_reorder": reorders,
+        "history_days": history_days,
+        "seconds": round(elapsed, 3),
+    }
+
+
+def get_reorder_suggestions(db: Session, include_all: bool = False, skip: int = 0, limit: int = 100):
+    """
+    Stored suggestions joined with their products, most urgent first: by
+    days of cover (available stock / daily demand), shortest first.
+    """
+    query = (
+        db.query(ReorderSuggestion, Product.sku, Product.name, Product.type)
+        .join(Product, Product.id == ReorderSuggestion.product_id)
+    )
+    if not include_all:
+        query = query.filter(ReorderSuggestion.needs_reorder.is_(True))
+    days_of_cover = ReorderSuggestion.available / ReorderSuggestion.daily_demand
+    rows = query.order_by(days_of_cover, ReorderSuggestion.product_id).offset(skip).limit(limit).all()
+    return [
+        {
+            "product_id": suggestion.product_id,
+            "sku": sku,
+            "name": name,
+            "type": product_type,
+            "available": suggestion.available,
+            "daily_demand": suggestion.daily_demand,
+            "demand_std": suggestion.demand_std,
+            "safety_stock": suggestion.safety_stock,
+            "reorder_point": suggestion.reorder_point,
+            "suggested_quantity": suggestion.suggested_quantity,
+            "days_of_cover": round(suggestion.available / suggestion.daily_demand, 1),
+            "needs_reorder": suggestion.needs_reorder,
+            "computed_at": suggestion.computed_at,
+        }
+        for suggestion, sku, name, product_type in rows
+    ]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Recompute reorder suggestions for the whole catalog")
+    parser.add_argument("--method", choices=FORECAST_METHODS, default=FORECAST_METHOD)
+    parser.add_argument("--batch-size", type=int, default=FORECAST_BATCH_SIZE)
+    parser.add_argument("--history-days", type=int, default=FORECAST_HISTORY_DAYS)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    print(run_forecast(batch_size=args.batch_size, history_days=args.history_days, method=args.method))
@@ -1,14 +1,12 @@
 import os
-import requests
-from google.oauth2 import id_token
-from google.auth.transport import requests as google_requests
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
-from datetime import timedelta
 from app.models import User, UserRole
-from app.auth import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.auth import issue_tokens
 from app.crud import get_user_by_username, create_user
 from app.schemas import UserCreate
+from app.invalidation import publish, user_changed
+from app.tracing import start_span
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -19,13 +17,18 @@ async def verify_google_token(token: str) -> dict:
     """
     Verify Google ID token and return user info
     """
+    # google-auth is heavy to import; only load it once a Google login happens
+    from google.oauth2 import id_token
+    from google.auth.transport import requests as google_requests
+
     try:
         # Verify the token
-        idinfo = id_token.verify_oauth2_token(
-            token, 
-            google_requests.Request(), 
-            GOOGLE_CLIENT_ID
-        )
+        with start_span("google.verify_oauth2_token", kind="client"):
+            idinfo = id_token.verify_oauth2_token(
+                token, 
+                google_requests.Request(), 
+                GOOGLE_CLIENT_ID
+            )
         
         # ID token is valid. Get the user's Google Account ID and profile info
         userid = idinfo['sub']
@@ -74,6 +77,7 @@ async def authenticate_google_user(db: Session, token: str) -> dict:
                     user.last_name = google_user_info['family_name']
                 if google_user_info.get('picture'):
                     user.profile_picture = google_user_info['picture']
+                publish(db, user_changed(user))
                 db.commit()
                 db.refresh(user)
             else:
@@ -104,19 +108,14 @@ async def authenticate_google_user(db: Session, token: str) -> dict:
                 )
                 
                 db.add(user)
+                db.flush()
+                publish(db, user_changed(user, "create"))
                 db.commit()
                 db.refresh(user)
         
-        # Create access token
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        access_token = create_access_token(
-            data={"sub": user.username, "role": user.role}, 
-            expires_delta=access_token_expires
-        )
-        
+        # Create access and refresh tokens
         return {
-            "access_token": access_token, 
-            "token_type": "bearer",
+            **issue_tokens(user),
             "user": {
                 "id": user.id,
                 "username": user.username,
@@ -0,0 +1,328 @@
+"""
+`Idempotency-Key` support for write endpoints.
+
+A write request carrying an `Idempotency-Key` header runs once; retries with
+the same key (from the same caller) get the stored response replayed without
+authenticating or touching the database again. The caller is the user named
+by the bearer token, so a retry after a token refresh still matches, or else
+the client address. Bodies over IDEMPOTENCY_MAX_BODY_BYTES are refused with
+413, since the body is buffered to fingerprint it. Concurrent duplicates inside
+one worker wait for the first execution instead of running in parallel.
+
+Responses are kept in a bounded in-memory LRU with a TTL. With
+IDEMPOTENCY_BACKEND=database they are also written to the
+`idempotency_records` table, which lets several workers share keys: a worker
+claims a key by inserting an in-progress row, and a duplicate arriving at
+another worker while it runs gets a 409. A claim is a lease that expires after
+IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS, so a key whose worker crashed mid-request
+can be taken over by a retry instead of staying blocked until the TTL.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+
+from app.auth import token_subject
+from app.database import SessionLocal
+from app.models import IdempotencyRecord
+
+IDEMPOTENCY_BACKEND = os.getenv("IDEMPOTENCY_BACKEND", "memory")
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS = int(os.getenv("IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS", "300"))
+IDEMPOTENCY_MAX_BODY_BYTES = int(os.getenv("IDEMPOTENCY_MAX_BODY_BYTES", str(10 * 1024 * 1024)))
+
+WRITE_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Headers that belong to the transport, not to the stored response
+SKIPPED_HEADERS = {b"content-length", b"date", b"server"}
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status_code: int
+    headers: List[Tuple[bytes, bytes]] = field(default_factory=list)
+    body: bytes = b""
+
+
+class IdempotencyCache:
+    """
+    LRU of stored responses with a per-entry TTL, bounded by entry count.
+    """
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE, ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[StoredResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def put(self, key, response: StoredResponse):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, response)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DatabaseIdempotencyStore:
+    """
+    Shares idempotency keys between workers through the idempotency_records table.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: int = IDEMPOTENCY_TTL_SECONDS,
+        claim_timeout_seconds: int = IDEMPOTENCY_CLAIM_TIMEOUT_SECONDS,
+        purge_every: int = 500,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.claim_timeout_seconds = claim_timeout_seconds
+        self.purge_every = purge_every
+        self._claims = 0
+
+    def get(self, key) -> Optional[StoredResponse]:
+        db = SessionLocal()
+        try:
+            record = db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.key == key,
+                IdempotencyRecord.status_code.isnot(None),
+                IdempotencyRecord.expires_at > datetime.now(timezone.utc),
+            ).first()
+            if record is None:
+                return None
+            return StoredResponse(
+                fingerprint=record.fingerprint,
+                status_code=record.status_code,
+                headers=[(name.encode("latin-1"), value.encode("latin-1")) for name, value in json.loads(record.headers)],
+                body=record.body or b"",
+            )
+        finally:
+            db.close()
+
+    def claim(self, key, fingerprint) -> bool:
+        """
+        Insert an in-progress row for `key`. Returns False if another request
+        already holds an unexpired claim or result for it. The claim expires
+        after claim_timeout_seconds; save() extends it to the full TTL.
+        """
+        now = datetime.now(timezone.utc)
+        db = SessionLocal()
+        try:
+            self._claims += 1
+            if self._claims % self.purge_every == 0:
+                db.query(IdempotencyRecord).filter(IdempotencyRecord.expires_at <= now).delete()
+            else:
+                db.query(IdempotencyRecord).filter(
+                    IdempotencyRecord.key == key, IdempotencyRecord.expires_at <= now
+                ).delete()
+            db.add(IdempotencyRecord(
+                key=key,
+                fingerprint=fingerprint,
+                expires_at=now + timedelta(seconds=self.claim_timeout_seconds),
+            ))
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def save(self, key, response: StoredResponse):
+        db = SessionLocal()
+        try:
+            # A result stored by a request that took over an expired claim wins
+            db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.key == key, IdempotencyRecord.status_code.is_(None)
+            ).update({
+                IdempotencyRecord.status_code: response.status_code,
+                IdempotencyRecord.headers: json.dumps(
+                    [[name.decode("latin-1"), value.decode("latin-1")] for name, value in response.headers]
+                ),
+                IdempotencyRecord.body: response.body,
+                IdempotencyRecord.expires_at: datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds),
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, key):
+        db = SessionLocal()
+        try:
+            db.query(IdempotencyRecord).filter(
+                IdempotencyRecord.key == key, IdempotencyRecord.status_code.is_(None)
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+
+class IdempotencyMiddleware:
+    """
+    Pure ASGI middleware so the request body can be buffered for the
+    fingerprint and replayed to the app unchanged.
+    """
+
+    def __init__(self, app, cache: IdempotencyCache = None, database: DatabaseIdempotencyStore = None,
+                 max_body_bytes: int = IDEMPOTENCY_MAX_BODY_BYTES):
+        self.app = app
+        self.max_body_bytes = max_body_bytes
+        self.cache = cache or IdempotencyCache()
+        self.database = database
+        self._inflight = {}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in WRITE_METHODS:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(b"idempotency-key")
+        if not idempotency_key:
+            await self.app(scope, receive, send)
+            return
+
+        too_large = (413, f"Request body is larger than {self.max_body_bytes} bytes")
+        if int(headers.get(b"content-length") or 0) > self.max_body_bytes:
+            await self._send_error(send, *too_large)
+            return
+        body, more_body = b"", True
+        while more_body:
+            message = await receive()
+            body += message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if len(body) > self.max_body_bytes:
+                await self._send_error(send, *too_large)
+                return
+
+        # Keys are scoped to the caller so one user can never replay another's response
+        key = hashlib.sha256(self._caller(scope, headers) + b"\0" + idempotency_key).hexdigest()
+        fingerprint = hashlib.sha256(
+            b"\0".join([scope["method"].encode(), scope["path"].encode(), scope.get("query_string", b""), body])
+        ).hexdigest()
+
+        while True:
+            stored = await self._lookup(key)
+            if stored is not None:
+                await self._replay(stored, fingerprint, send)
+                return
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                break
+            # Collapse concurrent duplicates onto the first execution
+            await inflight.wait()
+
+        done = self._inflight[key] = asyncio.Event()
+        try:
+            if self.database is not None and not await run_in_threadpool(self.database.claim, key, fingerprint):
+                await self._send_error(send, 409, "A request with this Idempotency-Key is still being processed")
+                return
+            await self._execute(scope, body, send, key, fingerprint)
+        finally:
+            del self._inflight[key]
+            done.set()
+
+    @staticmethod
+    def _caller(scope, headers):
+        scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+        subject = token_subject(token) if scheme.lower() == "bearer" and token else None
+        if subject is not None:
+            return b"user:" + subject.encode()
+        return b"client:" + (scope.get("client") or ("",))[0].encode()
+
+    async def _lookup(self, key):
+        stored = self.cache.get(key)
+        if stored is None and self.database is not None:
+            stored = await run_in_threadpool(self.database.get, key)
+            if stored is not None:
+                self.cache.put(key, stored)
+        return stored
+
+    async def _execute(self, scope, body, send, key, fingerprint):
+        response = StoredResponse(fingerprint=fingerprint, status_code=500)
+        body_sent = False
+
+        async def replay_receive():
+            nonlocal body_sent
+            if body_sent:
+                return {"type": "http.disconnect"}
+            body_sent = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response.status_code = message["status"]
+                response.headers = [
+                    (name, value) for name, value in message.get("headers", [])
+                    if name.lower() not in SKIPPED_HEADERS
+                ]
+            elif message["type"] == "http.response.body":
+                response.body += message.get("body", b"")
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        finally:
+            # Server errors and authentication failures aren't stored so the
+            # client can retry them, e.g. with a refreshed token
+            if response.status_code < 500 and response.status_code != 401:
+                self.cache.put(key, response)
+                if self.database is not None:
+                    await run_in_threadpool(self.database.save, key, response)
+            elif self.database is not None:
+                await run_in_threadpool(self.database.release, key)
+
+    async def _replay(self, stored, fingerprint, send):
+        if stored.fingerprint != fingerprint:
+            await self._send_error(send, 422, "Idempotency-Key was already used with a different request")
+            return
+        await send({
+            "type": "http.response.start",
+            "status": stored.status_code,
+            "headers": stored.headers + [
+                (b"content-length", str(len(stored.body)).encode()),
+                (b"idempotent-replayed", b"true"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": stored.body})
+
+    async def _send_error(self, send, status_code, detail):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def idempotency_store():
+    """
+    Build the optional shared store selected by IDEMPOTENCY_BACKEND.
+    """
+    if IDEMPOTENCY_BACKEND == "database":
+        return DatabaseIdempotencyStore()
+    return None
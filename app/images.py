@@ -0,0 +1,131 @@
+"""
+Product image storage with thumbnails generated at upload time.
+
+Files are content-addressed: the name is a hash of the uploaded bytes, so a
+URL never changes meaning and can be cached forever by browsers and CDNs.
+Thumbnails are rendered once, on a process pool so the resize doesn't hold
+the GIL of the API process, and list responses point at the small size.
+
+Pillow is only imported inside the pool processes, keeping it off the API's
+import path.
+"""
+import asyncio
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+
+IMAGE_STORAGE_DIR = os.getenv("IMAGE_STORAGE_DIR", os.path.join(os.getcwd(), "media", "images"))
+# Prefix for image URLs, e.g. https://cdn.example.com; empty means relative to the API
+IMAGE_BASE_URL = os.getenv("IMAGE_BASE_URL", "").rstrip("/")
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "2"))
+THUMBNAIL_SIZES = [int(size) for size in os.getenv("THUMBNAIL_SIZES", "160,480").split(",")]
+
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+IMAGE_NAME_PATTERN = re.compile(r"^[0-9a-f]{20}(_\d+)?\.(jpg|png|gif|webp)$")
+
+_executor = None
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+class ImageTooLarge(InvalidImage):
+    pass
+
+
+@dataclass
+class StoredImage:
+    image_url: str
+    thumbnail_url: str
+
+
+def _render_thumbnails(data: bytes, sizes):
+    """
+    Runs in a worker process. Returns the original's file extension and a
+    JPEG thumbnail per size, fitting the image inside a size x size box.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.verify()
+        image = Image.open(io.BytesIO(data))
+        extension = {"JPEG": "jpg", "PNG": "png", "GIF": "gif", "WEBP": "webp"}.get(image.format)
+        if extension is None:
+            raise InvalidImage(f"Unsupported image format {image.format}")
+        image = image.convert("RGB")
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(f"Image has too many pixels: {e}")
+    except (UnidentifiedImageError, OSError, SyntaxError) as e:
+        raise InvalidImage(f"Not a valid image: {e}")
+
+    thumbnails = {}
+    for size in sizes:
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        out = io.BytesIO()
+        thumbnail.save(out, format="JPEG", quality=85, optimize=True)
+        thumbnails[size] = out.getvalue()
+    return extension, thumbnails
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def image_path(name: str):
+    if not IMAGE_NAME_PATTERN.match(name):
+        return None
+    return os.path.join(IMAGE_STORAGE_DIR, name)
+
+
+def image_url(name: str):
+    return f"{IMAGE_BASE_URL}/images/{name}"
+
+
+def _write_file(name: str, data: bytes):
+    path = os.path.join(IMAGE_STORAGE_DIR, name)
+    if os.path.exists(path):
+        return  # content-addressed, so an existing file is identical
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+async def store_image(data: bytes) -> StoredImage:
+    """
+    Validate an uploaded image, render its thumbnails and write everything
+    to storage. Raises InvalidImage for data Pillow can't read, and
+    ImageTooLarge for images over Pillow's decompression bomb pixel limit.
+    """
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    loop = asyncio.get_running_loop()
+    extension, thumbnails = await loop.run_in_executor(get_executor(), _render_thumbnails, data, THUMBNAIL_SIZES)
+
+    os.makedirs(IMAGE_STORAGE_DIR, exist_ok=True)
+    original = f"{digest}.{extension}"
+    files = {original: data}
+    files.update({f"{digest}_{size}.jpg": thumbnail for size, thumbnail in thumbnails.items()})
+    for name, content in files.items():
+        await loop.run_in_executor(None, _write_file, name, content)
+
+    return StoredImage(
+        image_url=image_url(original),
+        thumbnail_url=image_url(f"{digest}_{min(THUMBNAIL_SIZES)}.jpg"),
+    )
@@ -0,0 +1,197 @@
+"""
+Cross-worker cache invalidation bus.
+
+CRUD functions publish typed invalidation events on the session that makes
+the write; the events are delivered after the transaction commits and are
+dropped if it rolls back. Caches subscribe and evict what the event names.
+
+With Postgres (INVALIDATION_BUS=postgres, the default for a postgresql
+DATABASE_URL) events are also sent with NOTIFY inside the same transaction,
+and every worker LISTENs on a background thread, so a write handled by one
+uvicorn worker evicts the caches of all of them. Other databases, and
+tests, use the in-process bus.
+"""
+import json
+import logging
+import os
+import select
+import threading
+import uuid
+from dataclasses import dataclass
+from typing import Callable, List, Tuple
+
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+
+from app.database import engine
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_BUS = os.getenv("INVALIDATION_BUS", "auto")
+INVALIDATION_CHANNEL = os.getenv("INVALIDATION_CHANNEL", "inventory_invalidation")
+
+
+@dataclass(frozen=True)
+class InvalidationEvent:
+    """
+    `entity` names what changed ("product", "user", ...; "*" means
+    everything), `ids` the primary keys and `keys` secondary lookup keys
+    such as SKUs or usernames. Empty ids means the whole entity. `action`
+    is "create", "update" or "delete"; only creates and deletes change
+    which rows a list contains.
+    """
+    entity: str
+    ids: Tuple = ()
+    keys: Tuple = ()
+    action: str = "update"
+
+    def to_json(self, origin: str = None):
+        return json.dumps({
+            "entity": self.entity, "ids": list(self.ids), "keys": list(self.keys),
+            "action": self.action, "origin": origin,
+        })
+
+    @classmethod
+    def from_json(cls, payload: str):
+        data = json.loads(payload)
+        invalidation = cls(
+            data["entity"], tuple(data.get("ids", ())), tuple(data.get("keys", ())), data.get("action", "update")
+        )
+        return invalidation, data.get("origin")
+
+
+def product_changed(product, action: str = "update") -> InvalidationEvent:
+    return InvalidationEvent("product", (product.id,), (product.sku,), action)
+
+
+def user_changed(user, action: str = "update") -> InvalidationEvent:
+    return InvalidationEvent("user", (user.id,), (user.username,), action)
+
+
+FLUSH_ALL = InvalidationEvent("*")
+
+
+class InProcessInvalidationBus:
+    def __init__(self):
+        self._subscribers: List[Callable[[InvalidationEvent], None]] = []
+
+    def subscribe(self, callback: Callable[[InvalidationEvent], None]):
+        self._subscribers.append(callback)
+        return callback
+
+    def publish(self, db: Session, invalidation: InvalidationEvent):
+        """
+        Queue an event on `db`; it's delivered when the session commits.
+        """
+        db.info.setdefault("pending_invalidations", []).append(invalidation)
+
+    def deliver(self, invalidation: InvalidationEvent):
+        for callback in self._subscribers:
+            try:
+                callback(invalidation)
+            except Exception:
+                logger.exception("Invalidation subscriber failed for %s", invalidation)
+
+    def send_remote(self, db: Session, invalidations):
+        pass
+
+    def start(self):
+        pass
+
+    def stop(self):
+        pass
+
+
+class PostgresInvalidationBus(InProcessInvalidationBus):
+    def __init__(self, channel: str = INVALIDATION_CHANNEL, reconnect_seconds: float = 5.0):
+        super().__init__()
+        self.channel = channel
+        self.reconnect_seconds = reconnect_seconds
+        self.origin = uuid.uuid4().hex
+        self._stop = threading.Event()
+        self._thread = None
+
+    def send_remote(self, db: Session, invalidations):
+        # NOTIFY is transactional: other workers only hear about committed writes
+        for invalidation in invalidations:
+            db.execute(
+                text("SELECT pg_notify(:channel, :payload)"),
+                {"channel": self.channel, "payload": invalidation.to_json(self.origin)}
+            )
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._listen_forever, name="invalidation-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def _listen_forever(self):
+        connected_before = False
+        while not self._stop.is_set():
+            try:
+                connection = engine.raw_connection()
+                connection.detach()  # dedicated connection, never returned to the pool
+                conn = connection.driver_connection
+                conn.autocommit = True
+                conn.cursor().execute(f'LISTEN "{self.channel}"')
+                if connected_before:
+                    # Notifications sent while we were disconnected are lost
+                    self.deliver(FLUSH_ALL)
+                connected_before = True
+                self._listen(conn)
+            except Exception:
+                logger.exception("Invalidation listener disconnected; reconnecting")
+                self._stop.wait(self.reconnect_seconds)
+
+    def _listen(self, conn):
+        try:
+            while not self._stop.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notification = conn.notifies.pop(0)
+                    invalidation, origin = InvalidationEvent.from_json(notification.payload)
+                    if origin != self.origin:  # our own events were already delivered locally
+                        self.deliver(invalidation)
+        finally:
+            conn.close()
+
+
+def create_invalidation_bus():
+    backend = INVALIDATION_BUS
+    if backend == "auto":
+        backend = "postgres" if engine.dialect.name == "postgresql" else "memory"
+    if backend == "postgres":
+        return PostgresInvalidationBus()
+    return InProcessInvalidationBus()
+
+
+invalidation_bus = create_invalidation_bus()
+
+
+@event.listens_for(Session, "before_commit")
+def _send_pending_invalidations(session):
+    pending = session.info.get("pending_invalidations")
+    if pending:
+        invalidation_bus.send_remote(session, pending)
+
+
+@event.listens_for(Session, "after_commit")
+def _deliver_pending_invalidations(session):
+    for invalidation in session.info.pop("pending_invalidations", ()):
+        invalidation_bus.deliver(invalidation)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending_invalidations(session):
+    session.info.pop("pending_invalidations", None)
+
+
+def publish(db: Session, invalidation: InvalidationEvent):
+    invalidation_bus.publish(db, invalidation)
@@ -0,0 +1,446 @@
+"""
+Background jobs for bulk work (imports, exports, rebuilds).
+
+Endpoints only insert a row into the `jobs` table; a worker pool claims
+queued rows with a conditional UPDATE, runs the registered handler and
+records progress, result or error. Handlers open short-lived sessions per
+batch instead of holding one for the whole job.
+
+Workers run in-process (JOB_WORKERS threads, started with the app) or as a
+separate process with `python -m app.worker` (set JOB_WORKERS=0 on the API).
+Running jobs heartbeat through their progress reports; a job whose
+heartbeat goes stale, because its worker died, is requeued up to
+JOB_MAX_ATTEMPTS times.
+"""
+import csv
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from pydantic import ValidationError
+from sqlalchemy import func, select
+
+from app.database import SessionLocal
+from app.models import Job, JobStatus, Product, StockReservation, ReservationStatus, User
+from app.schemas import ProductCreate
+from app.audit import audit
+from app.invalidation import publish, product_changed
+from app.repository import below_reserved
+from app.alerts import track_stock_change, track_threshold_change
+from app.forecasting import record_decrease, run_forecast, FORECAST_BATCH_SIZE, FORECAST_HISTORY_DAYS
+from app.rollups import rebuild_totals, rollup_writer, track_product
+import app.changes  # noqa: F401  stamps change sequence numbers on product writes
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "1"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_STALE_SECONDS = float(os.getenv("JOB_STALE_SECONDS", "300"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_OUTPUT_DIR = os.getenv("JOB_OUTPUT_DIR", os.path.join(tempfile.gettempdir(), "inventory-jobs"))
+
+BATCH_SIZE = 1000
+
+job_handlers = {}
+
+
+def job_handler(name):
+    """
+    Register a function as the handler for jobs of type `name`. It is called
+    with a JobContext and the job's params, and returns a JSON-serializable result.
+    """
+    def register(func):
+        job_handlers[name] = func
+        return func
+    return register
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobContext:
+    def __init__(self, job_id: int, progress_interval: float = 0.5):
+        self.job_id = job_id
+        self.progress_interval = progress_interval
+        self._last_report = 0.0
+        self._actor = None
+
+    def session(self):
+        return SessionLocal()
+
+    def actor(self):
+        """
+        (user id, username) of the user who created the job, for audit entries.
+        """
+        if self._actor is None:
+            db = self.session()
+            try:
+                row = db.query(User.id, User.username).join(Job, Job.created_by == User.id).filter(
+                    Job.id == self.job_id
+                ).first()
+            finally:
+                db.close()
+            self._actor = tuple(row) if row else ()
+        return self._actor or None
+
+    def report_progress(self, current: int, total: int = None, message: str = None, force: bool = False):
+        """
+        Record progress and heartbeat, and stop the job if cancellation was
+        requested. Writes are throttled to one every `progress_interval` seconds.
+        """
+        now = time.monotonic()
+        if not force and now - self._last_report < self.progress_interval:
+            return
+        self._last_report = now
+        values = {Job.progress_current: current, Job.heartbeat_at: datetime.now(timezone.utc)}
+        if total is not None:
+            values[Job.progress_total] = total
+        if message is not None:
+            values[Job.message] = message
+        db = self.session()
+        try:
+            db.query(Job).filter(Job.id == self.job_id).update(values, synchronize_session=False)
+            db.commit()
+            cancel_requested = db.query(Job.cancel_requested).filter(Job.id == self.job_id).scalar()
+        finally:
+            db.close()
+        if cancel_requested:
+            raise JobCancelled()
+
+
+class JobWorkerPool:
+    def __init__(self, workers: int = JOB_WORKERS, poll_seconds: float = JOB_POLL_SECONDS,
+                 stale_seconds: float = JOB_STALE_SECONDS, max_attempts: int = JOB_MAX_ATTEMPTS):
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(index,), name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def _run(self, index):
+        while not self._stop.is_set():
+            try:
+                if index == 0:
+                    self.requeue_stale()
+                job = self.claim_next()
+            except Exception:
+                logger.exception("Job worker failed to poll for jobs")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_seconds)
+                continue
+            self.execute(*job)
+
+    def requeue_stale(self):
+        """
+        Give jobs whose worker stopped heartbeating back to the queue, or fail
+        them once they've used up their attempts.
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.stale_seconds)
+        db = SessionLocal()
+        try:
+            stale = Job.status == JobStatus.RUNNING.value, Job.heartbeat_at < cutoff
+            db.query(Job).filter(*stale, Job.attempts >= self.max_attempts).update({
+                Job.status: JobStatus.FAILED.value,
+                Job.error: "Worker stopped responding",
+                Job.finished_at: datetime.now(timezone.utc),
+            }, synchronize_session=False)
+            db.query(Job).filter(*stale).update({
+                Job.status: JobStatus.QUEUED.value,
+                Job.worker_id: None,
+            }, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+    def claim_next(self):
+        db = SessionLocal()
+        try:
+            while True:
+                candidate = (
+                    db.query(Job.id)
+                    .filter(Job.status == JobStatus.QUEUED.value)
+                    .order_by(Job.id)
+                    .limit(1)
+                    .scalar()
+                )
+                if candidate is None:
+                    return None
+                now = datetime.now(timezone.utc)
+                claimed = db.query(Job).filter(Job.id == candidate, Job.status == JobStatus.QUEUED.value).update({
+                    Job.status: JobStatus.RUNNING.value,
+                    Job.worker_id: self.worker_id,
+                    Job.started_at: now,
+                    Job.heartbeat_at: now,
+                    Job.attempts: Job.attempts + 1,
+                }, synchronize_session=False)
+                db.commit()
+                if claimed:
+                    job = db.query(Job).filter(Job.id == candidate).one()
+                    return job.id, job.type, json.loads(job.params or "{}")
+                # Another worker got it first; try the next one
+        finally:
+            db.close()
+
+    def execute(self, job_id, job_type, params):
+        context = JobContext(job_id)
+        values = {}
+        try:
+            handler = job_handlers.get(job_type)
+            if handler is None:
+                raise ValueError(f"Unknown job type {job_type}")
+            result = handler(context, params)
+            values[Job.status] = JobStatus.SUCCEEDED.value
+            values[Job.result] = json.dumps(result)
+        except JobCancelled:
+            values[Job.status] = JobStatus.CANCELLED.value
+        except Exception as e:
+            logger.error("Job %s (%s) failed:\n%s", job_id, job_type, traceback.format_exc())
+            values[Job.status] = JobStatus.FAILED.value
+            values[Job.error] = str(e)
+        values[Job.finished_at] = datetime.now(timezone.utc)
+
+        db = SessionLocal()
+        try:
+            # Only the worker that owns the job may finish it
+            db.query(Job).filter(Job.id == job_id, Job.worker_id == self.worker_id).update(
+                values, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+# Built-in job types
+
+@job_handler("export_products")
+def export_products(context: JobContext, params: dict):
+    """
+    Write every product to a CSV file, reading in keyset-paginated batches.
+    """
+    os.makedirs(JOB_OUTPUT_DIR, exist_ok=True)
+    path = os.path.join(JOB_OUTPUT_DIR, f"job-{context.job_id}-products.csv")
+    columns = ["id", "name", "type", "sku", "image_url", "description", "quantity", "price", "created_at", "updated_at"]
+
+    db = context.session()
+    try:
+        total = db.query(func.count(Product.id)).scalar()
+    finally:
+        db.close()
+
+    rows = 0
+    last_id = 0
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        while True:
+            db = context.session()
+            try:
+                batch = (
+                    db.query(Product)
+                    .filter(Product.id > last_id)
+                    .order_by(Product.id)
+                    .limit(BATCH_SIZE)
+                    .all()
+                )
+                writer.writerows([[getattr(product, column) for column in columns] for product in batch])
+            finally:
+                db.close()
+            if not batch:
+                break
+            last_id = batch[-1].id
+            rows += len(batch)
+            context.report_progress(rows, total)
+
+    context.report_progress(rows, total, message="Export complete", force=True)
+    return {"file": path, "rows": rows}
+
+
+@job_handler("import_products")
+def import_products(context: JobContext, params: dict):
+    """
+    Create or update products by SKU from `params["products"]`, one
+    transaction per batch. Invalid rows, and updates that would leave less
+    stock than is reserved, are reported instead of failing the job.
+    """
+    products = params.get("products", [])
+    created = updated = 0
+    failed = []
+    actor = context.actor()
+
+    for start in range(0, len(products), BATCH_SIZE):
+        valid = {}
+        for row, data in enumerate(products[start:start + BATCH_SIZE], start):
+            try:
+                valid[row] = ProductCreate(**data)
+            except (ValidationError, TypeError) as e:
+                failed.append({"row": row, "error": str(e)})
+
+        db = context.session()
+        try:
+            skus = [product.sku for product in valid.values()]
+            # Locked, so stock deltas for alerts come from the committed quantities
+            existing = {
+                p.sku: p for p in
+                db.query(Product).filter(Product.sku.in_(skus)).order_by(Product.id).with_for_update().all()
+            }
+            touched = {}
+            audits = []
+            for row, product in valid.items():
+                db_product = existing.get(product.sku)
+                if db_product is None:
+                    db_product = Product(**product.dict())
+                    db.add(db_product)
+                    existing[product.sku] = db_product
+                    track_product(db, db_product)
+                    touched[product.sku] = (db_product, "create")
+                    audits.append((db_product, "product.create", {"quantity": db_product.quantity}))
+                    created += 1
+                else:
+                    values = product.dict()
+                    # Same rule as every other quantity write: active holds must stay covered
+                    if values["quantity"] < db_product.reserved_quantity:
+                        error = below_reserved(db_product.id, values["quantity"], db_product.reserved_quantity)
+                        failed.append({"row": row, "error": error.detail})
+                        continue
+                    # Rows without a threshold keep the one already set
+                    if "reorder_threshold" not in product.model_fields_set:
+                        del values["reorder_threshold"]
+                    # Products created earlier in this batch have no id yet, nor alerts
+                    if db_product.id is not None:
+                        track_stock_change(db, db_product.id, values["quantity"] - db_product.quantity)
+                        record_decrease(db, db_product.id, db_product.quantity - values["quantity"])
+                        if "reorder_threshold" in values:
+                            track_threshold_change(db, db_product.id, db_product.reorder_threshold)
+                    audits.append((db_product, "product.quantity", {"old": db_product.quantity, "new": values["quantity"]}))
+                    # Type, price and quantity may all change: swap the old values for the new
+                    track_product(db, db_product, -1)
+                    for key, value in values.items():
+                        setattr(db_product, key, value)
+                    track_product(db, db_product)
+                    touched.setdefault(product.sku, (db_product, "update"))
+                    updated += 1
+            db.flush()
+            for db_product, action in touched.values():
+                publish(db, product_changed(db_product, action))
+            # After the flush, so created products have their ids
+            for db_product, action, details in audits:
+                audit(db, action, "product", db_product.id, actor=actor, sku=db_product.sku,
+                      job_id=context.job_id, **details)
+            db.commit()
+        finally:
+            db.close()
+        context.report_progress(min(start + BATCH_SIZE, len(products)), len(products))
+
+    context.report_progress(len(products), len(products), message="Import complete", force=True)
+    return {"created": created, "updated": updated, "failed": failed}
+
+
+@job_handler("rebuild_reserved_quantities")
+def rebuild_reserved_quantities(context: JobContext, params: dict):
+    """
+    Recompute Product.reserved_quantity from active reservations, repairing
+    any drift in the incrementally maintained counter.
+    """
+    held = (
+        select(func.coalesce(func.sum(StockReservation.quantity), 0))
+        .where(
+            StockReservation.product_id == Product.id,
+            StockReservation.status == ReservationStatus.ACTIVE.value,
+        )
+        .scalar_subquery()
+    )
+    db = context.session()
+    try:
+        total = db.query(func.count(Product.id)).scalar()
+    finally:
+        db.close()
+
+    fixed = 0
+    done = 0
+    last_id = 0
+    while True:
+        db = context.session()
+        try:
+            ids = [
+                product_id for (product_id,) in
+                db.query(Product.id).filter(Product.id > last_id).order_by(Product.id).limit(BATCH_SIZE)
+            ]
+            if not ids:
+                break
+            drifted = db.query(Product).filter(Product.id.in_(ids), Product.reserved_quantity != held).all()
+            if drifted:
+                db.query(Product).filter(Product.id.in_([p.id for p in drifted])).update(
+                    {Product.reserved_quantity: held}, synchronize_session=False
+                )
+                for db_product in drifted:
+                    publish(db, product_changed(db_product))
+                fixed += len(drifted)
+            db.commit()
+        finally:
+            db.close()
+        last_id = ids[-1]
+        done += len(ids)
+        context.report_progress(done, total)
+
+    context.report_progress(done, total, message="Rebuild complete", force=True)
+    return {"products": done, "fixed": fixed}
+
+
+@job_handler("forecast_reorder_points")
+def forecast_reorder_points(context: JobContext, params: dict):
+    """
+    Recompute demand forecasts and reorder suggestions for every product.
+    Optional params: method (ewma or sma), smoothing, lead_time_days,
+    review_days, service_level, history_days, batch_size.
+    """
+    options = {
+        key: params[key] for key in ("method", "smoothing", "lead_time_days", "review_days", "service_level")
+        if key in params
+    }
+    result = run_forecast(
+        batch_size=int(params.get("batch_size", FORECAST_BATCH_SIZE)),
+        history_days=int(params.get("history_days", FORECAST_HISTORY_DAYS)),
+        progress=context.report_progress,
+        **options
+    )
+    context.report_progress(result["products"], result["products"], message="Forecast complete", force=True)
+    return result
+
+
+@job_handler("rebuild_inventory_rollups")
+def rebuild_inventory_rollups(context: JobContext, params: dict):
+    """
+    Reset the per-type inventory totals behind the rollups from the products
+    table, after applying this process's pending deltas.
+    """
+    rollup_writer.flush()
+    result = rebuild_totals()
+    context.report_progress(result["types"], result["types"], message="Rebuild complete", force=True)
+    return result
+
+
+job_pool = JobWorkerPool()
@@ -1,38 +1,115 @@
-from fastapi import FastAPI, Depends, HTTPException, status
+from fastapi import FastAPI, Depends, HTTPException, status, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse
 from sqlalchemy.orm import Session
-from datetime import timedelta
-from typing import List
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager, suppress
+from typing import List, Optional
+from datetime import datetime
+import asyncio
 import os
+import time
 
-from app.database import get_db, engine
-from app.models import Base, UserRole
+from app.database import (
+    get_db, get_read_db, request_session, init_db, engine, replica_router, database_stats, CREATE_TABLES_ON_STARTUP
+)
+from app.models import UserRole
 from app.schemas import (
-    UserCreate, User, UserLogin, Token, 
+    UserCreate, User, UserLogin, Token, TokenData, RefreshRequest, LogoutRequest,
+    BulkUserImportRequest, BulkUserImportResponse,
     ProductCreate, Product, ProductUpdate, ProductResponse,
-    GoogleAuthRequest
+    GoogleAuthRequest, LocationCreate, Location, LocationStock, LocationStockWithProduct,
+    ReservationCreate, Reservation, ProductAvailability, JobCreate, Job, AuditPage,
+    SkuLookupRequest, SkuLookupResponse, ProductChanges, ReorderSuggestion, ReorderThresholdUpdate
 )
 from app.crud import (
-    create_user, get_user_by_username, get_all_users, update_user_role, delete_user,
-    create_product, get_products, update_product_quantity
+    create_user, bulk_create_users, get_user_by_username, get_all_users, update_user_role, delete_user,
+    create_product, get_products_cached, update_product_quantity,
+    create_location, get_locations, get_product_stock, update_location_quantity,
+    get_low_stock_at_location, get_product_availability, create_reservation, get_reservation,
+    confirm_reservation, release_reservation, create_job, get_job, cancel_job,
+    get_product_by_id, set_product_image, delete_product, get_audit_entries,
+    get_product_by_sku_cached, get_products_by_skus_cached, set_reorder_threshold
 )
 from app.auth import (
-    authenticate_user, create_access_token, 
-    ACCESS_TOKEN_EXPIRE_MINUTES, get_current_user,
-    require_admin, require_admin_or_manager
+    authenticate_user, issue_tokens, refresh_tokens, logout as revoke_session,
+    verify_token, get_current_user, require_admin, require_admin_or_manager, shutdown_hash_executor
+)
+from app.reservations import reservation_scheduler, RESERVATION_TTL_SECONDS
+from app.admission import AdmissionMiddleware, admission_controller, ADMISSION_CONTROL_ENABLED
+from app.sharding import ShardedProductRepository, get_product_shards
+from app.catalog import catalog_snapshot, CatalogUnavailable, CATALOG_SNAPSHOT_ENABLED
+from app.idempotency import IdempotencyMiddleware, idempotency_store
+from app.jobs import job_pool, job_handlers
+from app.invalidation import invalidation_bus
+from app.cache import result_cache, sku_cache
+from app.audit import audit_writer
+from app.alerts import alert_dispatcher
+from app.coalescing import quantity_coalescer
+from app.profiling import (
+    ProfilingMiddleware, ProfiledRoute, PROFILING_ENABLED, list_profiles, profile_path, sampled_thread
+)
+from app.changes import get_product_changes
+from app.forecasting import get_reorder_suggestions
+from app.rollups import get_timeseries, rollup_writer, ROLLUPS_ENABLED
+from app.tracing import TracingMiddleware, InMemoryExporter, get_exporter, traced_http_client
+from app.images import (
+    store_image, image_path, shutdown_executor, InvalidImage, ImageTooLarge,
+    IMAGE_MAX_BYTES, IMAGE_CACHE_CONTROL
 )
-from app.google_auth import authenticate_google_user
 
-# Create database tables (only if DATABASE_URL is set)
-if os.getenv("DATABASE_URL"):
-    Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema creation is no longer done at import time. Run `python -m app.migrate`
+    # as a deploy step, or set CREATE_TABLES_ON_STARTUP=true for local development.
+    if CREATE_TABLES_ON_STARTUP:
+        init_db()
+    invalidation_bus.start()
+    audit_writer.start()
+    alert_dispatcher.start()
+    # Before anything that writes products, so the seed sees no pending deltas
+    if ROLLUPS_ENABLED:
+        rollup_writer.start()
+    expiry_task = asyncio.create_task(reservation_scheduler.run())
+    job_pool.start()
+    if quantity_coalescer.enabled:
+        quantity_coalescer.start()
+    if CATALOG_SNAPSHOT_ENABLED:
+        catalog_snapshot.start()
+    yield
+    catalog_snapshot.stop()
+    quantity_coalescer.stop()
+    job_pool.stop()
+    rollup_writer.stop()
+    alert_dispatcher.stop()
+    audit_writer.stop()
+    invalidation_bus.stop()
+    shutdown_executor()
+    shutdown_hash_executor()
+    expiry_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await expiry_task
 
 app = FastAPI(
     title="Inventory Management Tool",
     description="A REST API for managing inventory for small businesses with role-based access control",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Lets the profiler follow a request into the threadpool; set before any route is declared
+if PROFILING_ENABLED:
+    app.router.route_class = ProfiledRoute
+
+# Replays stored responses for retried writes carrying an Idempotency-Key.
+# Added before CORS so replayed responses still get CORS headers.
+app.add_middleware(IdempotencyMiddleware, database=idempotency_store())
+
+# Admission control: per-route adaptive concurrency limits with load shedding.
+# Inside CORS so 503s still carry CORS headers.
+if ADMISSION_CONTROL_ENABLED:
+    app.add_middleware(AdmissionMiddleware, router=app.router)
+
 # CORS middleware
 origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000").split(",")
 app.add_middleware(
@@ -43,6 +120,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Server span per request; a no-op unless TRACING_EXPORTER is set
+app.add_middleware(TracingMiddleware)
+
+# Outermost, so a profile covers the whole request. Not installed unless enabled.
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
+
 @app.get("/")
 def read_root():
     return {"message": "Inventory Management Tool API"}
@@ -72,18 +156,34 @@ def login(user_credentials: UserLogin, db: Session = Depends(get_db)):
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": user.username, "role": user.role}, 
-        expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return issue_tokens(user)
+
+@app.post("/token/refresh", response_model=Token)
+def refresh(refresh_request: RefreshRequest, db: Session = Depends(get_db)):
+    """
+    Exchange a refresh token for a new access and refresh token pair.
+    """
+    return refresh_tokens(db, refresh_request.refresh_token)
+
+@app.post("/logout")
+def logout(
+    logout_request: LogoutRequest = None,
+    token_data: TokenData = Depends(verify_token),
+    db: Session = Depends(get_db)
+):
+    """
+    Revoke the current access token and, if given, its refresh token.
+    """
+    revoke_session(db, token_data, logout_request.refresh_token if logout_request else None)
+    return {"message": "Logged out"}
 
 @app.post("/auth/google", response_model=Token)
 async def google_auth(auth_request: GoogleAuthRequest, db: Session = Depends(get_db)):
     """
     Authenticate user with Google OAuth and return JWT token.
     """
+    from app.google_auth import authenticate_google_user
+
     try:
         # Check if the token is an authorization code or ID token
         if len(auth_request.token) > 100:  # ID tokens are longer
@@ -92,8 +192,6 @@ async def google_auth(auth_request: GoogleAuthRequest, db: Session = Depends(get
             return result
         else:
             # It's an authorization code, exchange it for tokens
-            import httpx
-            
             client_id = os.getenv("GOOGLE_CLIENT_ID")
             client_secret = os.getenv("GOOGLE_CLIENT_SECRET")
             redirect_uri = os.getenv("GOOGLE_REDIRECT_URI")
@@ -108,7 +206,7 @@ async def google_auth(auth_request: GoogleAuthRequest, db: Session = Depends(get
                 "redirect_uri": redirect_uri
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
+            async with traced_http_client(timeout=30.0) as client:
                 print(f"Exchanging code for token...")
                 response = await client.post(token_url, data=token_data)
                 print(f"Token exchange response: {response.status_code}")
@@ -146,6 +244,8 @@ async def google_auth_callback(code: str, db: Session = Depends(get_db)):
     """
     Handle Google OAuth callback with authorization code.
     """
+    from app.google_auth import authenticate_google_user
+
     try:
         # Exchange authorization code for tokens
         import os
@@ -166,8 +266,7 @@ async def google_auth_callback(code: str, db: Session = Depends(get_db)):
             "redirect_uri": redirect_uri
         }
         
-        import httpx
-        async with httpx.AsyncClient() as client:
+        async with traced_http_client() as client:
             response = await client.post(token_url, data=token_data)
             if response.status_code != 200:
                 raise HTTPException(
@@ -241,7 +340,7 @@ def get_google_auth_url():
 def get_users(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(require_admin())
 ):
     """
@@ -249,6 +348,18 @@ def get_users(
     """
     return get_all_users(db, skip=skip, limit=limit)
 
+@app.post("/users/bulk", response_model=BulkUserImportResponse)
+def bulk_import_users(
+    request: BulkUserImportRequest,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin())
+):
+    """
+    Create up to 1000 users in one transaction. Admin only.
+    Returns a result per row; rows with a taken or repeated username are skipped.
+    """
+    return bulk_create_users(db=db, users=request.users)
+
 @app.put("/users/{user_id}/role")
 def update_user_role_endpoint(
     user_id: int,
@@ -272,6 +383,28 @@ def delete_user_endpoint(
     """
     return delete_user(db=db, user_id=user_id)
 
+def sharded_products(current_user: User = None):
+    """
+    The repository the catalog endpoints use when PRODUCT_SHARD_URLS is set,
+    else None. Its writes are audited as `current_user`.
+    """
+    shards = get_product_shards()
+    if shards is None:
+        return None
+    return ShardedProductRepository(shards, actor=(current_user.id, current_user.username) if current_user else None)
+
+def primary_products_only():
+    """
+    Refuse endpoints that work on the primary database's products table while
+    the catalog lives on the shards, where that table is no longer updated.
+    See app.sharding.
+    """
+    if get_product_shards() is not None:
+        raise HTTPException(
+            status_code=status.HTTP_501_NOT_IMPLEMENTED,
+            detail="Not available while the product catalog is sharded"
+        )
+
 # Product endpoints with role-based access
 @app.post("/products", response_model=ProductResponse, status_code=status.HTTP_201_CREATED)
 def add_product(
@@ -282,33 +415,612 @@ def add_product(
     """
     Add a new product to inventory. Admin and Manager only.
     """
-    db_product = create_product(db=db, product=product)
+    repository = sharded_products(current_user)
+    if repository is not None:
+        db_product = repository.create_product(product.dict())
+    else:
+        db_product = create_product(db=db, product=product)
     return {"product_id": db_product.id, "message": "Product created successfully"}
 
 @app.put("/products/{product_id}/quantity", response_model=Product)
-def update_product_quantity_endpoint(
+async def update_product_quantity_endpoint(
     product_id: int,
     product_update: ProductUpdate,
-    db: Session = Depends(get_db),
+    request: Request,
     current_user: User = Depends(require_admin_or_manager())
 ):
     """
     Update product quantity. Admin and Manager only.
+
+    With QUANTITY_COALESCE_MS set, updates to the same product within the
+    window are merged into one write; the response is sent once it commits.
     """
-    return update_product_quantity(db=db, product_id=product_id, quantity=product_update.quantity)
+    repository = sharded_products(current_user)
+    if repository is not None:
+        return await run_in_threadpool(sampled_thread(repository.update_product_quantity), product_id, product_update.quantity)
+    if quantity_coalescer.enabled:
+        future = quantity_coalescer.submit(
+            product_id, product_update.quantity, actor=(current_user.id, current_user.username)
+        )
+        # None while the coalescer is stopped (shutting down): write directly
+        if future is not None:
+            return await asyncio.wrap_future(future)
+
+    # The session is only opened on this path; the others don't touch the primary
+    def update():
+        with request_session(request) as db:
+            return update_product_quantity(db, product_id, product_update.quantity)
+
+    return await run_in_threadpool(sampled_thread(update))
+
+@app.put("/products/{product_id}/reorder-threshold", response_model=Product, dependencies=[Depends(primary_products_only)])
+def set_reorder_threshold_endpoint(
+    product_id: int,
+    update: ReorderThresholdUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin_or_manager())
+):
+    """
+    Set the quantity below which a product counts as low on stock, or null
+    for the LOW_STOCK_THRESHOLD default. Admin and Manager only.
+    """
+    return set_reorder_threshold(db, product_id, update.reorder_threshold)
 
 @app.get("/products", response_model=List[Product])
 def get_products_endpoint(
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     Get all products with pagination. All authenticated users.
+    Pages are served from the result cache until a product on them changes.
+    """
+    repository = sharded_products()
+    if repository is not None:
+        return repository.get_products(skip=skip, limit=limit)
+    return get_products_cached(db, skip=skip, limit=limit)
+
+@app.delete("/products/{product_id}")
+def delete_product_endpoint(
+    product_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin())
+):
+    """
+    Delete a product. Admin only. Delta sync clients see it as a tombstone.
+    """
+    repository = sharded_products(current_user)
+    if repository is not None:
+        return repository.delete_product(product_id)
+    return delete_product(db=db, product_id=product_id)
+
+@app.get("/products/changes", response_model=ProductChanges, dependencies=[Depends(primary_products_only)])
+def get_product_changes_endpoint(
+    since: Optional[str] = None,
+    limit: int = 500,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Products created or updated, and ids deleted, after the `since` token.
+    Omit `since` for a full sync; pass the returned `next` token on the next
+    call, repeating while `has_more` is true.
+    """
+    try:
+        return get_product_changes(db, since=since, limit=max(1, min(limit, 1000)))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Invalid change token {since}"
+        )
+
+@app.get("/products/reorder-suggestions", response_model=List[ReorderSuggestion], dependencies=[Depends(primary_products_only)])
+def get_reorder_suggestions_endpoint(
+    include_all: bool = False,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(require_admin_or_manager())
+):
+    """
+    Products to reorder, fewest days of stock left first, from the latest
+    `forecast_reorder_points` job. With `include_all=true`, every product
+    with recent demand. Admin or manager only.
+    """
+    return get_reorder_suggestions(db, include_all=include_all, skip=max(0, skip), limit=max(1, min(limit, 1000)))
+
+@app.get("/products/sku/{sku}", response_model=Product)
+def get_product_by_sku_endpoint(
+    sku: str,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Look up a product by SKU (barcode). Hot SKUs are served from an
+    in-process cache that is invalidated when the product changes.
+    """
+    repository = sharded_products()
+    product = repository.get_product_by_sku(sku) if repository is not None else get_product_by_sku_cached(db, sku)
+    if product is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product with SKU {sku} not found"
+        )
+    return product
+
+@app.post("/products/sku/batch", response_model=SkuLookupResponse)
+def get_products_by_skus_endpoint(
+    lookup: SkuLookupRequest,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Look up up to 500 SKUs at once. Unknown SKUs are listed in `missing`.
+    """
+    repository = sharded_products()
+    if repository is not None:
+        found = repository.get_products_by_skus(lookup.skus)
+        results = {sku: found.get(sku) for sku in lookup.skus}
+    else:
+        results = get_products_by_skus_cached(db, lookup.skus)
+    return {
+        "products": [product for product in results.values() if product is not None],
+        "missing": [sku for sku, product in results.items() if product is None],
+    }
+
+@app.post("/products/{product_id}/image", response_model=Product, dependencies=[Depends(primary_products_only)])
+async def upload_product_image(
+    product_id: int,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin_or_manager())
+):
+    """
+    Upload a product image. Thumbnails are generated once here and the
+    product's image_url/thumbnail_url point at content-hashed files. Admin and Manager only.
+    """
+    if not await run_in_threadpool(sampled_thread(get_product_by_id), db, product_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product with ID {product_id} not found"
+        )
+    data = await file.read(IMAGE_MAX_BYTES + 1)
+    if len(data) > IMAGE_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Image is larger than {IMAGE_MAX_BYTES} bytes"
+        )
+    try:
+        stored = await store_image(data)
+    except ImageTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except InvalidImage as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return await run_in_threadpool(
+        sampled_thread(set_product_image), db, product_id, stored.image_url, stored.thumbnail_url
+    )
+
+@app.get("/images/{name}")
+def get_image(name: str):
+    """
+    Serve an uploaded image or thumbnail. Names are content hashes, so
+    responses are cached as immutable.
+    """
+    path = image_path(name)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+    return FileResponse(path, headers={"Cache-Control": IMAGE_CACHE_CONTROL})
+
+# Location endpoints
+@app.post("/locations", response_model=Location, status_code=status.HTTP_201_CREATED)
+def add_location(
+    location: LocationCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin_or_manager())
+):
+    """
+    Add a stock location (warehouse, store). Admin and Manager only.
+    """
+    return create_location(db=db, location=location)
+
+@app.get("/locations", response_model=List[Location])
+def get_locations_endpoint(
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get all stock locations. All authenticated users.
+    """
+    return get_locations(db, skip=skip, limit=limit)
+
+@app.get("/products/{product_id}/locations", response_model=List[LocationStock], dependencies=[Depends(primary_products_only)])
+def get_product_stock_endpoint(
+    product_id: int,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a product's quantity at each location. All authenticated users.
+    """
+    return get_product_stock(db, product_id=product_id)
+
+@app.put("/products/{product_id}/locations/{location_id}/quantity", response_model=LocationStock, dependencies=[Depends(primary_products_only)])
+def update_location_quantity_endpoint(
+    product_id: int,
+    location_id: int,
+    product_update: ProductUpdate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin_or_manager())
+):
+    """
+    Update a product's quantity at one location. The product's total quantity
+    is adjusted by the same amount. Admin and Manager only.
+    """
+    return update_location_quantity(
+        db=db, product_id=product_id, location_id=location_id, quantity=product_update.quantity
+    )
+
+@app.get("/locations/{location_id}/low-stock", response_model=List[LocationStockWithProduct], dependencies=[Depends(primary_products_only)])
+def get_low_stock_endpoint(
+    location_id: int,
+    threshold: int = 10,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get products below `threshold` at a location, lowest first. All authenticated users.
+    """
+    return get_low_stock_at_location(db, location_id=location_id, threshold=threshold, skip=skip, limit=limit)
+
+# Reservation endpoints
+def _check_reservation_owner(reservation, current_user):
+    if reservation.user_id != current_user.id and current_user.role not in [UserRole.ADMIN.value, UserRole.MANAGER.value]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Access denied. Only the reservation owner or a manager can change it."
+        )
+
+@app.get("/products/{product_id}/availability", response_model=ProductAvailability, dependencies=[Depends(primary_products_only)])
+def get_product_availability_endpoint(
+    product_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Get a product's quantity, active holds and available stock. All authenticated users.
+    """
+    return get_product_availability(db, product_id=product_id)
+
+@app.post("/products/{product_id}/reservations", response_model=Reservation, status_code=status.HTTP_201_CREATED, dependencies=[Depends(primary_products_only)])
+def create_reservation_endpoint(
+    product_id: int,
+    reservation: ReservationCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Hold stock for a limited time (checkout). All authenticated users.
+    """
+    db_reservation = create_reservation(
+        db=db,
+        product_id=product_id,
+        quantity=reservation.quantity,
+        ttl_seconds=reservation.ttl_seconds or RESERVATION_TTL_SECONDS,
+        user_id=current_user.id
+    )
+    reservation_scheduler.schedule(db_reservation.expires_at)
+    return db_reservation
+
+@app.post("/reservations/{reservation_id}/confirm", response_model=Reservation, dependencies=[Depends(primary_products_only)])
+def confirm_reservation_endpoint(
+    reservation_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Turn a hold into a permanent stock decrement. Reservation owner, Admin and Manager.
+    """
+    _check_reservation_owner(get_reservation(db, reservation_id), current_user)
+    return confirm_reservation(db=db, reservation_id=reservation_id)
+
+@app.post("/reservations/{reservation_id}/release", response_model=Reservation, dependencies=[Depends(primary_products_only)])
+def release_reservation_endpoint(
+    reservation_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Give held stock back. Reservation owner, Admin and Manager.
+    """
+    _check_reservation_owner(get_reservation(db, reservation_id), current_user)
+    return release_reservation(db=db, reservation_id=reservation_id)
+
+# Background job endpoints
+@app.post("/jobs", response_model=Job, status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(primary_products_only)])
+def create_job_endpoint(
+    job: JobCreate,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin_or_manager())
+):
+    """
+    Queue a background job (export_products, import_products,
+    rebuild_reserved_quantities). Admin and Manager only.
+    """
+    if job.type not in job_handlers:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown job type {job.type}. Available: {', '.join(sorted(job_handlers))}"
+        )
+    return create_job(db=db, job_type=job.type, params=job.params, user_id=current_user.id)
+
+@app.get("/jobs/{job_id}", response_model=Job)
+def get_job_endpoint(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin_or_manager())
+):
+    """
+    Get a job's status, progress and result. Admin and Manager only.
+    """
+    return get_job(db, job_id=job_id)
+
+@app.post("/jobs/{job_id}/cancel", response_model=Job)
+def cancel_job_endpoint(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin_or_manager())
+):
+    """
+    Cancel a queued job, or ask a running one to stop. Admin and Manager only.
+    """
+    return cancel_job(db=db, job_id=job_id)
+
+@app.get("/jobs/{job_id}/download")
+def download_job_file(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin_or_manager())
+):
+    """
+    Download the file produced by a finished job (e.g. an export). Admin and Manager only.
+    """
+    result = Job.model_validate(get_job(db, job_id=job_id)).result
+    if not isinstance(result, dict) or not result.get("file") or not os.path.exists(result["file"]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Job {job_id} has no file to download"
+        )
+    return FileResponse(result["file"], filename=os.path.basename(result["file"]))
+
+@app.get("/cache/stats")
+def get_cache_stats(current_user: User = Depends(require_admin())):
+    """
+    Result cache hit ratio, memory use and evictions. Admin only.
+    """
+    return {**result_cache.stats(), "sku_cache": sku_cache.stats()}
+
+@app.get("/profiles")
+def get_profiles(current_user: User = Depends(require_admin())):
+    """
+    Stored request profiles, newest first. Admin only.
+    """
+    return list_profiles()
+
+@app.get("/profiles/{name}")
+def download_profile(name: str, current_user: User = Depends(require_admin())):
+    """
+    Download a stored profile (collapsed stacks or speedscope JSON). Admin only.
+    """
+    path = profile_path(name)
+    if path is None or not os.path.exists(path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {name} not found"
+        )
+    return FileResponse(path, filename=name)
+
+@app.get("/traces/{trace_id}")
+def get_trace(trace_id: str, current_user: User = Depends(require_admin())):
+    """
+    Spans of a recent trace, when TRACING_EXPORTER=memory. Admin only.
+    """
+    exporter = get_exporter()
+    if not isinstance(exporter, InMemoryExporter):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Traces are only kept in memory with TRACING_EXPORTER=memory"
+        )
+    spans = exporter.get_trace(trace_id)
+    if not spans:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Trace {trace_id} not found"
+        )
+    return [span.to_dict() for span in sorted(spans, key=lambda span: span.start_ns)]
+
+@app.get("/audit", response_model=AuditPage)
+def get_audit_log(
+    actor: Optional[str] = None,
+    action: Optional[str] = None,
+    entity: Optional[str] = None,
+    entity_id: Optional[int] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    before_id: Optional[int] = None,
+    limit: int = 100,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(require_admin())
+):
+    """
+    Audit trail, newest first. Pass `next_before_id` from a page as
+    `before_id` to fetch the next one. Admin only.
+    """
+    return get_audit_entries(
+        db, actor=actor, action=action, entity=entity, entity_id=entity_id,
+        since=since, until=until, before_id=before_id, limit=max(1, min(limit, 1000))
+    )
+
+@app.get("/audit/stats")
+def get_audit_stats(current_user: User = Depends(require_admin())):
+    """
+    Audit writer queue depth, entries written and dropped. Admin only.
+    """
+    return audit_writer.stats()
+
+@app.get("/coalescing/stats")
+def get_quantity_coalescing_stats(current_user: User = Depends(require_admin())):
+    """
+    Quantity updates received versus rows written by the coalescer. Admin only.
+    """
+    return quantity_coalescer.stats()
+
+@app.get("/admission/stats")
+def get_admission_stats(current_user: User = Depends(require_admin())):
+    """
+    Per-route concurrency limits, queue length and shed requests. Admin only.
+    """
+    return admission_controller.stats()
+
+def catalog_filters(
+    type: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    min_quantity: Optional[int] = None,
+    max_quantity: Optional[int] = None,
+    max_available: Optional[int] = None
+):
+    return {
+        "type": type, "min_price": min_price, "max_price": max_price,
+        "min_quantity": min_quantity, "max_quantity": max_quantity, "max_available": max_available,
+    }
+
+def query_catalog(query, *args, **kwargs):
+    """
+    Run a query on the catalog snapshot, timing it and mapping its errors.
+    """
+    if not CATALOG_SNAPSHOT_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Catalog snapshot is not enabled")
+    start = time.perf_counter()
+    try:
+        result = query(*args, **kwargs)
+    except CatalogUnavailable as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Catalog snapshot unavailable: {exc}",
+            headers={"Retry-After": "5"}
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    result["elapsed_us"] = round((time.perf_counter() - start) * 1e6)
+    return result
+
+@app.get("/catalog/top", dependencies=[Depends(primary_products_only)])
+def get_catalog_top(
+    by: str = "value",
+    order: str = "desc",
+    offset: int = 0,
+    limit: int = 10,
+    filters: dict = Depends(catalog_filters),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Products ranked by quantity, available, price or value (quantity * price),
+    optionally filtered, from the in-memory catalog snapshot. May lag the
+    latest writes by a moment.
+    """
+    if order not in ("asc", "desc"):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="order must be asc or desc")
+    return query_catalog(
+        catalog_snapshot.rank, by=by, descending=order == "desc",
+        offset=max(0, offset), limit=max(1, min(limit, 1000)), **filters
+    )
+
+@app.get("/catalog/aggregate", dependencies=[Depends(primary_products_only)])
+def get_catalog_aggregate(
+    low_stock_threshold: int = 10,
+    filters: dict = Depends(catalog_filters),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Stock and value totals with a per-type breakdown of the matching products,
+    from the in-memory catalog snapshot.
+    """
+    return query_catalog(catalog_snapshot.aggregate, low_stock_threshold=low_stock_threshold, **filters)
+
+@app.get("/catalog/histogram", dependencies=[Depends(primary_products_only)])
+def get_catalog_histogram(
+    column: str = "price",
+    bins: int = 20,
+    filters: dict = Depends(catalog_filters),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Distribution of quantity, available, price or value over the matching
+    products, from the in-memory catalog snapshot.
+    """
+    return query_catalog(catalog_snapshot.histogram, column=column, bins=max(1, min(bins, 200)), **filters)
+
+@app.get("/catalog/stats", dependencies=[Depends(primary_products_only)])
+def get_catalog_stats(current_user: User = Depends(require_admin())):
+    """
+    Size, memory use and freshness of the catalog snapshot. Admin only.
+    """
+    if not CATALOG_SNAPSHOT_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Catalog snapshot is not enabled")
+    return catalog_snapshot.stats()
+
+@app.get("/alerts/stats")
+def get_alert_stats(current_user: User = Depends(require_admin())):
+    """
+    Low-stock and restocked alerts raised, and per-sink deliveries,
+    failures and drops. Admin only.
+    """
+    return alert_dispatcher.stats()
+
+@app.get("/analytics/timeseries", dependencies=[Depends(primary_products_only)])
+def get_inventory_timeseries(
+    granularity: str = "hour",
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    type: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Units, value and SKU count per hour or day bucket between `start` and
+    `end` (default: the last 48 hours or 30 days), overall and per product
+    type, optionally for one type. Lags writes by up to ROLLUP_FLUSH_SECONDS.
+    """
+    if not ROLLUPS_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Inventory rollups are not enabled")
+    try:
+        return get_timeseries(db, granularity=granularity, start=start, end=end, product_type=type)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+@app.get("/shards/stats")
+def get_shard_stats(current_user: User = Depends(require_admin())):
+    """
+    Catalog totals across the product shards, gathered from every shard. Admin only.
+    """
+    shards = get_product_shards()
+    if shards is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Product sharding is not configured")
+    return ShardedProductRepository(shards).get_product_stats()
+
+@app.get("/database/stats")
+def get_database_stats(current_user: User = Depends(require_admin())):
+    """
+    Database backend and connection pool; in SQLite mode also the pragmas
+    in effect and writer lock contention. Admin only.
     """
-    products = get_products(db, skip=skip, limit=limit)
-    return products
+    return database_stats()
 
 @app.get("/health")
 def health_check():
@@ -318,6 +1030,8 @@ def health_check():
     return {
         "status": "healthy",
         "database_configured": bool(os.getenv("DATABASE_URL")),
+        "database_backend": engine.dialect.name,
         "google_oauth_configured": bool(os.getenv("GOOGLE_CLIENT_ID")),
+        "read_replicas": replica_router.status(),
         "environment": "production" if os.getenv("DATABASE_URL") else "development"
     } 
\ No newline at end of file
@@ -0,0 +1,14 @@
+"""
+Create the database schema, or bring one created by an earlier release up
+to date by adding the columns and indexes it is missing.
+
+Run this once per deploy instead of creating tables when the app is imported:
+
+    python -m app.migrate
+"""
+from app.database import init_db, DATABASE_URL
+
+
+if __name__ == "__main__":
+    init_db()
+    print(f"Database schema is up to date ({DATABASE_URL.split('@')[-1]})")
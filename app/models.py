@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Float, DateTime, Text, Enum, ForeignKey, UniqueConstraint, Index, LargeBinary, Boolean
+from sqlalchemy.orm import relationship, backref
 from sqlalchemy.sql import func
 from app.database import Base
 import enum
@@ -26,14 +27,249 @@ class User(Base):
 
 class Product(Base):
     __tablename__ = "products"
+    __table_args__ = (
+        # Delta sync reads rows changed after a watermark in (change_seq, id) order
+        Index("ix_products_change_seq_id", "change_seq", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     type = Column(String, nullable=False)
     sku = Column(String, unique=True, index=True, nullable=False)
     image_url = Column(String)
+    # Small thumbnail of an uploaded image, used by list views instead of image_url
+    thumbnail_url = Column(String, nullable=True)
     description = Column(Text)
     quantity = Column(Integer, default=0, nullable=False)
+    # Sum of active reservations, maintained with each hold so available = quantity - reserved_quantity
+    reserved_quantity = Column(Integer, default=0, server_default="0", nullable=False)
     price = Column(Float, nullable=False)
+    # Quantity below which the product is low on stock; NULL uses LOW_STOCK_THRESHOLD
+    reorder_threshold = Column(Integer, nullable=True)
+    # Sequence number of the last transaction that changed the row (app.changes)
+    change_seq = Column(BigInteger, default=0, server_default="0", nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now()) 
+
+class ProductTombstone(Base):
+    """
+    Marks a deleted product so delta sync clients can drop it.
+    """
+    __tablename__ = "product_tombstones"
+    __table_args__ = (
+        Index("ix_product_tombstones_change_seq_id", "change_seq", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)  # id of the deleted product
+    sku = Column(String, nullable=True)
+    change_seq = Column(BigInteger, nullable=False)
+    deleted_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ChangeSequence(Base):
+    """
+    Named counters handing out change sequence numbers, one per transaction.
+    """
+    __tablename__ = "change_sequences"
+
+    name = Column(String(50), primary_key=True)
+    value = Column(BigInteger, default=0, nullable=False)
+
+class Location(Base):
+    __tablename__ = "locations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True, nullable=False)
+    description = Column(Text)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ProductStock(Base):
+    """
+    Quantity of a product held at one location. Product.quantity is kept equal
+    to its previous value plus every change made here, in the same transaction.
+    """
+    __tablename__ = "product_stock"
+    __table_args__ = (
+        UniqueConstraint("product_id", "location_id", name="uq_product_stock_product_location"),
+        # Serves the per-location low-stock query as an index range scan
+        Index("ix_product_stock_location_quantity", "location_id", "quantity"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    location_id = Column(Integer, ForeignKey("locations.id", ondelete="CASCADE"), nullable=False)
+    quantity = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    product = relationship("Product", backref=backref("stock_levels", cascade="all, delete-orphan"))
+    location = relationship("Location")
+
+class ReservationStatus(enum.Enum):
+    ACTIVE = "active"
+    CONFIRMED = "confirmed"
+    RELEASED = "released"
+    EXPIRED = "expired"
+
+class StockReservation(Base):
+    __tablename__ = "stock_reservations"
+    __table_args__ = (
+        # Expiry only ever scans active holds that are due, oldest first
+        Index("ix_stock_reservations_status_expires_at", "status", "expires_at"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    quantity = Column(Integer, nullable=False)
+    status = Column(String, default=ReservationStatus.ACTIVE.value, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+class IdempotencyRecord(Base):
+    """
+    Stored response for an Idempotency-Key. A row with a NULL status_code is a
+    claim by a request that is still running.
+    """
+    __tablename__ = "idempotency_records"
+
+    key = Column(String(64), primary_key=True)
+    fingerprint = Column(String(64), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    headers = Column(Text, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class TokenRevocation(Base):
+    """
+    A revoked JWT (by jti) or, with issued_before set, every token of a user
+    issued before that time. Rows can be purged once expires_at has passed.
+    """
+    __tablename__ = "token_revocations"
+
+    id = Column(Integer, primary_key=True, index=True)
+    jti = Column(String(32), unique=True, nullable=True)
+    username = Column(String, nullable=True)
+    issued_before = Column(DateTime(timezone=True), nullable=True)
+    reason = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class StockDecrease(Base):
+    """
+    Units taken out of a product's stock, one row per product and day. The
+    demand history the reorder forecast reads.
+    """
+    __tablename__ = "stock_decreases"
+    __table_args__ = (
+        # One row per day, added to by each decrease; the forecast reads a
+        # range of product ids over a range of days
+        Index("ix_stock_decreases_product_day", "product_id", "day", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), nullable=False)
+    day = Column(Integer, nullable=False)  # days since 1970-01-01 UTC
+    quantity = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+class ReorderSuggestion(Base):
+    """
+    Latest demand forecast and reorder point of a product with recent demand,
+    written by the forecast batch (app.forecasting).
+    """
+    __tablename__ = "reorder_suggestions"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    daily_demand = Column(Float, nullable=False)
+    demand_std = Column(Float, nullable=False)
+    safety_stock = Column(Float, nullable=False)
+    reorder_point = Column(Float, nullable=False)
+    available = Column(Integer, nullable=False)
+    suggested_quantity = Column(Integer, nullable=False)
+    needs_reorder = Column(Boolean, nullable=False, index=True)
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+class InventoryTotal(Base):
+    """
+    Running units, value and SKU count of each product type, kept by
+    applying the deltas of product writes (app.rollups).
+    """
+    __tablename__ = "inventory_totals"
+
+    type = Column(String, primary_key=True)
+    units = Column(BigInteger, default=0, nullable=False)
+    value = Column(Float, default=0, nullable=False)
+    skus = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False)
+
+class InventoryRollup(Base):
+    """
+    Inventory totals of a product type as of the end of an hour or day
+    bucket. Only buckets with writes get a row; later buckets carry it forward.
+    """
+    __tablename__ = "inventory_rollups"
+
+    granularity = Column(String(8), primary_key=True)  # hour or day
+    bucket = Column(DateTime(timezone=True), primary_key=True)  # start of the bucket, UTC
+    type = Column(String, primary_key=True)
+    units = Column(BigInteger, nullable=False)
+    value = Column(Float, nullable=False)
+    skus = Column(Integer, nullable=False)
+
+class AuditLog(Base):
+    """
+    Who changed what. actor_id is not a foreign key so entries outlive the
+    users they mention.
+    """
+    __tablename__ = "audit_log"
+    __table_args__ = (
+        # Filtered queries page backwards by id
+        Index("ix_audit_log_entity_id", "entity", "entity_id", "id"),
+        Index("ix_audit_log_actor_id", "actor", "id"),
+        Index("ix_audit_log_action_id", "action", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, index=True)
+    actor_id = Column(Integer, nullable=True)
+    actor = Column(String, nullable=True)
+    action = Column(String(50), nullable=False)
+    entity = Column(String(50), nullable=False)
+    entity_id = Column(Integer, nullable=True)
+    details = Column(Text, nullable=True)  # JSON
+
+class JobStatus(enum.Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+class Job(Base):
+    """
+    Background job (import, export, rebuild) picked up by a worker from app.jobs.
+    """
+    __tablename__ = "jobs"
+    __table_args__ = (
+        # Workers poll for the oldest queued job and for stale running ones
+        Index("ix_jobs_status_id", "status", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    type = Column(String, nullable=False)
+    status = Column(String, default=JobStatus.QUEUED.value, nullable=False)
+    params = Column(Text, nullable=True)  # JSON
+    result = Column(Text, nullable=True)  # JSON
+    error = Column(Text, nullable=True)
+    progress_current = Column(Integer, default=0, nullable=False)
+    progress_total = Column(Integer, nullable=True)
+    message = Column(String, nullable=True)
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    worker_id = Column(String, nullable=True)
+    created_by = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    heartbeat_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,304 @@
+"""
+On-demand request profiling for admins.
+
+With PROFILING_ENABLED=true, a request from an admin that carries an
+`X-Profile` header runs under a sampling profiler. A background thread
+snapshots, every PROFILING_INTERVAL_MS, the stacks of the threads working
+on that request only: the event loop thread while the request's task is
+the one running, and threadpool workers while they run its sync endpoint
+or sync dependencies (ProfiledRoute marks them, see sampled_thread).
+Concurrent requests and background threads stay out of the profile.
+
+The profile is written to PROFILE_DIR as collapsed stacks (`X-Profile:
+collapsed`, the default; for flamegraph.pl or speedscope) or speedscope
+JSON (`X-Profile: speedscope`). The response carries its name in
+`X-Profile-Id`; fetch it from GET /profiles/{name}. `X-Profile-Status`
+says why a request wasn't profiled.
+
+Profiles are rate-limited (PROFILING_MAX_PER_MINUTE) and run one at a time.
+When PROFILING_ENABLED is off the middleware isn't installed at all.
+"""
+import asyncio
+import functools
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextvars import ContextVar
+
+from fastapi import HTTPException
+from fastapi.dependencies.utils import is_async_gen_callable, is_coroutine_callable, is_gen_callable
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+
+from app.auth import decode_token
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", "2"))
+PROFILING_MAX_PER_MINUTE = int(os.getenv("PROFILING_MAX_PER_MINUTE", "6"))
+PROFILING_KEEP = int(os.getenv("PROFILING_KEEP", "50"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "inventory-profiles"))
+
+PROFILE_NAME_PATTERN = re.compile(r"^profile-\d+-[0-9a-f]{8}\.(txt|speedscope\.json)$")
+# Sampler of the profiled request the current context belongs to; copied into threadpool workers
+_request_sampler: ContextVar = ContextVar("profiled_request_sampler", default=None)
+_PATH_PREFIXES = sorted({p for p in sys.path if p and os.path.isdir(p)}, key=len, reverse=True)
+
+
+def _short_path(path):
+    for prefix in _PATH_PREFIXES:
+        if path.startswith(prefix):
+            return path[len(prefix):].lstrip(os.sep)
+    return path
+
+
+class StackSampler:
+    """
+    Samples the stacks of one request's threads until stopped: `loop_thread`
+    while `task` is the task running on it, and the threads marked with
+    add_thread.
+    """
+
+    def __init__(self, interval_seconds: float, loop_thread: int = None, loop=None, task=None):
+        self.interval_seconds = interval_seconds
+        self.samples = Counter()  # tuple of frames, outermost first -> count
+        self.started = self.stopped = None
+        self._loop_thread = loop_thread
+        self._loop = loop
+        self._task = task
+        self._threads = Counter()  # thread ident -> calls it is running for the request
+        self._threads_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def add_thread(self, thread_id: int):
+        with self._threads_lock:
+            self._threads[thread_id] += 1
+
+    def remove_thread(self, thread_id: int):
+        with self._threads_lock:
+            self._threads[thread_id] -= 1
+            if not self._threads[thread_id]:
+                del self._threads[thread_id]
+
+    def start(self):
+        self.started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.stopped = time.perf_counter()
+
+    def _run(self):
+        labels = {}
+        while not self._stop.wait(self.interval_seconds):
+            with self._threads_lock:
+                thread_ids = list(self._threads)
+            if self._loop_thread is not None and asyncio.current_task(self._loop) is self._task:
+                thread_ids.append(self._loop_thread)
+            frames = sys._current_frames()
+            for thread_id in thread_ids:
+                frame = frames.get(thread_id)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    label = labels.get(code)
+                    if label is None:
+                        label = labels[code] = (
+                            code.co_name, _short_path(code.co_filename), code.co_firstlineno
+                        )
+                    stack.append(label)
+                    frame = frame.f_back
+                if stack:
+                    self.samples[tuple(reversed(stack))] += 1
+
+    def collapsed(self):
+        lines = [
+            ";".join(f"{name} ({path}:{line})" for name, path, line in stack) + f" {count}"
+            for stack, count in self.samples.most_common()
+        ]
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str):
+        frames, index = [], {}
+        samples, weights = [], []
+        for stack, count in self.samples.items():
+            indexes = []
+            for frame in stack:
+                if frame not in index:
+                    index[frame] = len(frames)
+                    frames.append({"name": frame[0], "file": frame[1], "line": frame[2]})
+                indexes.append(index[frame])
+            samples.append(indexes)
+            weights.append(count * self.interval_seconds)
+        return json.dumps({
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }],
+            "exporter": "inventory-api",
+        })
+
+
+class RateLimiter:
+    def __init__(self, max_per_minute: int):
+        self.max_per_minute = max_per_minute
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def allow(self):
+        now = time.monotonic()
+        with self._lock:
+            while self._recent and now - self._recent[0] > 60:
+                self._recent.popleft()
+            if len(self._recent) >= self.max_per_minute:
+                return False
+            self._recent.append(now)
+            return True
+
+
+def _is_admin(authorization: bytes):
+    scheme, _, token = authorization.decode("latin-1").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        # Role changes revoke old tokens, so the role claim can be trusted
+        token_data = decode_token(token)
+    except HTTPException:
+        return False
+    return token_data.role is not None and token_data.role.value == "admin"
+
+
+def sampled_thread(func):
+    """
+    Wrap a sync callable so that, when it runs in a threadpool worker on
+    behalf of a profiled request, the worker's stack is sampled meanwhile.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        sampler = _request_sampler.get()
+        if sampler is None:
+            return func(*args, **kwargs)
+        thread_id = threading.get_ident()
+        sampler.add_thread(thread_id)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            sampler.remove_thread(thread_id)
+    return wrapper
+
+
+def _sample_sync_calls(dependant):
+    for sub_dependant in dependant.dependencies:
+        _sample_sync_calls(sub_dependant)
+    call = dependant.call
+    # Generator dependencies are left alone: FastAPI tells them apart by their type
+    if call is None or is_coroutine_callable(call) or is_gen_callable(call) or is_async_gen_callable(call):
+        return
+    dependant.call = sampled_thread(call)
+
+
+class ProfiledRoute(APIRoute):
+    """
+    APIRoute whose sync endpoint and sync dependencies are wrapped with
+    sampled_thread, so the profiler follows a request into the threadpool.
+    """
+
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, endpoint, **kwargs)
+        _sample_sync_calls(self.dependant)
+
+
+class ProfilingMiddleware:
+    def __init__(self, app, interval_ms: float = PROFILING_INTERVAL_MS,
+                 max_per_minute: int = PROFILING_MAX_PER_MINUTE, directory: str = PROFILE_DIR):
+        self.app = app
+        self.interval_seconds = interval_ms / 1000
+        self.directory = directory
+        self.rate_limiter = RateLimiter(max_per_minute)
+        self._running = threading.Lock()
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope["headers"])
+        requested = headers.get(b"x-profile")
+        if requested is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+        # decode_token may sync the revocation list from the database
+        if not await run_in_threadpool(_is_admin, headers.get(b"authorization", b"")):
+            status = "forbidden"
+        elif not self.rate_limiter.allow():
+            status = "rate-limited"
+        elif not self._running.acquire(blocking=False):
+            status = "busy"
+        if status is not None:
+            await self.app(scope, receive, self._with_headers(send, [(b"x-profile-status", status.encode())]))
+            return
+
+        fmt = "speedscope" if requested.strip().lower() == b"speedscope" else "collapsed"
+        extension = "speedscope.json" if fmt == "speedscope" else "txt"
+        name = f"profile-{int(time.time())}-{uuid.uuid4().hex[:8]}.{extension}"
+        sampler = StackSampler(
+            self.interval_seconds, threading.get_ident(), asyncio.get_running_loop(), asyncio.current_task()
+        )
+        token = _request_sampler.set(sampler)
+        sampler.start()
+        try:
+            await self.app(scope, receive, self._with_headers(send, [
+                (b"x-profile-status", b"stored"), (b"x-profile-id", name.encode()),
+            ]))
+        finally:
+            sampler.stop()
+            _request_sampler.reset(token)
+            self._running.release()
+            title = f"{scope['method']} {scope['path']}"
+            content = sampler.speedscope(title) if fmt == "speedscope" else sampler.collapsed()
+            await run_in_threadpool(self._store, name, content)
+
+    @staticmethod
+    def _with_headers(send, extra):
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": list(message.get("headers", [])) + extra}
+            await send(message)
+        return send_with_headers
+
+    def _store(self, name, content):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), "w") as f:
+            f.write(content)
+        # Keep only the newest profiles
+        names = sorted(n for n in os.listdir(self.directory) if PROFILE_NAME_PATTERN.match(n))
+        for old in names[:-PROFILING_KEEP]:
+            os.remove(os.path.join(self.directory, old))
+
+
+def list_profiles():
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    names = sorted((n for n in os.listdir(PROFILE_DIR) if PROFILE_NAME_PATTERN.match(n)), reverse=True)
+    return [{"name": n, "bytes": os.path.getsize(os.path.join(PROFILE_DIR, n))} for n in names]
+
+
+def profile_path(name: str):
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+    return os.path.join(PROFILE_DIR, name)
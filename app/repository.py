@@ -0,0 +1,145 @@
+"""
+Product repository interface and an indexed in-memory implementation.
+
+`app.crud.SQLProductRepository` implements the same interface on top of
+SQLAlchemy. The in-memory backend is used by the lightweight deployments in
+`api/stable.py` and `api/working.py`, which don't ship SQLAlchemy, so this
+module must only depend on FastAPI and the standard library.
+"""
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, List, Optional
+
+from fastapi import HTTPException, status
+
+
+class ProductRepository(ABC):
+    """
+    Storage operations for products. Implementations raise the same
+    HTTPExceptions so endpoints behave identically on every backend. A
+    backend missing one of the methods can't be instantiated.
+    """
+
+    @abstractmethod
+    def get_products(self, skip: int = 0, limit: int = 100) -> List:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_product_by_id(self, product_id: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_product_by_sku(self, sku: str):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_product(self, product: dict):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_product_quantity(self, product_id: int, quantity: int):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_product(self, product_id: int):
+        raise NotImplementedError
+
+
+def product_not_found(product_id: int):
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail=f"Product with ID {product_id} not found"
+    )
+
+
+def below_reserved(product_id: int, quantity: int, reserved: int):
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"Quantity {quantity} of product {product_id} is below the {reserved} units reserved"
+    )
+
+
+def duplicate_sku(sku: str):
+    return HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail=f"Product with SKU {sku} already exists"
+    )
+
+
+class InMemoryProductRepository(ProductRepository):
+    """
+    Products kept in dicts indexed by id and by SKU.
+
+    Ids come from a monotonic counter so they are never reused after a
+    delete, and every mutation holds a lock so concurrent requests can't
+    race on the SKU check or the id allocation. Products are returned as
+    copies so callers can't modify the indexed rows behind the lock.
+    """
+
+    def __init__(self, products: Iterable[dict] = ()):
+        self._lock = threading.Lock()
+        self._by_id = {}  # insertion ordered, so pagination follows id order
+        self._by_sku = {}
+        self._next_id = 1
+        for product in products:
+            self._insert(dict(product))
+
+    def _insert(self, product: dict):
+        if product["sku"] in self._by_sku:
+            raise duplicate_sku(product["sku"])
+        if product.get("id") is None:
+            product["id"] = self._next_id
+        self._next_id = max(self._next_id, product["id"] + 1)
+        self._by_id[product["id"]] = product
+        self._by_sku[product["sku"]] = product
+        return product
+
+    def get_products(self, skip: int = 0, limit: int = 100) -> List[dict]:
+        with self._lock:
+            return [dict(p) for p in islice(self._by_id.values(), skip, skip + limit)]
+
+    def get_product_by_id(self, product_id: int) -> Optional[dict]:
+        product = self._by_id.get(product_id)
+        return dict(product) if product else None
+
+    def get_product_by_sku(self, sku: str) -> Optional[dict]:
+        product = self._by_sku.get(sku)
+        return dict(product) if product else None
+
+    def create_product(self, product: dict) -> dict:
+        db_product = {
+            "id": None,
+            "name": product.get("name"),
+            "type": product.get("type"),
+            "sku": product.get("sku"),
+            "image_url": product.get("image_url"),
+            "description": product.get("description"),
+            "quantity": product.get("quantity", 0),
+            "price": product.get("price", 0.0),
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "updated_at": None,
+        }
+        with self._lock:
+            return dict(self._insert(db_product))
+
+    def update_product_quantity(self, product_id: int, quantity: int) -> dict:
+        with self._lock:
+            product = self._by_id.get(product_id)
+            if not product:
+                raise product_not_found(product_id)
+            product["quantity"] = quantity
+            product["updated_at"] = datetime.utcnow().isoformat() + "Z"
+            return dict(product)
+
+    def delete_product(self, product_id: int):
+        with self._lock:
+            product = self._by_id.pop(product_id, None)
+            if not product:
+                raise product_not_found(product_id)
+            del self._by_sku[product["sku"]]
+        return {"message": "Product deleted successfully"}
+
+    def __len__(self):
+        return len(self._by_id)
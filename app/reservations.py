@@ -0,0 +1,89 @@
+"""
+Background expiry of stock reservations.
+
+Deadlines of holds created by this worker are kept in a min-heap, so the
+task sleeps exactly until the next one is due instead of sweeping the table
+on a timer. Holds created by other workers (or before a restart) are picked
+up by a slower fallback pass; both passes use the indexed scan in
+`crud.expire_reservations`, which only touches due rows.
+"""
+import asyncio
+import heapq
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from starlette.concurrency import run_in_threadpool
+
+from app.database import SessionLocal
+from app.crud import expire_reservations, get_next_reservation_expiry
+
+logger = logging.getLogger(__name__)
+
+RESERVATION_TTL_SECONDS = int(os.getenv("RESERVATION_TTL_SECONDS", "300"))
+RESERVATION_SWEEP_SECONDS = float(os.getenv("RESERVATION_SWEEP_SECONDS", "30"))
+
+
+class ReservationExpiryScheduler:
+    def __init__(self, max_sleep_seconds: float = RESERVATION_SWEEP_SECONDS):
+        self.max_sleep_seconds = max_sleep_seconds
+        self._deadlines = []  # min-heap of time.time() deadlines
+        self._lock = threading.Lock()
+        self._loop = None
+        self._wakeup = None
+
+    def schedule(self, expires_at: datetime):
+        """
+        Register a new hold's deadline. Safe to call from request threads.
+        """
+        deadline = expires_at.replace(tzinfo=expires_at.tzinfo or timezone.utc).timestamp()
+        with self._lock:
+            is_earliest = not self._deadlines or deadline < self._deadlines[0]
+            heapq.heappush(self._deadlines, deadline)
+        if is_earliest and self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _next_sleep(self):
+        with self._lock:
+            if not self._deadlines:
+                return self.max_sleep_seconds
+            return min(max(self._deadlines[0] - time.time(), 0), self.max_sleep_seconds)
+
+    def _pop_due(self):
+        now = time.time()
+        with self._lock:
+            while self._deadlines and self._deadlines[0] <= now:
+                heapq.heappop(self._deadlines)
+
+    def _expire(self):
+        db = SessionLocal()
+        try:
+            expired = expire_reservations(db)
+            next_expiry = get_next_reservation_expiry(db)
+        finally:
+            db.close()
+        if next_expiry is not None:
+            self.schedule(next_expiry)
+        return expired
+
+    async def run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._next_sleep())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            self._pop_due()
+            try:
+                expired = await run_in_threadpool(self._expire)
+                if expired:
+                    logger.info("Expired %d stock reservations", expired)
+            except Exception:
+                logger.exception("Reservation expiry failed")
+
+
+reservation_scheduler = ReservationExpiryScheduler()
@@ -0,0 +1,116 @@
+"""
+Revoked JWTs, checked in memory.
+
+Revocations are rows in the token_revocations table: either one token by
+its `jti` (logout, refresh-token rotation) or every token of a user issued
+before a point in time (role change, deletion). Each worker keeps them in a
+dict, so `verify_token` checks revocation without a database round-trip.
+
+The in-memory copy is loaded on first use and then synced incrementally
+(rows with an id above the last one seen) whenever the invalidation bus
+reports a new revocation, so logout and role changes take effect on every
+worker immediately.
+"""
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.invalidation import invalidation_bus, publish, InvalidationEvent
+from app.models import TokenRevocation
+
+
+def _timestamp(value: datetime):
+    if value is None:
+        return None
+    # SQLite hands back naive datetimes; everything is stored in UTC
+    return value.replace(tzinfo=value.tzinfo or timezone.utc).timestamp()
+
+
+class RevocationList:
+    def __init__(self):
+        self._jtis = {}  # jti -> expiry timestamp
+        self._issued_before = {}  # username -> tokens issued before this timestamp are revoked
+        self._last_id = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def is_revoked(self, jti: str, username: str, issued_at: float) -> bool:
+        if not self._loaded:
+            self.sync()
+        if jti is not None and jti in self._jtis:
+            return True
+        cutoff = self._issued_before.get(username)
+        return cutoff is not None and (issued_at is None or issued_at < cutoff)
+
+    def _apply(self, jti=None, username=None, issued_before=None, expires_at=None):
+        if jti is not None:
+            self._jtis[jti] = expires_at
+        if username is not None and issued_before is not None:
+            self._issued_before[username] = max(issued_before, self._issued_before.get(username, 0))
+
+    def sync(self):
+        with self._lock:
+            db = SessionLocal()
+            try:
+                rows = (
+                    db.query(TokenRevocation)
+                    .filter(TokenRevocation.id > self._last_id)
+                    .order_by(TokenRevocation.id)
+                    .all()
+                )
+            finally:
+                db.close()
+            for row in rows:
+                self._apply(row.jti, row.username, _timestamp(row.issued_before), _timestamp(row.expires_at))
+                self._last_id = row.id
+            self._loaded = True
+            self._prune()
+
+    def _prune(self):
+        now = time.time()
+        self._jtis = {jti: expires for jti, expires in self._jtis.items() if expires is None or expires > now}
+
+    def on_invalidation(self, invalidation: InvalidationEvent):
+        if invalidation.entity in ("token", "*"):
+            self.sync()
+
+    def stats(self):
+        return {"revoked_tokens": len(self._jtis), "users_with_cutoff": len(self._issued_before)}
+
+
+revocation_list = RevocationList()
+invalidation_bus.subscribe(revocation_list.on_invalidation)
+
+
+def _add_revocation(db: Session, revocation: TokenRevocation):
+    db.add(revocation)
+    db.flush()
+    publish(db, InvalidationEvent("token", (revocation.id,)))
+    # Drop rows nobody can present a token for any more
+    if revocation.id % 100 == 0:
+        db.query(TokenRevocation).filter(
+            TokenRevocation.expires_at < datetime.now(timezone.utc)
+        ).delete(synchronize_session=False)
+    return revocation
+
+
+def revoke_token(db: Session, jti: str, expires_at: datetime, username: str = None, reason: str = None):
+    """
+    Revoke one token. The caller commits.
+    """
+    return _add_revocation(db, TokenRevocation(jti=jti, username=username, expires_at=expires_at, reason=reason))
+
+
+def revoke_user_tokens(db: Session, username: str, keep_for: timedelta, reason: str = None):
+    """
+    Revoke every token issued to `username` so far. `keep_for` is the
+    longest token lifetime, after which the row is no longer needed. The
+    caller commits.
+    """
+    now = datetime.now(timezone.utc)
+    return _add_revocation(db, TokenRevocation(
+        username=username, issued_before=now, expires_at=now + keep_for, reason=reason
+    ))
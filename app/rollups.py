@@ -0,0 +1,404 @@
+"""
+Hourly and daily inventory rollups per product type.
+
+Product writes call `track_inventory_change(db, type, units, value, skus)`
+with what they add to or take from their type's totals, next to the write
+like `audit`. The deltas are summed per type on the session and handed to
+the RollupWriter once the transaction commits. Every ROLLUP_FLUSH_SECONDS
+the writer applies them to inventory_totals with relative UPDATEs (one per
+type touched, safe with several workers), then stores the new totals as
+the value of the current hour and day bucket in inventory_rollups. The
+request path never touches these tables, and the latest bucket lags writes
+by at most one flush.
+
+A bucket holds the totals as of the last write in it. Buckets without writes
+get no row and take the value of the previous one, so a range query reads
+the rows in the range plus one base row per type, and costs the same per
+bucket however much history there is. Once an hour (ROLLUP_COMPACT_SECONDS)
+hourly rows older than ROLLUP_HOURLY_RETENTION_DAYS are deleted, after each
+type's last value before the cutoff is carried forward to it. Daily rows
+are kept for ROLLUP_DAILY_RETENTION_DAYS, or forever when 0.
+
+Totals are seeded from the products table when the first writer starts on
+an empty inventory_totals, before its process takes writes. The
+`rebuild_inventory_rollups` job (or `python -m app.rollups rebuild`) resets
+them from the products table to repair drift. Deltas that other workers have not flushed yet are counted
+again after a rebuild, so run it while writes are quiet.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import event, func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import InventoryRollup, InventoryTotal, Product
+
+logger = logging.getLogger(__name__)
+
+ROLLUPS_ENABLED = os.getenv("ROLLUPS_ENABLED", "true").lower() == "true"
+ROLLUP_FLUSH_SECONDS = float(os.getenv("ROLLUP_FLUSH_SECONDS", "5"))
+ROLLUP_COMPACT_SECONDS = float(os.getenv("ROLLUP_COMPACT_SECONDS", "3600"))
+ROLLUP_HOURLY_RETENTION_DAYS = int(os.getenv("ROLLUP_HOURLY_RETENTION_DAYS", "31"))
+ROLLUP_DAILY_RETENTION_DAYS = int(os.getenv("ROLLUP_DAILY_RETENTION_DAYS", "0"))
+ROLLUP_MAX_BUCKETS = int(os.getenv("ROLLUP_MAX_BUCKETS", "2000"))
+
+GRANULARITIES = {"hour": 3600, "day": 86400}
+# Buckets returned when the range isn't given
+DEFAULT_BUCKETS = {"hour": 48, "day": 30}
+
+
+def _utc(moment: datetime) -> datetime:
+    # SQLite hands back naive datetimes; everything here is UTC
+    return moment.replace(tzinfo=timezone.utc) if moment.tzinfo is None else moment.astimezone(timezone.utc)
+
+
+def bucket_start(moment: datetime, granularity: str) -> datetime:
+    size = GRANULARITIES[granularity]
+    seconds = int(_utc(moment).timestamp())
+    return datetime.fromtimestamp(seconds - seconds % size, timezone.utc)
+
+
+def track_inventory_change(db: Session, product_type: str, units: int = 0, value: float = 0.0, skus: int = 0):
+    """
+    Add units, value and SKUs to `product_type`'s totals (negative to take
+    them away) once this transaction commits.
+    """
+    pending = db.info.setdefault("pending_inventory_changes", {})
+    delta = pending.setdefault(product_type, [0, 0.0, 0])
+    delta[0] += units
+    delta[1] += value
+    delta[2] += skus
+
+
+def track_product(db: Session, product, sign: int = 1):
+    """
+    Add a whole product to its type's totals (sign=-1 removes it).
+    """
+    track_inventory_change(db, product.type, sign * product.quantity, sign * product.quantity * product.price, sign)
+
+
+def _retry_integrity(apply):
+    """
+    Run `apply(db)` in a transaction, once more if a concurrent writer
+    inserted the same new row first.
+    """
+    for attempt in range(2):
+        db = SessionLocal()
+        try:
+            result = apply(db)
+            db.commit()
+            return result
+        except IntegrityError:
+            db.rollback()
+            if attempt:
+                raise
+        finally:
+            db.close()
+
+
+def _write_buckets(db: Session, totals, now: datetime):
+    for granularity in GRANULARITIES:
+        bucket = bucket_start(now, granularity)
+        for total in totals:
+            values = {"units": total.units, "value": total.value, "skus": total.skus}
+            updated = db.query(InventoryRollup).filter(
+                InventoryRollup.granularity == granularity,
+                InventoryRollup.bucket == bucket,
+                InventoryRollup.type == total.type,
+            ).update(values, synchronize_session=False)
+            if not updated:
+                db.add(InventoryRollup(granularity=granularity, bucket=bucket, type=total.type, **values))
+
+
+def apply_deltas(deltas: dict, now: datetime = None):
+    """
+    Add {type: [units, value, skus]} to inventory_totals and record the
+    results in the current hour and day buckets.
+    """
+    now = now or datetime.now(timezone.utc)
+
+    def apply(db):
+        # Rows are locked in type order so concurrent flushes can't deadlock
+        for product_type in sorted(deltas):
+            units, value, skus = deltas[product_type]
+            updated = db.query(InventoryTotal).filter(InventoryTotal.type == product_type).update({
+                InventoryTotal.units: InventoryTotal.units + units,
+                InventoryTotal.value: InventoryTotal.value + value,
+                InventoryTotal.skus: InventoryTotal.skus + skus,
+                InventoryTotal.updated_at: now,
+            }, synchronize_session=False)
+            if not updated:
+                db.add(InventoryTotal(type=product_type, units=units, value=value, skus=skus, updated_at=now))
+        db.flush()
+        totals = (
+            db.query(InventoryTotal)
+            .filter(InventoryTotal.type.in_(list(deltas)))
+            .order_by(InventoryTotal.type)
+            .all()
+        )
+        _write_buckets(db, totals, now)
+
+    _retry_integrity(apply)
+
+
+def _reset_totals(db: Session, now: datetime):
+    actual = {
+        product_type: (int(units), float(value), skus)
+        for product_type, units, value, skus in db.query(
+            Product.type,
+            func.coalesce(func.sum(Product.quantity), 0),
+            func.coalesce(func.sum(Product.quantity * Product.price), 0),
+            func.count(Product.id),
+        ).group_by(Product.type)
+    }
+    existing = {total.type: total for total in db.query(InventoryTotal).order_by(InventoryTotal.type)}
+    corrected = []
+    for product_type in sorted(set(actual) | set(existing)):
+        units, value, skus = actual.get(product_type, (0, 0.0, 0))
+        total = existing.get(product_type)
+        if total is None:
+            total = InventoryTotal(type=product_type)
+            db.add(total)
+        elif (total.units, total.skus) == (units, skus) and abs(total.value - value) < 0.005:
+            continue
+        corrected.append(product_type)
+        total.units, total.value, total.skus, total.updated_at = units, value, skus, now
+    db.flush()
+    _write_buckets(db, db.query(InventoryTotal).order_by(InventoryTotal.type).all(), now)
+    return {"types": len(actual), "corrected": corrected}
+
+
+def rebuild_totals(now: datetime = None):
+    """
+    Reset inventory_totals from the products table and record them in the
+    current buckets. Returns the types whose totals were off.
+    """
+    now = now or datetime.now(timezone.utc)
+    return _retry_integrity(lambda db: _reset_totals(db, now))
+
+
+def seed_totals(now: datetime = None):
+    """
+    Fill an empty inventory_totals from the products table. Only one process
+    seeds: the others collide on the rows it inserted, retry and find them.
+    Returns None when the totals were already there.
+    """
+    now = now or datetime.now(timezone.utc)
+
+    def apply(db):
+        if db.query(InventoryTotal.type).first() is not None:
+            return None
+        return _reset_totals(db, now)
+
+    return _retry_integrity(apply)
+
+
+def compact(now: datetime = None):
+    """
+    Delete rollup rows past their retention, first carrying each type's last
+    value before the cutoff forward to it so series stay complete.
+    """
+    now = now or datetime.now(timezone.utc)
+    deleted = 0
+    for granularity, days in (("hour", ROLLUP_HOURLY_RETENTION_DAYS), ("day", ROLLUP_DAILY_RETENTION_DAYS)):
+        if days <= 0:
+            continue
+        cutoff = bucket_start(now - timedelta(days=days), granularity)
+
+        def apply(db):
+            latest = (
+                db.query(InventoryRollup.type, func.max(InventoryRollup.bucket).label("bucket"))
+                .filter(InventoryRollup.granularity == granularity, InventoryRollup.bucket < cutoff)
+                .group_by(InventoryRollup.type)
+                .subquery()
+            )
+            carried = (
+                db.query(InventoryRollup)
+                .join(latest, (InventoryRollup.type == latest.c.type) & (InventoryRollup.bucket == latest.c.bucket))
+                .filter(InventoryRollup.granularity == granularity)
+                .all()
+            )
+            at_cutoff = {
+                product_type for (product_type,) in db.query(InventoryRollup.type).filter(
+                    InventoryRollup.granularity == granularity, InventoryRollup.bucket == cutoff)
+            }
+            for row in carried:
+                if row.type not in at_cutoff:
+                    db.add(InventoryRollup(granularity=granularity, bucket=cutoff, type=row.type,
+                                           units=row.units, value=row.value, skus=row.skus))
+            return db.query(InventoryRollup).filter(
+                InventoryRollup.granularity == granularity, InventoryRollup.bucket < cutoff
+            ).delete(synchronize_session=False)
+
+        deleted += _retry_integrity(apply)
+    return deleted
+
+
+def get_timeseries(db: Session, granularity: str = "hour", start: datetime = None, end: datetime = None,
+                   product_type: str = None):
+    """
+    Units, value and SKU count at the end of each bucket from `start` to
+    `end` (inclusive, aligned down to bucket boundaries), overall and per type.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity {granularity}; use one of {', '.join(GRANULARITIES)}")
+    size = timedelta(seconds=GRANULARITIES[granularity])
+    end = bucket_start(end or datetime.now(timezone.utc), granularity)
+    start = bucket_start(start, granularity) if start else end - size * (DEFAULT_BUCKETS[granularity] - 1)
+    if start > end:
+        raise ValueError("start must not be after end")
+    count = (end - start) // size + 1
+    if count > ROLLUP_MAX_BUCKETS:
+        raise ValueError(f"Range spans {count} buckets; at most {ROLLUP_MAX_BUCKETS} are allowed")
+
+    def rollups():
+        query = db.query(InventoryRollup).filter(InventoryRollup.granularity == granularity)
+        if product_type is not None:
+            query = query.filter(InventoryRollup.type == product_type)
+        return query
+
+    latest = (
+        rollups().with_entities(InventoryRollup.type, func.max(InventoryRollup.bucket).label("bucket"))
+        .filter(InventoryRollup.bucket < start)
+        .group_by(InventoryRollup.type)
+        .subquery()
+    )
+    base = rollups().join(
+        latest, (InventoryRollup.type == latest.c.type) & (InventoryRollup.bucket == latest.c.bucket)
+    ).all()
+    rows = rollups().filter(InventoryRollup.bucket.between(start, end)).order_by(InventoryRollup.bucket).all()
+
+    current = {row.type: row for row in base}
+    points = []
+    index = 0
+    for step in range(count):
+        bucket = start + size * step
+        while index < len(rows) and _utc(rows[index].bucket) <= bucket:
+            current[rows[index].type] = rows[index]
+            index += 1
+        by_type = {
+            row.type: {"units": row.units, "value": round(row.value, 2), "skus": row.skus}
+            for row in current.values() if row.skus or row.units
+        }
+        points.append({
+            "bucket": bucket,
+            "units": sum(entry["units"] for entry in by_type.values()),
+            "value": round(sum(entry["value"] for entry in by_type.values()), 2),
+            "skus": sum(entry["skus"] for entry in by_type.values()),
+            "by_type": by_type,
+        })
+    return {
+        "granularity": granularity,
+        "start": start,
+        "end": end,
+        "flushed_at": rollup_writer.last_flush_at,
+        "points": points,
+    }
+
+
+class RollupWriter:
+    """
+    Collects committed deltas in memory and applies them every
+    `flush_seconds` on a background thread; compacts every `compact_seconds`.
+    """
+
+    def __init__(self, flush_seconds: float = ROLLUP_FLUSH_SECONDS, compact_seconds: float = ROLLUP_COMPACT_SECONDS):
+        self.flush_seconds = flush_seconds
+        self.compact_seconds = compact_seconds
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_at = None
+
+    def add(self, deltas: dict):
+        with self._lock:
+            for product_type, (units, value, skus) in deltas.items():
+                pending = self._pending.setdefault(product_type, [0, 0.0, 0])
+                pending[0] += units
+                pending[1] += value
+                pending[2] += skus
+
+    def start(self):
+        # Seeded before the process takes writes: a delta committed before
+        # the seed's read of products would otherwise be counted twice
+        try:
+            result = seed_totals()
+            if result is not None:
+                logger.info("Seeded inventory totals of %s product types", result["types"])
+        except Exception:
+            logger.exception("Seeding inventory totals failed")
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="rollup-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """
+        Apply what is still pending, then stop the writer thread.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        next_compact = time.monotonic()
+        while True:
+            stopping = self._stop.wait(self.flush_seconds)
+            self.flush()
+            if time.monotonic() >= next_compact:
+                next_compact = time.monotonic() + self.compact_seconds
+                try:
+                    compact()
+                except Exception:
+                    logger.exception("Compacting inventory rollups failed")
+            if stopping:
+                return
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return
+        try:
+            apply_deltas(pending)
+            self.flushes += 1
+            self.last_flush_at = datetime.now(timezone.utc)
+        except Exception:
+            self.failed_flushes += 1
+            logger.exception("Applying inventory deltas of %s types failed; retrying next flush", len(pending))
+            self.add(pending)
+
+
+rollup_writer = RollupWriter()
+
+
+@event.listens_for(Session, "after_commit")
+def _queue_inventory_changes(session):
+    pending = session.info.pop("pending_inventory_changes", None)
+    if pending and ROLLUPS_ENABLED:
+        rollup_writer.add(pending)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_inventory_changes(session):
+    session.info.pop("pending_inventory_changes", None)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Maintain inventory rollups")
+    parser.add_argument("command", choices=["rebuild", "compact"])
+    args = parser.parse_args()
+    if args.command == "rebuild":
+        print(rebuild_totals())
+    else:
+        print(f"Deleted {compact()} expired rollup rows")
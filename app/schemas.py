@@ -1,6 +1,7 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, Field, field_validator
+from typing import Optional, List, Any, Dict
 from datetime import datetime
+import json
 from app.models import UserRole
 
 # User schemas
@@ -29,17 +30,42 @@ class UserLogin(BaseModel):
     username: str
     password: str
 
+class BulkUserImportRequest(BaseModel):
+    users: List[UserCreate] = Field(..., min_length=1, max_length=1000)
+
+class BulkUserResult(BaseModel):
+    row: int
+    username: str
+    status: str  # created, conflict (username taken), duplicate (earlier row), invalid
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+class BulkUserImportResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BulkUserResult]
+
 class GoogleAuthRequest(BaseModel):
     token: str
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+    expires_in: Optional[int] = None
     user: Optional[User] = None
 
+class RefreshRequest(BaseModel):
+    refresh_token: str
+
+class LogoutRequest(BaseModel):
+    refresh_token: Optional[str] = None
+
 class TokenData(BaseModel):
     username: Optional[str] = None
     role: Optional[UserRole] = None
+    jti: Optional[str] = None
+    expires_at: Optional[datetime] = None
 
 # Product schemas
 class ProductBase(BaseModel):
@@ -50,6 +76,7 @@ class ProductBase(BaseModel):
     description: Optional[str] = None
     quantity: int
     price: float
+    reorder_threshold: Optional[int] = Field(None, ge=0)
 
 class ProductCreate(ProductBase):
     pass
@@ -57,8 +84,13 @@ class ProductCreate(ProductBase):
 class ProductUpdate(BaseModel):
     quantity: int
 
+class ReorderThresholdUpdate(BaseModel):
+    reorder_threshold: Optional[int] = Field(..., ge=0)  # null restores the default
+
 class Product(ProductBase):
     id: int
+    thumbnail_url: Optional[str] = None
+    reserved_quantity: int = 0
     created_at: datetime
     updated_at: Optional[datetime] = None
 
@@ -67,4 +99,135 @@ class Product(ProductBase):
 
 class ProductResponse(BaseModel):
     product_id: int
-    message: str = "Product created successfully" 
\ No newline at end of file
+    message: str = "Product created successfully" 
+
+# Location schemas
+class LocationCreate(BaseModel):
+    name: str
+    description: Optional[str] = None
+
+class Location(LocationCreate):
+    id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+class LocationStock(BaseModel):
+    product_id: int
+    location_id: int
+    quantity: int
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class LocationStockWithProduct(LocationStock):
+    product: Product
+
+# Reservation schemas
+class ReservationCreate(BaseModel):
+    quantity: int = Field(gt=0)
+    ttl_seconds: Optional[int] = Field(default=None, gt=0, le=3600)
+
+class Reservation(BaseModel):
+    id: int
+    product_id: int
+    user_id: Optional[int] = None
+    quantity: int
+    status: str
+    expires_at: datetime
+    created_at: datetime
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ProductAvailability(BaseModel):
+    product_id: int
+    quantity: int
+    reserved_quantity: int
+    available: int
+
+# Job schemas
+class JobCreate(BaseModel):
+    type: str
+    params: Dict[str, Any] = {}
+
+class Job(BaseModel):
+    id: int
+    type: str
+    status: str
+    progress_current: int
+    progress_total: Optional[int] = None
+    message: Optional[str] = None
+    result: Optional[Any] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    attempts: int
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+    @field_validator("result", mode="before")
+    @classmethod
+    def parse_result(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+class DeletedProduct(BaseModel):
+    id: int
+    sku: Optional[str] = None
+
+class ProductChanges(BaseModel):
+    changes: List[Product]
+    deleted: List[DeletedProduct]
+    next: str
+    has_more: bool
+
+class ReorderSuggestion(BaseModel):
+    product_id: int
+    sku: str
+    name: str
+    type: str
+    available: int
+    daily_demand: float
+    demand_std: float
+    safety_stock: float
+    reorder_point: float
+    suggested_quantity: int
+    days_of_cover: float
+    needs_reorder: bool
+    computed_at: datetime
+
+class SkuLookupRequest(BaseModel):
+    skus: List[str] = Field(..., min_length=1, max_length=500)
+
+class SkuLookupResponse(BaseModel):
+    products: List[Product]
+    missing: List[str]
+
+# Audit log schemas
+class AuditEntry(BaseModel):
+    id: int
+    created_at: datetime
+    actor_id: Optional[int] = None
+    actor: Optional[str] = None
+    action: str
+    entity: str
+    entity_id: Optional[int] = None
+    details: Optional[Dict[str, Any]] = None
+
+    class Config:
+        from_attributes = True
+
+    @field_validator("details", mode="before")
+    @classmethod
+    def parse_details(cls, value):
+        return json.loads(value) if isinstance(value, str) else value
+
+class AuditPage(BaseModel):
+    items: List[AuditEntry]
+    next_before_id: Optional[int] = None
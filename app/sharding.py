@@ -0,0 +1,587 @@
+"""
+Products sharded by SKU across several databases.
+
+PRODUCT_SHARD_URLS lists the shard databases, in a fixed order (new shards
+are appended). A product lives on shard `jump_hash(sku, len(shards))`, so
+SKU lookups and writes go to one database, and adding a shard moves only
+the 1/N of the products that now hash to it. Ids are globally unique
+without coordination: each shard hands out `n * SHARD_ID_STRIDE + index`,
+and a product keeps its id when rebalancing moves it. Lookups by id try
+the shard that issued the id first and then the others.
+
+Lists, analytics and exports scatter the query to every shard in parallel
+and merge the results in id order.
+
+With PRODUCT_SHARD_URLS set, the catalog endpoints (product list, create,
+quantity update, delete and SKU lookups) read and write the shards through
+ShardedProductRepository. Copy an existing catalog over once with
+`import-from-primary`, which keeps product ids.
+
+While a new shard is being filled, set PRODUCT_SHARDS_PREVIOUS_COUNT to
+the old shard count: reads then also look where a product used to live,
+and creates check both places for a duplicate SKU. Pause other writes to
+moving products, or accept that a write racing the move of its row may be
+lost. Then:
+
+    python -m app.sharding init                  # create the tables on every shard
+    python -m app.sharding import-from-primary   # copy the primary's products onto the shards
+    python -m app.sharding rebalance --from 2    # move products to the shard they now hash to
+    python -m app.sharding status
+    python -m app.sharding export products.csv
+
+This is a catalog store behind the ProductRepository interface. Writes
+are audited like the SQL backend's. What references products by foreign
+key lives on the primary database (app.database) and would read a products
+table the shards no longer update: per-location stock, reservations and
+availability, reorder thresholds, images, the change feed, low-stock
+alerts, inventory rollups, forecasts, the catalog snapshot and background
+jobs. The API refuses those endpoints with 501 while sharding is on.
+"""
+import argparse
+import csv
+import hashlib
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+from sqlalchemy import BigInteger, Column, DateTime, Float, Integer, String, Text, create_engine, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from app.audit import audit
+from app.database import SessionLocal, SQLiteWriterLock, SQLITE_BUSY_TIMEOUT_MS
+from app.models import Product
+from app.repository import ProductRepository, product_not_found, duplicate_sku
+
+PRODUCT_SHARD_URLS = [url.strip() for url in os.getenv("PRODUCT_SHARD_URLS", "").split(",") if url.strip()]
+PRODUCT_SHARDS_PREVIOUS_COUNT = int(os.getenv("PRODUCT_SHARDS_PREVIOUS_COUNT") or "0")
+
+# Ids end in the issuing shard's index, so at most this many shards
+SHARD_ID_STRIDE = 1024
+# Ids reserved from a shard's counter at a time
+ID_BLOCK_SIZE = 100
+BATCH_SIZE = 1000
+PRODUCT_COLUMNS = [
+    "id", "name", "type", "sku", "image_url", "thumbnail_url", "description",
+    "quantity", "reserved_quantity", "price", "reorder_threshold", "created_at", "updated_at",
+]
+
+ShardBase = declarative_base()
+
+
+class ShardProduct(ShardBase):
+    """
+    The products table on a shard: same columns as app.models.Product, with
+    a 64-bit id that is assigned by the application.
+    """
+    __tablename__ = "products"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=False)
+    name = Column(String, nullable=False)
+    type = Column(String, nullable=False, index=True)
+    sku = Column(String, unique=True, index=True, nullable=False)
+    image_url = Column(String)
+    thumbnail_url = Column(String, nullable=True)
+    description = Column(Text)
+    quantity = Column(Integer, default=0, nullable=False)
+    reserved_quantity = Column(Integer, default=0, server_default="0", nullable=False)
+    price = Column(Float, nullable=False)
+    reorder_threshold = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+
+class ShardIdCounter(ShardBase):
+    __tablename__ = "shard_id_counter"
+
+    id = Column(Integer, primary_key=True)
+    value = Column(BigInteger, default=0, nullable=False)
+
+
+def sku_key(sku: str) -> int:
+    return int.from_bytes(hashlib.blake2b(sku.encode(), digest_size=8).digest(), "big")
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach): going from n to n + 1 buckets
+    moves only the keys that land in the new bucket.
+    """
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * (float(1 << 31) / float((key >> 33) + 1)))
+    return b
+
+
+class ProductShards:
+    """
+    Engines for the shard databases and the SKU -> shard mapping.
+    """
+
+    def __init__(self, urls: List[str], previous_count: int = 0):
+        if len(urls) > SHARD_ID_STRIDE:
+            raise ValueError(f"At most {SHARD_ID_STRIDE} shards are supported")
+        self.urls = urls
+        self.previous_count = previous_count if 0 < previous_count < len(urls) else 0
+        self.engines = [create_engine(url, pool_pre_ping=True) for url in urls]
+        for engine in self.engines:
+            if engine.dialect.name == "sqlite":
+                SQLiteWriterLock(SQLITE_BUSY_TIMEOUT_MS / 1000).install(engine)
+        self.sessionmakers = [
+            sessionmaker(autocommit=False, autoflush=False, expire_on_commit=False, bind=engine)
+            for engine in self.engines
+        ]
+        self._executor = ThreadPoolExecutor(max_workers=max(len(urls), 1), thread_name_prefix="shard")
+        self._id_blocks = [iter(()) for _ in urls]
+        self._id_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.engines)
+
+    def shard_for_sku(self, sku: str, count: int = None) -> int:
+        return jump_hash(sku_key(sku), count or len(self))
+
+    def shards_for_sku(self, sku: str):
+        """
+        Where the product is, then where it was before the shard being
+        filled was added, if that differs.
+        """
+        shards = [self.shard_for_sku(sku)]
+        if self.previous_count:
+            previous = self.shard_for_sku(sku, self.previous_count)
+            if previous != shards[0]:
+                shards.append(previous)
+        return shards
+
+    def shards_for_id(self, product_id: int):
+        """
+        The shard that issued the id first; rebalancing may have moved it.
+        """
+        issuer = product_id % SHARD_ID_STRIDE
+        return sorted(range(len(self)), key=lambda index: index != issuer)
+
+    def session(self, index: int):
+        return self.sessionmakers[index]()
+
+    def scatter(self, fn):
+        """
+        Run fn(session, index) on every shard in parallel; results in shard order.
+        """
+        def run(index):
+            db = self.session(index)
+            try:
+                return fn(db, index)
+            finally:
+                db.close()
+        return list(self._executor.map(run, range(len(self))))
+
+    def allocate_id(self, index: int) -> int:
+        """
+        Next id issued by shard `index`. Ids are reserved ID_BLOCK_SIZE at a
+        time from the shard's counter row, in a transaction of their own so
+        the row isn't locked for the length of the caller's.
+        """
+        with self._id_lock:
+            local = next(self._id_blocks[index], None)
+            if local is None:
+                db = self.session(index)
+                try:
+                    bumped = db.execute(
+                        update(ShardIdCounter).where(ShardIdCounter.id == 1)
+                        .values(value=ShardIdCounter.value + ID_BLOCK_SIZE)
+                    )
+                    if bumped.rowcount == 0:
+                        db.execute(insert(ShardIdCounter).values(id=1, value=ID_BLOCK_SIZE))
+                    end = db.execute(select(ShardIdCounter.value).where(ShardIdCounter.id == 1)).scalar_one()
+                    db.commit()
+                finally:
+                    db.close()
+                self._id_blocks[index] = iter(range(end - ID_BLOCK_SIZE + 1, end + 1))
+                local = next(self._id_blocks[index])
+        return local * SHARD_ID_STRIDE + index
+
+    def reserve_ids_past(self, product_id: int):
+        """
+        Move every shard's id counter past `product_id`, so ids issued from
+        now on are all larger than it.
+        """
+        floor = product_id // SHARD_ID_STRIDE + 1
+        for index in range(len(self)):
+            db = self.session(index)
+            try:
+                db.execute(
+                    update(ShardIdCounter).where(ShardIdCounter.id == 1, ShardIdCounter.value < floor)
+                    .values(value=floor)
+                )
+                if db.execute(select(ShardIdCounter.id).where(ShardIdCounter.id == 1)).first() is None:
+                    db.execute(insert(ShardIdCounter).values(id=1, value=floor))
+                db.commit()
+            finally:
+                db.close()
+        with self._id_lock:
+            self._id_blocks = [iter(()) for _ in self.engines]
+
+    def init(self):
+        for engine in self.engines:
+            ShardBase.metadata.create_all(bind=engine)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        for engine in self.engines:
+            engine.dispose()
+
+
+class ShardedProductRepository(ProductRepository):
+    """
+    ProductRepository over ProductShards. Returns detached ShardProduct rows.
+    Writes are audited as `actor` (user id, username).
+    """
+
+    def __init__(self, shards: ProductShards, actor: tuple = None):
+        self.shards = shards
+        self.actor = actor
+
+    def _find(self, indexes, condition):
+        for index in indexes:
+            db = self.shards.session(index)
+            try:
+                product = db.query(ShardProduct).filter(condition).first()
+            finally:
+                db.close()
+            if product is not None:
+                return index, product
+        return None, None
+
+    def get_products(self, skip: int = 0, limit: int = 100):
+        """
+        A page in id order: each shard returns its first skip + limit rows and
+        the pages are merged, so deep offsets cost every shard that much.
+        Use iter_products for full scans.
+        """
+        pages = self.shards.scatter(lambda db, index: (
+            db.query(ShardProduct).order_by(ShardProduct.id).limit(skip + limit).all()
+        ))
+        merged = heapq.merge(*pages, key=lambda product: product.id)
+        return [product for position, product in enumerate(merged) if position >= skip][:limit]
+
+    def iter_products(self, batch_size: int = BATCH_SIZE):
+        """
+        Every product in id order, reading each shard in keyset-paginated batches.
+        """
+        def shard_rows(index):
+            last_id = -1
+            while True:
+                db = self.shards.session(index)
+                try:
+                    batch = (
+                        db.query(ShardProduct).filter(ShardProduct.id > last_id)
+                        .order_by(ShardProduct.id).limit(batch_size).all()
+                    )
+                finally:
+                    db.close()
+                yield from batch
+                if len(batch) < batch_size:
+                    return
+                last_id = batch[-1].id
+
+        return heapq.merge(*(shard_rows(index) for index in range(len(self.shards))), key=lambda p: p.id)
+
+    def get_product_by_id(self, product_id: int):
+        return self._find(self.shards.shards_for_id(product_id), ShardProduct.id == product_id)[1]
+
+    def get_product_by_sku(self, sku: str):
+        return self._find(self.shards.shards_for_sku(sku), ShardProduct.sku == sku)[1]
+
+    def get_products_by_skus(self, skus: List[str]):
+        """
+        Products for many SKUs with one query per shard involved.
+        """
+        by_shard = {}
+        for sku in set(skus):
+            for index in self.shards.shards_for_sku(sku):
+                by_shard.setdefault(index, []).append(sku)
+        found = {}
+        for index, shard_skus in by_shard.items():
+            db = self.shards.session(index)
+            try:
+                for product in db.query(ShardProduct).filter(ShardProduct.sku.in_(shard_skus)):
+                    found.setdefault(product.sku, product)
+            finally:
+                db.close()
+        return found
+
+    def create_product(self, product: dict):
+        indexes = self.shards.shards_for_sku(product["sku"])
+        if self._find(indexes[1:], ShardProduct.sku == product["sku"])[1] is not None:
+            raise duplicate_sku(product["sku"])
+        index = indexes[0]
+        db_product = ShardProduct(
+            id=self.shards.allocate_id(index),
+            **{key: value for key, value in product.items() if key in PRODUCT_COLUMNS and key != "id"},
+        )
+        db = self.shards.session(index)
+        try:
+            if db.query(ShardProduct.id).filter(ShardProduct.sku == product["sku"]).first():
+                raise duplicate_sku(product["sku"])
+            db.add(db_product)
+            audit(db, "product.create", "product", db_product.id, actor=self.actor,
+                  sku=db_product.sku, quantity=db_product.quantity)
+            db.commit()
+            db.refresh(db_product)
+        except IntegrityError:
+            db.rollback()
+            raise duplicate_sku(product["sku"])
+        finally:
+            db.close()
+        return db_product
+
+    def _update(self, product_id: int, values: dict):
+        for index in self.shards.shards_for_id(product_id):
+            db = self.shards.session(index)
+            try:
+                product = db.query(ShardProduct).filter(ShardProduct.id == product_id).with_for_update().first()
+                if product is not None:
+                    if "quantity" in values:
+                        audit(db, "product.quantity", "product", product_id, actor=self.actor,
+                              sku=product.sku, old=product.quantity, new=values["quantity"])
+                    for key, value in values.items():
+                        setattr(product, key, value)
+                    db.commit()
+                    db.refresh(product)
+                    return product
+            finally:
+                db.close()
+        raise product_not_found(product_id)
+
+    def update_product_quantity(self, product_id: int, quantity: int):
+        return self._update(product_id, {"quantity": quantity})
+
+    def delete_product(self, product_id: int):
+        for index in self.shards.shards_for_id(product_id):
+            db = self.shards.session(index)
+            try:
+                product = db.query(ShardProduct).filter(ShardProduct.id == product_id).with_for_update().first()
+                if product is not None:
+                    audit(db, "product.delete", "product", product_id, actor=self.actor, sku=product.sku)
+                    db.delete(product)
+                    db.commit()
+                    return {"message": "Product deleted successfully"}
+            finally:
+                db.close()
+        raise product_not_found(product_id)
+
+    def get_product_stats(self, low_stock_threshold: int = 10):
+        """
+        Catalog totals, aggregated on each shard and summed.
+        """
+        def shard_stats(db, index):
+            totals = db.query(
+                func.count(ShardProduct.id),
+                func.coalesce(func.sum(ShardProduct.quantity), 0),
+                func.coalesce(func.sum(ShardProduct.quantity * ShardProduct.price), 0),
+                func.count(ShardProduct.id).filter(ShardProduct.quantity < low_stock_threshold),
+            ).one()
+            by_type = db.query(
+                ShardProduct.type, func.count(ShardProduct.id), func.coalesce(func.sum(ShardProduct.quantity), 0)
+            ).group_by(ShardProduct.type).all()
+            return totals, by_type
+
+        stats = {"total_products": 0, "total_quantity": 0, "inventory_value": 0.0, "low_stock": 0, "by_type": {}}
+        per_shard = []
+        for index, (totals, by_type) in enumerate(self.shards.scatter(shard_stats)):
+            count, quantity, value, low_stock = totals
+            per_shard.append({"shard": index, "products": count})
+            stats["total_products"] += count
+            stats["total_quantity"] += quantity
+            stats["inventory_value"] += float(value)
+            stats["low_stock"] += low_stock
+            for product_type, type_count, type_quantity in by_type:
+                entry = stats["by_type"].setdefault(product_type, {"products": 0, "quantity": 0})
+                entry["products"] += type_count
+                entry["quantity"] += type_quantity
+        stats["inventory_value"] = round(stats["inventory_value"], 2)
+        stats["shards"] = per_shard
+        return stats
+
+    def export_csv(self, path: str):
+        rows = 0
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(PRODUCT_COLUMNS)
+            for product in self.iter_products():
+                writer.writerow([getattr(product, column) for column in PRODUCT_COLUMNS])
+                rows += 1
+        return rows
+
+
+def rebalance(shards: ProductShards, previous_count: int, batch_size: int = BATCH_SIZE):
+    """
+    Move products from the first `previous_count` shards to the shard they
+    hash to now. Each batch is inserted on its new shard and committed before
+    it is deleted from the old one, so a crash leaves copies rather than
+    losing rows; rows already present on the target are not copied again.
+    Safe to run repeatedly.
+    """
+    moved = {}
+    for source in range(previous_count):
+        last_id = -1
+        while True:
+            db = shards.session(source)
+            try:
+                batch = (
+                    db.query(ShardProduct).filter(ShardProduct.id > last_id)
+                    .order_by(ShardProduct.id).limit(batch_size).all()
+                )
+            finally:
+                db.close()
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            targets = {}
+            for product in batch:
+                target = shards.shard_for_sku(product.sku)
+                if target != source:
+                    targets.setdefault(target, []).append(product)
+            for target, products in targets.items():
+                target_db = shards.session(target)
+                try:
+                    present = {
+                        product_id for (product_id,) in target_db.query(ShardProduct.id)
+                        .filter(ShardProduct.id.in_([p.id for p in products]))
+                    }
+                    rows = [
+                        {column: getattr(p, column) for column in PRODUCT_COLUMNS}
+                        for p in products if p.id not in present
+                    ]
+                    if rows:
+                        target_db.execute(insert(ShardProduct), rows)
+                    target_db.commit()
+                finally:
+                    target_db.close()
+
+                source_db = shards.session(source)
+                try:
+                    source_db.query(ShardProduct).filter(
+                        ShardProduct.id.in_([p.id for p in products])
+                    ).delete(synchronize_session=False)
+                    source_db.commit()
+                finally:
+                    source_db.close()
+                moved[f"{source}->{target}"] = moved.get(f"{source}->{target}", 0) + len(products)
+    return moved
+
+
+def import_from_primary(shards: ProductShards, batch_size: int = BATCH_SIZE):
+    """
+    Copy the primary database's products onto the shards, each to the shard
+    its SKU hashes to, keeping its id. Rows already on their shard are
+    skipped, so it can be re-run after an interruption; a SKU that is on its
+    shard under another id is counted as a conflict and not copied. Then
+    every shard's id counter is moved past the highest id copied.
+    """
+    counts = {"copied": 0, "present": 0, "conflicts": 0}
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            batch = db.query(Product).filter(Product.id > last_id).order_by(Product.id).limit(batch_size).all()
+        finally:
+            db.close()
+        if not batch:
+            break
+        last_id = batch[-1].id
+
+        targets = {}
+        for product in batch:
+            targets.setdefault(shards.shard_for_sku(product.sku), []).append(product)
+        for target, products in targets.items():
+            target_db = shards.session(target)
+            try:
+                present = {
+                    product_id for (product_id,) in target_db.query(ShardProduct.id)
+                    .filter(ShardProduct.id.in_([p.id for p in products]))
+                }
+                taken = {
+                    sku for (sku,) in target_db.query(ShardProduct.sku)
+                    .filter(ShardProduct.sku.in_([p.sku for p in products]))
+                }
+                rows = []
+                for product in products:
+                    if product.id in present:
+                        counts["present"] += 1
+                    elif product.sku in taken:
+                        counts["conflicts"] += 1
+                    else:
+                        rows.append({column: getattr(product, column) for column in PRODUCT_COLUMNS})
+                if rows:
+                    target_db.execute(insert(ShardProduct), rows)
+                target_db.commit()
+                counts["copied"] += len(rows)
+            finally:
+                target_db.close()
+    shards.reserve_ids_past(last_id)
+    return counts
+
+
+def get_product_shards():
+    """
+    The configured shards, or None when PRODUCT_SHARD_URLS is empty.
+    """
+    global _product_shards
+    if _product_shards is None and PRODUCT_SHARD_URLS:
+        _product_shards = ProductShards(PRODUCT_SHARD_URLS, PRODUCT_SHARDS_PREVIOUS_COUNT)
+    return _product_shards
+
+
+_product_shards = None
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m app.sharding")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("init", help="create the products table on every shard")
+    rebalance_parser = commands.add_parser("rebalance", help="move products after adding shards")
+    rebalance_parser.add_argument("--from", dest="previous_count", type=int, required=True,
+                                  help="number of shards before the new ones were appended")
+    rebalance_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    import_parser = commands.add_parser("import-from-primary", help="copy the primary's products onto the shards")
+    import_parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    commands.add_parser("status", help="products per shard and catalog totals")
+    export_parser = commands.add_parser("export", help="write every product to a CSV file")
+    export_parser.add_argument("path")
+    args = parser.parse_args()
+
+    shards = get_product_shards()
+    if shards is None:
+        parser.error("PRODUCT_SHARD_URLS is not set")
+    try:
+        if args.command == "init":
+            shards.init()
+            print(f"Created product tables on {len(shards)} shards")
+        elif args.command == "rebalance":
+            started = time.perf_counter()
+            moved = rebalance(shards, args.previous_count, args.batch_size)
+            elapsed = time.perf_counter() - started
+            print(f"Moved {sum(moved.values())} products in {elapsed:.1f}s: {moved or 'nothing to move'}")
+        elif args.command == "import-from-primary":
+            started = time.perf_counter()
+            counts = import_from_primary(shards, args.batch_size)
+            print(f"Copied {counts['copied']} products in {time.perf_counter() - started:.1f}s "
+                  f"({counts['present']} already there, {counts['conflicts']} SKU conflicts)")
+        elif args.command == "status":
+            print(ShardedProductRepository(shards).get_product_stats())
+        elif args.command == "export":
+            rows = ShardedProductRepository(shards).export_csv(args.path)
+            print(f"Exported {rows} products to {args.path}")
+    finally:
+        shards.close()
+
+
+if __name__ == "__main__":
+    main()
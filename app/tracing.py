@@ -0,0 +1,262 @@
+"""
+Lightweight request tracing.
+
+Every HTTP request gets a server span; code running on its behalf opens
+child spans with `start_span` (token verification, user lookup, password
+hashing), every SQL statement executed inside a trace becomes a span, and
+outbound calls made through `traced_http_client()` get a span and a
+`traceparent` header. An incoming `traceparent` header (W3C Trace Context)
+makes the request part of the caller's trace, and the response carries
+`traceresponse` with the server span.
+
+The current span is held in a contextvar, which Starlette copies into
+threadpool workers, so spans opened in sync dependencies and endpoints
+nest under the request.
+
+Finished spans go to an exporter: TRACING_EXPORTER=memory keeps the most
+recent ones in memory (tests, GET /traces), `file` appends JSON lines to
+TRACING_FILE, and `none` (the default) disables tracing so start_span is a
+no-op. Custom exporters implement `export(span)` and are installed with
+`set_exporter`.
+"""
+import json
+import os
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "none")
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")
+TRACING_MEMORY_SPANS = int(os.getenv("TRACING_MEMORY_SPANS", "10000"))
+
+TRACEPARENT_PATTERN = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    kind: str = "internal"
+    start_ns: int = 0
+    end_ns: int = 0
+    status: str = "ok"
+    attributes: dict = field(default_factory=dict)
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    @property
+    def traceparent(self):
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {**asdict(self), "duration_ms": self.duration_ms}
+
+
+class InMemoryExporter:
+    def __init__(self, max_spans: int = TRACING_MEMORY_SPANS):
+        self.spans = deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self.spans.append(span)
+
+    def get_trace(self, trace_id: str):
+        return [span for span in self.spans if span.trace_id == trace_id]
+
+    def clear(self):
+        self.spans.clear()
+
+
+class FileExporter:
+    """
+    Appends one JSON object per finished span.
+    """
+
+    def __init__(self, path: str = TRACING_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span):
+        line = json.dumps(span.to_dict(), default=str) + "\n"
+        with self._lock:
+            with open(self.path, "a") as f:
+                f.write(line)
+
+
+def _create_exporter():
+    if TRACING_EXPORTER == "memory":
+        return InMemoryExporter()
+    if TRACING_EXPORTER == "file":
+        return FileExporter()
+    return None
+
+
+_exporter = _create_exporter()
+
+
+def set_exporter(exporter):
+    """
+    Install an exporter (anything with `export(span)`); None disables tracing.
+    """
+    global _exporter
+    _exporter = exporter
+
+
+def get_exporter():
+    return _exporter
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def parse_traceparent(value: str):
+    match = TRACEPARENT_PATTERN.match(value.strip().lower()) if value else None
+    if match is None or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+@contextmanager
+def start_span(name: str, kind: str = "internal", traceparent: str = None, root: bool = False, **attributes):
+    """
+    Run the block in a new span, child of the current one. Without a
+    current span nothing is recorded unless `root` is set (or a
+    `traceparent` is given). Yields the Span, or None when not tracing.
+    """
+    parent = _current_span.get()
+    if _exporter is None or (parent is None and not root):
+        yield None
+        return
+    if parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = parse_traceparent(traceparent)
+        trace_id = trace_id or secrets.token_hex(16)
+    span = Span(name, trace_id, secrets.token_hex(8), parent_id, kind, time.time_ns(), attributes=attributes)
+    reset = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.status = "error"
+        span.set_attribute("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        span.end_ns = time.time_ns()
+        _current_span.reset(reset)
+        _export(span)
+
+
+def _export(span):
+    exporter = _exporter
+    if exporter is not None:
+        try:
+            exporter.export(span)
+        except Exception:
+            pass  # tracing must never break a request
+
+
+class TracingMiddleware:
+    """
+    Server span per HTTP request; joins the caller's trace via traceparent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _exporter is None:
+            await self.app(scope, receive, send)
+            return
+        traceparent = dict(scope["headers"]).get(b"traceparent", b"").decode("latin-1")
+        with start_span(
+            f"{scope['method']} {scope['path']}", kind="server", traceparent=traceparent, root=True,
+            **{"http.method": scope["method"], "http.target": scope["path"]}
+        ) as span:
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    span.set_attribute("http.status_code", message["status"])
+                    if message["status"] >= 500:
+                        span.status = "error"
+                    message = {**message, "headers": list(message.get("headers", [])) + [
+                        (b"traceresponse", span.traceparent.encode())
+                    ]}
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
+
+
+# SQL statements run inside a trace become child spans, on every engine
+# (primary, read replicas and shards)
+@event.listens_for(Engine, "before_cursor_execute")
+def _start_sql_span(conn, cursor, statement, parameters, context, executemany):
+    if _exporter is None or _current_span.get() is None:
+        return
+    span_context = start_span("db.query", kind="client", **{
+        "db.system": conn.dialect.name, "db.statement": statement[:1000], "db.executemany": executemany,
+    })
+    span_context.__enter__()
+    conn.info.setdefault("trace_spans", []).append(span_context)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _end_sql_span(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        spans.pop().__exit__(None, None, None)
+
+
+@event.listens_for(Engine, "handle_error")
+def _fail_sql_span(exception_context):
+    conn = exception_context.connection
+    spans = conn.info.get("trace_spans") if conn is not None else None
+    if spans:
+        error = exception_context.original_exception
+        spans.pop().__exit__(type(error), error, error.__traceback__)
+
+
+def traced_http_client(**kwargs):
+    """
+    httpx.AsyncClient whose requests get a client span and a traceparent
+    header. httpx is imported here to keep it off the startup path.
+    """
+    import httpx
+
+    class TracingTransport(httpx.AsyncBaseTransport):
+        def __init__(self, transport):
+            self.transport = transport
+
+        async def handle_async_request(self, request):
+            with start_span(f"HTTP {request.method}", kind="client", **{
+                "http.method": request.method, "http.url": str(request.url.copy_with(query=None)),
+            }) as span:
+                if span is not None:
+                    request.headers["traceparent"] = span.traceparent
+                response = await self.transport.handle_async_request(request)
+                if span is not None:
+                    span.set_attribute("http.status_code", response.status_code)
+                return response
+
+        async def aclose(self):
+            await self.transport.aclose()
+
+    transport = TracingTransport(kwargs.pop("transport", None) or httpx.AsyncHTTPTransport())
+    return httpx.AsyncClient(transport=transport, **kwargs)
@@ -0,0 +1,46 @@
+"""
+Standalone job worker process.
+
+Run next to the API (with JOB_WORKERS=0 there) so bulk work never competes
+with request handling:
+
+    python -m app.worker --workers 4
+"""
+import argparse
+import logging
+import signal
+import threading
+
+from app.alerts import alert_dispatcher
+from app.jobs import JobWorkerPool, JOB_POLL_SECONDS
+from app.rollups import rollup_writer, ROLLUPS_ENABLED
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run background job workers")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--poll-seconds", type=float, default=JOB_POLL_SECONDS)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    pool = JobWorkerPool(workers=args.workers, poll_seconds=args.poll_seconds)
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+
+    # Imports change stock, so jobs can raise low-stock alerts and move the rollups
+    alert_dispatcher.start()
+    if ROLLUPS_ENABLED:
+        rollup_writer.start()
+    pool.start()
+    logging.info("Job worker %s started with %d threads", pool.worker_id, args.workers)
+    stopped.wait()
+    logging.info("Stopping job worker %s", pool.worker_id)
+    # Jobs still running when the process exits are requeued once their heartbeat goes stale
+    pool.stop(timeout=30)
+    alert_dispatcher.stop()
+    rollup_writer.stop()
+
+
+if __name__ == "__main__":
+    main()
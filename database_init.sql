@@ -1,5 +1,6 @@
 -- Database initialization script for Inventory Management Tool
 -- This script creates the necessary tables and indexes for the application
+-- PostgreSQL only; `python -m app.migrate` creates the same schema on any backend, including SQLite
 
 -- Create user roles enum type
 CREATE TYPE user_role AS ENUM ('admin', 'manager', 'user');
@@ -27,13 +28,161 @@ CREATE TABLE IF NOT EXISTS products (
     type VARCHAR(100) NOT NULL,
     sku VARCHAR(100) UNIQUE NOT NULL,
     image_url TEXT,
+    thumbnail_url TEXT,
     description TEXT,
     quantity INTEGER DEFAULT 0 NOT NULL,
+    reserved_quantity INTEGER DEFAULT 0 NOT NULL,
     price DECIMAL(10,2) NOT NULL,
+    reorder_threshold INTEGER,
+    change_seq BIGINT DEFAULT 0 NOT NULL,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE
 );
 
+-- Bring a products table created by an earlier release up to date
+ALTER TABLE products ADD COLUMN IF NOT EXISTS thumbnail_url TEXT;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS reserved_quantity INTEGER DEFAULT 0 NOT NULL;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS reorder_threshold INTEGER;
+ALTER TABLE products ADD COLUMN IF NOT EXISTS change_seq BIGINT DEFAULT 0 NOT NULL;
+
+-- Create tombstones of deleted products and change sequence counters for delta sync
+CREATE TABLE IF NOT EXISTS product_tombstones (
+    id INTEGER PRIMARY KEY,
+    sku VARCHAR(100),
+    change_seq BIGINT NOT NULL,
+    deleted_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS change_sequences (
+    name VARCHAR(50) PRIMARY KEY,
+    value BIGINT DEFAULT 0 NOT NULL
+);
+
+-- Create stock locations (warehouses, stores)
+CREATE TABLE IF NOT EXISTS locations (
+    id SERIAL PRIMARY KEY,
+    name VARCHAR(255) UNIQUE NOT NULL,
+    description TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Create per-location stock; products.quantity is maintained incrementally from it
+CREATE TABLE IF NOT EXISTS product_stock (
+    id SERIAL PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    location_id INTEGER NOT NULL REFERENCES locations(id) ON DELETE CASCADE,
+    quantity INTEGER DEFAULT 0 NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT uq_product_stock_product_location UNIQUE (product_id, location_id)
+);
+
+-- Create stock reservations (checkout holds with a deadline)
+CREATE TABLE IF NOT EXISTS stock_reservations (
+    id SERIAL PRIMARY KEY,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    quantity INTEGER NOT NULL,
+    status VARCHAR(20) DEFAULT 'active' NOT NULL,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP WITH TIME ZONE
+);
+
+-- Create stored responses for Idempotency-Key retries
+CREATE TABLE IF NOT EXISTS idempotency_records (
+    key VARCHAR(64) PRIMARY KEY,
+    fingerprint VARCHAR(64) NOT NULL,
+    status_code INTEGER,
+    headers TEXT,
+    body BYTEA,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Create revoked tokens (by jti) and per-user revocation cutoffs
+CREATE TABLE IF NOT EXISTS token_revocations (
+    id SERIAL PRIMARY KEY,
+    jti VARCHAR(32) UNIQUE,
+    username VARCHAR(255),
+    issued_before TIMESTAMP WITH TIME ZONE,
+    reason VARCHAR(255),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Create demand history and reorder suggestions
+CREATE TABLE IF NOT EXISTS stock_decreases (
+    id SERIAL PRIMARY KEY,
+    product_id INTEGER REFERENCES products(id) ON DELETE CASCADE NOT NULL,
+    day INTEGER NOT NULL,
+    quantity INTEGER NOT NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS reorder_suggestions (
+    product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE,
+    daily_demand DOUBLE PRECISION NOT NULL,
+    demand_std DOUBLE PRECISION NOT NULL,
+    safety_stock DOUBLE PRECISION NOT NULL,
+    reorder_point DOUBLE PRECISION NOT NULL,
+    available INTEGER NOT NULL,
+    suggested_quantity INTEGER NOT NULL,
+    needs_reorder BOOLEAN NOT NULL,
+    computed_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+-- Create inventory totals and their hourly/daily rollups
+CREATE TABLE IF NOT EXISTS inventory_totals (
+    type VARCHAR(100) PRIMARY KEY,
+    units BIGINT DEFAULT 0 NOT NULL,
+    value DOUBLE PRECISION DEFAULT 0 NOT NULL,
+    skus INTEGER DEFAULT 0 NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS inventory_rollups (
+    granularity VARCHAR(8) NOT NULL,
+    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+    type VARCHAR(100) NOT NULL,
+    units BIGINT NOT NULL,
+    value DOUBLE PRECISION NOT NULL,
+    skus INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, type)
+);
+
+-- Create audit log
+CREATE TABLE IF NOT EXISTS audit_log (
+    id SERIAL PRIMARY KEY,
+    created_at TIMESTAMP WITH TIME ZONE NOT NULL,
+    actor_id INTEGER,
+    actor VARCHAR(255),
+    action VARCHAR(50) NOT NULL,
+    entity VARCHAR(50) NOT NULL,
+    entity_id INTEGER,
+    details TEXT
+);
+
+-- Create background jobs
+CREATE TABLE IF NOT EXISTS jobs (
+    id SERIAL PRIMARY KEY,
+    type VARCHAR(100) NOT NULL,
+    status VARCHAR(20) DEFAULT 'queued' NOT NULL,
+    params TEXT,
+    result TEXT,
+    error TEXT,
+    progress_current INTEGER DEFAULT 0 NOT NULL,
+    progress_total INTEGER,
+    message VARCHAR(255),
+    cancel_requested BOOLEAN DEFAULT FALSE NOT NULL,
+    attempts INTEGER DEFAULT 0 NOT NULL,
+    worker_id VARCHAR(255),
+    created_by INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    started_at TIMESTAMP WITH TIME ZONE,
+    heartbeat_at TIMESTAMP WITH TIME ZONE,
+    finished_at TIMESTAMP WITH TIME ZONE
+);
+
 -- Create indexes for better performance
 CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
 CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
@@ -42,6 +191,20 @@ CREATE INDEX IF NOT EXISTS idx_users_role ON users(role);
 CREATE INDEX IF NOT EXISTS idx_products_sku ON products(sku);
 CREATE INDEX IF NOT EXISTS idx_products_type ON products(type);
 CREATE INDEX IF NOT EXISTS idx_products_created_at ON products(created_at);
+CREATE INDEX IF NOT EXISTS ix_products_change_seq_id ON products(change_seq, id);
+CREATE INDEX IF NOT EXISTS ix_product_tombstones_change_seq_id ON product_tombstones(change_seq, id);
+CREATE INDEX IF NOT EXISTS ix_product_stock_location_quantity ON product_stock(location_id, quantity);
+CREATE INDEX IF NOT EXISTS ix_stock_reservations_product_id ON stock_reservations(product_id);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_stock_decreases_product_day ON stock_decreases(product_id, day);
+CREATE INDEX IF NOT EXISTS ix_reorder_suggestions_needs_reorder ON reorder_suggestions(needs_reorder);
+CREATE INDEX IF NOT EXISTS ix_stock_reservations_status_expires_at ON stock_reservations(status, expires_at);
+CREATE INDEX IF NOT EXISTS ix_idempotency_records_expires_at ON idempotency_records(expires_at);
+CREATE INDEX IF NOT EXISTS ix_token_revocations_expires_at ON token_revocations(expires_at);
+CREATE INDEX IF NOT EXISTS ix_audit_log_created_at ON audit_log(created_at);
+CREATE INDEX IF NOT EXISTS ix_audit_log_entity_id ON audit_log(entity, entity_id, id);
+CREATE INDEX IF NOT EXISTS ix_audit_log_actor_id ON audit_log(actor, id);
+CREATE INDEX IF NOT EXISTS ix_audit_log_action_id ON audit_log(action, id);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_id ON jobs(status, id);
 
 -- Insert pre-created accounts
 -- Admin account: SAdmin / 12345qwerty
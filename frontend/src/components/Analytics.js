@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { toast } from 'react-toastify';
+import { isLowStock } from '../lowStock';
 import {
   Chart as ChartJS,
   CategoryScale,
@@ -49,7 +50,7 @@ const Analytics = () => {
       const totalProducts = productsData.length;
       const totalValue = productsData.reduce((sum, product) => sum + (product.price * product.quantity), 0);
       const averagePrice = totalProducts > 0 ? totalValue / totalProducts : 0;
-      const lowStockCount = productsData.filter(product => product.quantity < 10).length;
+      const lowStockCount = productsData.filter(isLowStock).length;
 
       // Category distribution
       const categoryDistribution = {};
@@ -253,7 +254,7 @@ const Analytics = () => {
           {/* Low Stock Alert */}
           <div>
             <h4 style={{ marginBottom: '15px', color: '#555' }}>Low Stock Alert</h4>
-            {products.filter(product => product.quantity < 10).map(product => (
+            {products.filter(isLowStock).map(product => (
               <div key={product.id} style={{ 
                 display: 'flex', 
                 justifyContent: 'space-between', 
@@ -274,7 +275,7 @@ const Analytics = () => {
                 </span>
               </div>
             ))}
-            {products.filter(product => product.quantity < 10).length === 0 && (
+            {products.filter(isLowStock).length === 0 && (
               <p style={{ color: '#28a745', fontStyle: 'italic' }}>
                 No low stock items! 🎉
               </p>
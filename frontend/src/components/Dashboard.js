@@ -2,6 +2,7 @@ import React, { useState, useEffect } from 'react';
 import { Link } from 'react-router-dom';
 import axios from 'axios';
 import { toast } from 'react-toastify';
+import { isLowStock } from '../lowStock';
 import { useAuth } from '../context/AuthContext';
 
 const Dashboard = () => {
@@ -30,7 +31,7 @@ const Dashboard = () => {
       // Calculate statistics
       const totalProducts = products.length;
       const totalValue = products.reduce((sum, product) => sum + (product.price * product.quantity), 0);
-      const lowStock = products.filter(product => product.quantity < 10).length;
+      const lowStock = products.filter(isLowStock).length;
       const categories = new Set(products.map(product => product.type)).size;
       
       setStats({
@@ -128,8 +129,8 @@ const Dashboard = () => {
                     <td>{product.quantity}</td>
                     <td>${product.price}</td>
                     <td>
-                      <span className={`status-badge ${product.quantity < 10 ? 'low-stock' : 'in-stock'}`}>
-                        {product.quantity < 10 ? 'Low Stock' : 'In Stock'}
+                      <span className={`status-badge ${isLowStock(product) ? 'low-stock' : 'in-stock'}`}>
+                        {isLowStock(product) ? 'Low Stock' : 'In Stock'}
                       </span>
                     </td>
                   </tr>
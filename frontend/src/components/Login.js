@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useCallback } from 'react';
-import { useAuth } from '../context/AuthContext';
+import { useAuth, storeTokens } from '../context/AuthContext';
 import { useNavigate } from 'react-router-dom';
 import axios from 'axios';
 import { toast } from 'react-toastify';
@@ -74,11 +74,8 @@ const Login = () => {
       });
 
       if (response.data.access_token) {
-        // Store the token
-        localStorage.setItem('token', response.data.access_token);
-        
-        // Update axios default headers
-        axios.defaults.headers.common['Authorization'] = `Bearer ${response.data.access_token}`;
+        // Store the token pair and update axios default headers
+        storeTokens(response.data);
         
         // Update auth context with user info
         const userInfo = {
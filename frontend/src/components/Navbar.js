@@ -6,8 +6,8 @@ const Navbar = () => {
   const { user, logout, isAdmin, canManageProducts, canViewAnalytics } = useAuth();
   const navigate = useNavigate();
 
-  const handleLogout = () => {
-    logout();
+  const handleLogout = async () => {
+    await logout();
     navigate('/');
   };
 
@@ -1,8 +1,12 @@
 import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 import { toast } from 'react-toastify';
+import { isLowStock } from '../lowStock';
 import { useAuth } from '../context/AuthContext';
 
+// Uploaded images are served by the API with relative URLs
+const assetUrl = (url) => (url && url.startsWith('/') ? `${axios.defaults.baseURL}${url}` : url);
+
 const Products = () => {
   const [products, setProducts] = useState([]);
   const [loading, setLoading] = useState(true);
@@ -128,9 +132,9 @@ const Products = () => {
               <tr key={product.id}>
                 <td>
                   <div className="product-info">
-                    {product.image_url && (
+                    {(product.thumbnail_url || product.image_url) && (
                       <img 
-                        src={product.image_url} 
+                        src={assetUrl(product.thumbnail_url || product.image_url)} 
                         alt={product.name}
                         className="product-image"
                       />
@@ -168,7 +172,7 @@ const Products = () => {
                       </button>
                     </div>
                   ) : (
-                    <span className={`quantity ${product.quantity < 10 ? 'low-stock' : ''}`}>
+                    <span className={`quantity ${isLowStock(product) ? 'low-stock' : ''}`}>
                       {product.quantity}
                     </span>
                   )}
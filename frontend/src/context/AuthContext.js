@@ -7,6 +7,53 @@ axios.defaults.baseURL = process.env.REACT_APP_API_URL || 'http://localhost:8080
 
 const AuthContext = createContext();
 
+// Access tokens are short-lived; the refresh token is exchanged for a new
+// pair when a request comes back 401
+export const storeTokens = ({ access_token, refresh_token }) => {
+  localStorage.setItem('token', access_token);
+  if (refresh_token) {
+    localStorage.setItem('refresh_token', refresh_token);
+  }
+  axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+};
+
+// The access token carries the username and role; a refreshed one carries
+// the role as it is now, so it replaces the user after every refresh
+const userFromToken = (token) => {
+  const payload = JSON.parse(atob(token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/')));
+  return {
+    username: payload.sub,
+    role: payload.role
+  };
+};
+
+const clearTokens = () => {
+  localStorage.removeItem('token');
+  localStorage.removeItem('refresh_token');
+  delete axios.defaults.headers.common['Authorization'];
+};
+
+// Concurrent 401s share one refresh: the old refresh token is revoked on use
+let pendingRefresh = null;
+
+const refreshTokens = () => {
+  if (!pendingRefresh) {
+    const refresh_token = localStorage.getItem('refresh_token');
+    pendingRefresh = (refresh_token
+      ? axios.post('/token/refresh', { refresh_token }, { skipAuthRefresh: true })
+      : Promise.reject(new Error('No refresh token'))
+    )
+      .then((response) => {
+        storeTokens(response.data);
+        return response.data.access_token;
+      })
+      .finally(() => {
+        pendingRefresh = null;
+      });
+  }
+  return pendingRefresh;
+};
+
 export const useAuth = () => {
   const context = useContext(AuthContext);
   if (!context) {
@@ -27,11 +74,7 @@ export const AuthProvider = ({ children }) => {
       
       // Decode JWT token to get user info
       try {
-        const payload = JSON.parse(atob(token.split('.')[1]));
-        setUser({
-          username: payload.sub,
-          role: payload.role
-        });
+        setUser(userFromToken(token));
       } catch (error) {
         console.error('Error decoding token:', error);
         localStorage.removeItem('token');
@@ -41,20 +84,37 @@ export const AuthProvider = ({ children }) => {
     setLoading(false);
   }, []);
 
+  useEffect(() => {
+    const interceptor = axios.interceptors.response.use(undefined, async (error) => {
+      const request = error.config;
+      if (error.response?.status !== 401 || !request || request.skipAuthRefresh || request._retried) {
+        return Promise.reject(error);
+      }
+      request._retried = true;
+      try {
+        const accessToken = await refreshTokens();
+        // A role changed since login (tokens are revoked on role changes) shows up here
+        setUser(userFromToken(accessToken));
+        request.headers['Authorization'] = `Bearer ${accessToken}`;
+        return axios(request);
+      } catch (refreshError) {
+        clearTokens();
+        setUser(null);
+        return Promise.reject(error);
+      }
+    });
+    return () => axios.interceptors.response.eject(interceptor);
+  }, []);
+
   const login = async (username, password) => {
     try {
-      const response = await axios.post('/login', { username, password });
+      const response = await axios.post('/login', { username, password }, { skipAuthRefresh: true });
       const { access_token } = response.data;
       
       // Decode token to get user info
-      const payload = JSON.parse(atob(access_token.split('.')[1]));
-      const userInfo = {
-        username: payload.sub,
-        role: payload.role
-      };
+      const userInfo = userFromToken(access_token);
       
-      localStorage.setItem('token', access_token);
-      axios.defaults.headers.common['Authorization'] = `Bearer ${access_token}`;
+      storeTokens(response.data);
       setUser(userInfo);
       toast.success('Login successful!');
       return true;
@@ -77,9 +137,15 @@ export const AuthProvider = ({ children }) => {
     }
   };
 
-  const logout = () => {
-    localStorage.removeItem('token');
-    delete axios.defaults.headers.common['Authorization'];
+  const logout = async () => {
+    const refresh_token = localStorage.getItem('refresh_token');
+    try {
+      // Revokes both tokens server-side; signing out locally doesn't depend on it
+      await axios.post('/logout', { refresh_token }, { skipAuthRefresh: true });
+    } catch (error) {
+      console.error('Error revoking tokens on logout:', error);
+    }
+    clearTokens();
     setUser(null);
     toast.info('Logged out successfully');
   };
@@ -0,0 +1,5 @@
+// Matches LOW_STOCK_THRESHOLD on the API, used when a product has no threshold of its own
+export const DEFAULT_REORDER_THRESHOLD = 10;
+
+export const isLowStock = (product) =>
+  product.quantity < (product.reorder_threshold ?? DEFAULT_REORDER_THRESHOLD);
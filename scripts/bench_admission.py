@@ -0,0 +1,127 @@
+"""
+Overload behaviour with and without admission control.
+
+Runs AdmissionMiddleware in-process in front of a simulated app whose
+"database" has --capacity connections, each request holding one for
+--service-ms. Requests arrive at --rate per second (90% SKU reads, 10%
+logins), above what the database can serve. A client gives up after
+--timeout-ms, but like a threadpool worker the server keeps working on
+the abandoned request. Reports goodput, shed requests, timeouts and
+latency of the requests that were answered in time, per priority.
+
+Usage:
+    python scripts/bench_admission.py [--rate 600] [--capacity 8] [--service-ms 20] [--seconds 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from starlette.applications import Starlette  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+from starlette.routing import Route  # noqa: E402
+
+from app.admission import AdmissionController, AdmissionMiddleware  # noqa: E402
+
+
+def build_app(capacity, service_seconds):
+    database = asyncio.Semaphore(capacity)
+
+    async def handler(request):
+        async with database:
+            await asyncio.sleep(service_seconds)
+        return JSONResponse({"ok": True})
+
+    return Starlette(routes=[
+        Route("/products/sku/{sku}", handler),
+        Route("/login", handler, methods=["POST"]),
+    ])
+
+
+async def call(asgi, method, path):
+    status = {}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status["code"] = message["status"]
+
+    scope = {
+        "type": "http", "method": method, "path": path, "raw_path": path.encode(), "root_path": "",
+        "query_string": b"", "headers": [], "scheme": "http", "server": ("bench", 80), "client": ("bench", 1),
+        "http_version": "1.1", "asgi": {"version": "3.0"},
+    }
+    await asgi(scope, receive, send)
+    return status.get("code")
+
+
+async def run(args, admission):
+    app = build_app(args.capacity, args.service_ms / 1000)
+    controller = AdmissionController()
+    asgi = AdmissionMiddleware(app, router=app.router, controller=controller) if admission else app
+    kinds = ("read", "expensive")
+    served = {kind: [] for kind in kinds}
+    shed = dict.fromkeys(kinds, 0)
+    timeouts = dict.fromkeys(kinds, 0)
+
+    async def client(kind, method, path):
+        start = time.perf_counter()
+        # The server-side task keeps running when the client gives up
+        task = asyncio.ensure_future(call(asgi, method, path))
+        done, _ = await asyncio.wait([task], timeout=args.timeout_ms / 1000)
+        if not done:
+            timeouts[kind] += 1
+        elif task.result() == 503:
+            shed[kind] += 1
+        else:
+            served[kind].append(time.perf_counter() - start)
+        return task
+
+    clients = []
+    start = time.monotonic()
+    for n in range(int(args.rate * args.seconds)):
+        await asyncio.sleep(max(0.0, start + n / args.rate - time.monotonic()))
+        if random.random() < 0.1:
+            clients.append(asyncio.ensure_future(client("expensive", "POST", "/login")))
+        else:
+            clients.append(asyncio.ensure_future(client("read", "GET", f"/products/sku/S{n}")))
+    await asyncio.gather(*await asyncio.gather(*clients))
+    return served, shed, timeouts, controller.stats() if admission else None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rate", type=float, default=600)
+    parser.add_argument("--capacity", type=int, default=8)
+    parser.add_argument("--service-ms", type=float, default=20)
+    parser.add_argument("--timeout-ms", type=float, default=1000)
+    parser.add_argument("--seconds", type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"load: {args.rate:g} req/s for {args.seconds:g}s against capacity {args.capacity} x "
+          f"{args.service_ms:g} ms (~{args.capacity * 1000 / args.service_ms:.0f} req/s), "
+          f"client timeout {args.timeout_ms:g} ms")
+    print(f"{'':22}{'served/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'shed':>8}{'timeouts':>10}")
+    for admission in (False, True):
+        served, shed, timeouts, stats = asyncio.run(run(args, admission))
+        for kind, latencies in served.items():
+            latencies.sort()
+            p50 = statistics.median(latencies) * 1000 if latencies else 0
+            p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)] * 1000 if latencies else 0
+            print(f"{('admission ' if admission else 'no limit ') + kind:22}{len(latencies) / args.seconds:>10.0f}"
+                  f"{p50:>10.1f}{p99:>10.1f}{shed[kind]:>8}{timeouts[kind]:>10}")
+        if stats:
+            limits = {route: limit["limit"] for route, limit in stats["routes"].items()}
+            print(f"{'':22}adapted limits: {limits}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Sequential registration vs bulk import of staff accounts.
+
+Creates --users users one by one with create_user (one bcrypt hash and one
+commit each, like repeated POST /register calls), then the same number
+through bulk_create_users, which hashes on a process pool of
+PASSWORD_HASH_WORKERS processes and commits once. Bulk wall time should
+drop roughly with the number of cores.
+
+Usage:
+    python scripts/bench_bulk_users.py [--users 100]
+
+Uses DATABASE_URL when set (e.g. a local Postgres), otherwise a temporary
+SQLite file.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from app.database import SessionLocal, init_db, engine  # noqa: E402
+from app.schemas import UserCreate  # noqa: E402
+from app.auth import PASSWORD_HASH_WORKERS, shutdown_hash_executor  # noqa: E402
+from app.crud import create_user, bulk_create_users  # noqa: E402
+from app.audit import audit_writer  # noqa: E402
+
+
+def staff(prefix, count):
+    return [UserCreate(username=f"{prefix}-{i}", password=f"secret-{i}") for i in range(count)]
+
+
+def timed(fn):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        fn(db)
+        return time.perf_counter() - start
+    finally:
+        db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=100)
+    args = parser.parse_args()
+
+    init_db()
+    audit_writer.start()
+    run = uuid.uuid4().hex[:6]
+
+    def sequential(db):
+        for user in staff(f"seq-{run}", args.users):
+            create_user(db, user)
+
+    def bulk(db):
+        report = bulk_create_users(db, staff(f"bulk-{run}", args.users))
+        assert report["created"] == args.users, report["failed"]
+
+    # Start the pool's processes outside the measurement
+    timed(lambda db: bulk_create_users(db, staff(f"warm-{run}", PASSWORD_HASH_WORKERS * 2)))
+    results = {"sequential": timed(sequential), "bulk": timed(bulk)}
+    shutdown_hash_executor()
+    audit_writer.stop()
+
+    print(f"backend:  {engine.url.get_backend_name()}")
+    print(f"users:    {args.users}, hash workers: {PASSWORD_HASH_WORKERS} (cpus: {os.cpu_count()})")
+    print(f"{'':12}{'seconds':>10}{'users/s':>10}")
+    for name, elapsed in results.items():
+        print(f"{name:12}{elapsed:>10.2f}{args.users / elapsed:>10.1f}")
+    print(f"speedup {results['sequential'] / results['bulk']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+SQL vs in-memory catalog snapshot for top-k and aggregate queries.
+
+Inserts --products products, then runs the same top-10-by-value query and
+per-type totals --repeat times as SQL (ORDER BY quantity * price LIMIT 10,
+GROUP BY type) and against the CatalogSnapshot, and prints the median time
+of each. Also reports the snapshot's load time and memory use.
+
+Usage:
+    python scripts/bench_catalog.py [--products 200000] [--repeat 20]
+
+Uses DATABASE_URL when set (e.g. a local Postgres), otherwise a temporary
+SQLite file.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from sqlalchemy import func  # noqa: E402
+
+from app.database import SessionLocal, init_db, engine  # noqa: E402
+from app.models import Product  # noqa: E402
+from app.catalog import CatalogSnapshot  # noqa: E402
+
+TYPES = [f"type-{i}" for i in range(20)]
+
+
+def seed(count):
+    run = uuid.uuid4().hex[:6]
+    rows = [
+        {
+            "name": f"product {i}", "type": random.choice(TYPES), "sku": f"bench-{run}-{i}",
+            "quantity": random.randint(0, 500), "price": round(random.uniform(1, 200), 2),
+            "reserved_quantity": 0,
+        }
+        for i in range(count)
+    ]
+    with engine.begin() as conn:
+        for start in range(0, count, 10000):
+            conn.execute(Product.__table__.insert(), rows[start:start + 10000])
+
+
+def median_ms(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    init_db()
+    seed(args.products)
+    db = SessionLocal()
+
+    def sql_top():
+        return db.query(Product.id).order_by((Product.quantity * Product.price).desc()).limit(10).all()
+
+    def sql_aggregate():
+        return db.query(
+            Product.type, func.count(Product.id), func.sum(Product.quantity), func.sum(Product.quantity * Product.price)
+        ).group_by(Product.type).all()
+
+    snapshot = CatalogSnapshot()
+    start = time.perf_counter()
+    snapshot.rebuild()
+    load = time.perf_counter() - start
+    stats = snapshot.stats()
+    if not stats["available"]:
+        print(f"snapshot unavailable: {stats['unavailable_reason']}")
+        return
+    print(f"{engine.url.get_backend_name()}, {stats['products']} products")
+    print(f"snapshot load {load:.2f}s, {stats['memory_bytes'] / 1024 / 1024:.1f} MB")
+
+    print(f"{'query':<12}{'sql ms':>10}{'snapshot ms':>14}")
+    for name, sql, snap in (
+        ("top 10", sql_top, lambda: snapshot.rank(by="value", limit=10)),
+        ("by type", sql_aggregate, snapshot.aggregate),
+    ):
+        print(f"{name:<12}{median_ms(sql, args.repeat):>10.2f}{median_ms(snap, args.repeat):>14.3f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
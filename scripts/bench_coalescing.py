@@ -0,0 +1,171 @@
+"""
+Scanner-load benchmark for quantity write coalescing.
+
+S scanner threads each send U quantity updates, one every --interval-ms,
+spread over a few hot SKUs. The same load runs twice: once with every
+update committed on its own (update_product_quantity) and once through the
+QuantityCoalescer. Reports commits, WAL bytes, throughput and latency.
+
+Usage:
+    python scripts/bench_coalescing.py [--scanners 16] [--updates 200] [--skus 4] [--window-ms 50]
+
+Uses DATABASE_URL when set (WAL measured with pg_current_wal_lsn on
+Postgres), otherwise a temporary SQLite file in WAL mode with
+auto-checkpointing off, so the -wal file size is the WAL written.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from sqlalchemy import event, text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app.database import SessionLocal, init_db, engine  # noqa: E402
+from app.models import Product  # noqa: E402
+from app.crud import update_product_quantity  # noqa: E402
+from app.coalescing import QuantityCoalescer  # noqa: E402
+
+commits = 0
+
+
+@event.listens_for(engine, "commit")
+def _count_commit(conn):
+    global commits
+    commits += 1
+
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _wal_mode(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA journal_mode=WAL")
+        dbapi_connection.execute("PRAGMA wal_autocheckpoint=0")
+
+
+def wal_position():
+    """
+    Bytes of WAL written so far (Postgres) or current -wal file size (SQLite).
+    """
+    if engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT pg_wal_lsn_diff(pg_current_wal_lsn(), '0/0')")).scalar()
+    path = engine.url.database + "-wal"
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def reset_wal():
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def setup(skus):
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(Product).filter(Product.sku.like("BENCH-SCAN-%")).delete(synchronize_session=False)
+        products = [
+            Product(name=f"Scanned {i}", type="Bench", sku=f"BENCH-SCAN-{i}", quantity=0, price=1.0)
+            for i in range(skus)
+        ]
+        db.add_all(products)
+        db.commit()
+        return [product.id for product in products]
+    finally:
+        db.close()
+
+
+def run(product_ids, args, send):
+    latencies = []
+    lock = threading.Lock()
+    retried = [0]
+
+    def scanner(index):
+        own = []
+        for n in range(args.updates):
+            product_id = product_ids[(index + n) % len(product_ids)]
+            start = time.perf_counter()
+            while True:
+                try:
+                    send(product_id, n)
+                    break
+                except OperationalError:
+                    # SQLite "database is locked" under write contention
+                    with lock:
+                        retried[0] += 1
+            own.append(time.perf_counter() - start)
+            time.sleep(args.interval_ms / 1000)
+        with lock:
+            latencies.extend(own)
+
+    reset_wal()
+    commits_before, wal_before = commits, wal_position()
+    threads = [threading.Thread(target=scanner, args=(i,)) for i in range(args.scanners)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "commits": commits - commits_before,
+        "wal_bytes": wal_position() - wal_before,
+        "elapsed": elapsed,
+        "updates": len(latencies),
+        "retried": retried[0],
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scanners", type=int, default=16)
+    parser.add_argument("--updates", type=int, default=200)
+    parser.add_argument("--skus", type=int, default=4)
+    parser.add_argument("--interval-ms", type=float, default=5)
+    parser.add_argument("--window-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    product_ids = setup(args.skus)
+
+    def direct(product_id, quantity):
+        db = SessionLocal()
+        try:
+            update_product_quantity(db, product_id, quantity)
+        finally:
+            db.close()
+
+    coalescer = QuantityCoalescer(args.window_ms / 1000)
+    coalescer.start()
+
+    def coalesced(product_id, quantity):
+        coalescer.submit(product_id, quantity).result()
+
+    results = {"direct": run(product_ids, args, direct), "coalesced": run(product_ids, args, coalesced)}
+    coalescer.stop()
+
+    print(f"backend:  {engine.url.get_backend_name()}")
+    print(f"load:     {args.scanners} scanners x {args.updates} updates on {args.skus} SKUs, "
+          f"one every {args.interval_ms:g} ms; window {args.window_ms:g} ms")
+    print(f"{'':12}{'commits':>10}{'WAL bytes':>14}{'updates/s':>12}{'p50 ms':>10}{'p99 ms':>10}{'retries':>10}")
+    for name, r in results.items():
+        print(f"{name:12}{r['commits']:>10}{r['wal_bytes']:>14}{r['updates'] / r['elapsed']:>12.0f}"
+              f"{r['p50_ms']:>10.1f}{r['p99_ms']:>10.1f}{r['retried']:>10}")
+    direct_r, coalesced_r = results["direct"], results["coalesced"]
+    print(f"commits reduced {direct_r['commits'] / max(coalesced_r['commits'], 1):.1f}x, "
+          f"WAL reduced {direct_r['wal_bytes'] / max(coalesced_r['wal_bytes'], 1):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Full-catalog reorder forecast at scale.
+
+Inserts --products products and, for each, sales on --sales-days random
+days of the last FORECAST_HISTORY_DAYS, then times run_forecast end to end
+and the vectorized forecast step alone on the same number of products.
+
+Usage:
+    python scripts/bench_forecast.py [--products 1000000] [--sales-days 10]
+
+Uses DATABASE_URL when set (e.g. a local Postgres), otherwise a temporary
+SQLite file.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import numpy as np  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+
+from app.database import init_db, engine  # noqa: E402
+from app.models import Product, StockDecrease  # noqa: E402
+from app.forecasting import (  # noqa: E402
+    FORECAST_BATCH_SIZE, FORECAST_HISTORY_DAYS, epoch_day, forecast, run_forecast
+)
+
+CHUNK = 50000
+
+
+def seed(products, sales_days):
+    run = uuid.uuid4().hex[:6]
+    rng = np.random.default_rng(0)
+    today = epoch_day()
+    created_at = datetime.now(timezone.utc) - timedelta(days=365)
+    with engine.begin() as conn:
+        first = (conn.execute(Product.__table__.select().with_only_columns(func.max(Product.id))).scalar() or 0) + 1
+        for start in range(0, products, CHUNK):
+            count = min(CHUNK, products - start)
+            conn.execute(Product.__table__.insert(), [
+                {"name": f"product {i}", "type": "bench", "sku": f"bench-{run}-{i}",
+                 "quantity": int(q), "price": 1.0, "reserved_quantity": 0, "created_at": created_at}
+                for i, q in zip(range(start, start + count), rng.integers(0, 200, count))
+            ])
+            ids = np.repeat(np.arange(first + start, first + start + count), sales_days)
+            # Distinct days per product: there is one row per product and day
+            offsets = np.argsort(rng.random((count, FORECAST_HISTORY_DAYS)), axis=1)[:, :sales_days] + 1
+            days = today - offsets.ravel()
+            units = rng.poisson(3, len(ids)) + 1
+            conn.execute(StockDecrease.__table__.insert(), [
+                {"product_id": p, "day": d, "quantity": u}
+                for p, d, u in zip(ids.tolist(), days.tolist(), units.tolist())
+            ])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=1000000)
+    parser.add_argument("--sales-days", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=FORECAST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    init_db()
+    start = time.perf_counter()
+    seed(args.products, args.sales_days)
+    print(f"{engine.url.get_backend_name()}: seeded {args.products} products, "
+          f"{args.products * args.sales_days} sales in {time.perf_counter() - start:.1f}s")
+
+    result = run_forecast(batch_size=args.batch_size)
+    print(f"run_forecast: {result}")
+
+    rng = np.random.default_rng(1)
+    compute = 0.0
+    for start in range(0, args.products, args.batch_size):
+        count = min(args.batch_size, args.products - start)
+        history = rng.poisson(0.3, (count, FORECAST_HISTORY_DAYS)).astype(float)
+        age = np.full(count, FORECAST_HISTORY_DAYS)
+        available = rng.integers(0, 200, count)
+        begin = time.perf_counter()
+        forecast(history, age, available)
+        compute += time.perf_counter() - begin
+    print(f"forecast() alone over {args.products} products: {compute:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
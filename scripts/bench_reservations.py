@@ -0,0 +1,114 @@
+"""
+Contention benchmark for stock reservations on a single hot SKU.
+
+N threads race to reserve one unit at a time from a product with a fixed
+quantity. Checks that exactly `quantity` holds succeed (no oversell, no lost
+holds) and reports throughput and the number of rejected attempts.
+
+Usage:
+    python scripts/bench_reservations.py [--threads 16] [--stock 500]
+
+Uses DATABASE_URL when set (e.g. a local Postgres), otherwise a temporary
+SQLite file.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from fastapi import HTTPException  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from app.database import SessionLocal, init_db, engine  # noqa: E402
+from app.models import Product, StockReservation  # noqa: E402
+from app.crud import create_reservation  # noqa: E402
+
+
+def setup(stock):
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(StockReservation).filter(StockReservation.product_id.in_(
+            db.query(Product.id).filter(Product.sku == "BENCH-HOT")
+        )).delete(synchronize_session=False)
+        db.query(Product).filter(Product.sku == "BENCH-HOT").delete()
+        product = Product(name="Hot SKU", type="Bench", sku="BENCH-HOT", quantity=stock, price=1.0)
+        db.add(product)
+        db.commit()
+        return product.id
+    finally:
+        db.close()
+
+
+def worker(product_id, results, lock):
+    succeeded = rejected = retried = 0
+    db = SessionLocal()
+    try:
+        while True:
+            try:
+                create_reservation(db, product_id, quantity=1, ttl_seconds=300)
+                succeeded += 1
+            except HTTPException as e:
+                if e.status_code != 409:
+                    raise
+                rejected += 1
+                break  # sold out
+            except OperationalError:
+                # SQLite "database is locked" under write contention
+                db.rollback()
+                retried += 1
+    finally:
+        db.close()
+    with lock:
+        results["succeeded"] += succeeded
+        results["rejected"] += rejected
+        results["retried"] += retried
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--stock", type=int, default=500)
+    args = parser.parse_args()
+
+    product_id = setup(args.stock)
+    results = {"succeeded": 0, "rejected": 0, "retried": 0}
+    lock = threading.Lock()
+    threads = [threading.Thread(target=worker, args=(product_id, results, lock)) for _ in range(args.threads)]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    db = SessionLocal()
+    product = db.query(Product).filter(Product.id == product_id).one()
+    active = db.query(StockReservation).filter(StockReservation.product_id == product_id).count()
+    db.close()
+
+    print(f"backend:             {engine.url.get_backend_name()}")
+    print(f"threads:             {args.threads}")
+    print(f"stock:               {args.stock}")
+    print(f"holds succeeded:     {results['succeeded']}")
+    print(f"sold-out rejections: {results['rejected']}")
+    print(f"lock retries:        {results['retried']}")
+    print(f"reserved_quantity:   {product.reserved_quantity}")
+    print(f"elapsed:             {elapsed:.3f} s ({results['succeeded'] / elapsed:.0f} holds/s)")
+
+    consistent = results["succeeded"] == args.stock == product.reserved_quantity == active
+    print("consistent:          " + ("yes" if consistent else "NO - oversold or lost holds"))
+    sys.exit(0 if consistent else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Cold vs warm latency of SKU (barcode) lookups.
+
+Creates --products products, then looks up random SKUs drawn from a small
+hot set, first with the SKU cache cleared before every lookup (cold: one
+indexed query per lookup) and then with it warm. Also times batch lookups
+of --batch SKUs.
+
+Usage:
+    python scripts/bench_sku_lookup.py [--products 5000] [--lookups 2000] [--hot 200] [--batch 50]
+
+Uses DATABASE_URL when set (e.g. a local Postgres), otherwise a temporary
+SQLite file.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+if not os.getenv("DATABASE_URL"):
+    os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from sqlalchemy import insert  # noqa: E402
+
+from app.database import SessionLocal, init_db, engine  # noqa: E402
+from app.models import Product  # noqa: E402
+from app.cache import sku_cache  # noqa: E402
+from app.crud import get_product_by_sku_cached, get_products_by_skus_cached  # noqa: E402
+
+
+def setup(count):
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(Product).filter(Product.sku.like("BENCH-SKU-%")).delete(synchronize_session=False)
+        db.execute(insert(Product), [
+            {"name": f"Product {i}", "type": "Bench", "sku": f"BENCH-SKU-{i:06d}", "quantity": i % 50, "price": 1.0}
+            for i in range(count)
+        ])
+        db.commit()
+    finally:
+        db.close()
+    return [f"BENCH-SKU-{i:06d}" for i in range(count)]
+
+
+def measure(calls, clear):
+    timings = []
+    db = SessionLocal()
+    try:
+        for call in calls:
+            if clear:
+                sku_cache.clear()
+            start = time.perf_counter()
+            call(db)
+            timings.append(time.perf_counter() - start)
+            db.rollback()  # end the read transaction like a request would
+    finally:
+        db.close()
+    timings.sort()
+    return {
+        "p50_ms": statistics.median(timings) * 1000,
+        "p99_ms": timings[int(len(timings) * 0.99) - 1] * 1000,
+        "mean_ms": statistics.fmean(timings) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--hot", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=50)
+    args = parser.parse_args()
+
+    skus = setup(args.products)
+    hot = random.sample(skus, min(args.hot, len(skus)))
+    singles = [random.choice(hot) for _ in range(args.lookups)]
+    batches = [random.sample(hot, min(args.batch, len(hot))) for _ in range(max(args.lookups // args.batch, 10))]
+
+    def single(sku):
+        return lambda db: get_product_by_sku_cached(db, sku)
+
+    def batch(group):
+        return lambda db: get_products_by_skus_cached(db, group)
+
+    results = {
+        "single cold": measure([single(sku) for sku in singles], clear=True),
+        "single warm": None,
+        f"batch of {args.batch} cold": measure([batch(group) for group in batches], clear=True),
+        f"batch of {args.batch} warm": None,
+    }
+    # Fill the cache with the hot set, then measure warm
+    measure([single(sku) for sku in hot], clear=False)
+    results["single warm"] = measure([single(sku) for sku in singles], clear=False)
+    results[f"batch of {args.batch} warm"] = measure([batch(group) for group in batches], clear=False)
+
+    print(f"backend:  {engine.url.get_backend_name()}")
+    print(f"catalog:  {args.products} products, {len(hot)} hot SKUs")
+    print(f"{'':22}{'p50 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for name, r in results.items():
+        print(f"{name:22}{r['p50_ms']:>10.3f}{r['p99_ms']:>10.3f}{r['mean_ms']:>10.3f}")
+    print(f"sku cache: {sku_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
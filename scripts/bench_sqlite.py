@@ -0,0 +1,158 @@
+"""
+Read-heavy load against SQLite mode and Postgres.
+
+--threads workers run a mix of product list pages, lookups by id and by
+SKU, with --write-ratio of the operations being quantity updates, for
+--seconds against each backend. Reads skip the result cache so the
+database does the work. Each backend runs in its own process, because the
+engine is configured from DATABASE_URL at import time.
+
+Usage:
+    python scripts/bench_sqlite.py [--postgres-url postgresql://...] [--threads 8] [--seconds 5]
+
+The Postgres run is skipped unless --postgres-url (or BENCH_POSTGRES_URL)
+is given. SQLite runs twice on temporary files: with the tuned pragmas
+from app.database, and with SQLite's defaults (rollback journal,
+synchronous=FULL, 2 MB cache, no mmap). Both use the writer lock.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def child(args):
+    from sqlalchemy import insert
+    from sqlalchemy.exc import OperationalError
+
+    from app.database import SessionLocal, init_db, engine
+    from app.models import Product
+    from app.crud import get_products, get_product_by_id, get_product_by_sku, update_product_quantity
+
+    init_db()
+    db = SessionLocal()
+    try:
+        db.query(Product).filter(Product.sku.like("BENCH-READ-%")).delete(synchronize_session=False)
+        db.execute(insert(Product), [
+            {"name": f"Product {i}", "type": "Bench", "sku": f"BENCH-READ-{i:06d}", "quantity": 10, "price": 1.0}
+            for i in range(args.products)
+        ])
+        db.commit()
+        ids = [product_id for (product_id,) in db.query(Product.id).filter(Product.sku.like("BENCH-READ-%"))]
+    finally:
+        db.close()
+
+    reads, writes, errors = [], [], [0]
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.seconds
+
+    def worker():
+        own_reads, own_writes = [], []
+        rng = random.Random()
+        db = SessionLocal()
+        try:
+            while time.monotonic() < deadline:
+                roll = rng.random()
+                start = time.perf_counter()
+                try:
+                    if roll < args.write_ratio:
+                        update_product_quantity(db, rng.choice(ids), rng.randint(0, 100))
+                        own_writes.append(time.perf_counter() - start)
+                        continue
+                    if roll < 0.4:
+                        get_products(db, skip=rng.randint(0, max(len(ids) - 50, 0)), limit=50)
+                    elif roll < 0.7:
+                        get_product_by_id(db, rng.choice(ids))
+                    else:
+                        get_product_by_sku(db, f"BENCH-READ-{rng.randrange(args.products):06d}")
+                    db.rollback()  # end the read transaction like a request would
+                    own_reads.append(time.perf_counter() - start)
+                except OperationalError:
+                    db.rollback()
+                    with lock:
+                        errors[0] += 1
+        finally:
+            db.close()
+        with lock:
+            reads.extend(own_reads)
+            writes.extend(own_writes)
+
+    threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    def percentiles(timings):
+        timings.sort()
+        if not timings:
+            return 0.0, 0.0
+        return statistics.median(timings) * 1000, timings[int(len(timings) * 0.99) - 1] * 1000
+
+    print(json.dumps({
+        "reads_per_s": len(reads) / args.seconds,
+        "writes_per_s": len(writes) / args.seconds,
+        "read_ms": percentiles(reads),
+        "write_ms": percentiles(writes),
+        "errors": errors[0],
+    }))
+
+
+SQLITE_DEFAULTS = {
+    "SQLITE_JOURNAL_MODE": "DELETE", "SQLITE_SYNCHRONOUS": "FULL",
+    "SQLITE_CACHE_SIZE_KB": "2000", "SQLITE_MMAP_SIZE": "0",
+}
+
+
+def run(name, url, args, settings=None):
+    command = [sys.executable, os.path.abspath(__file__), "--child",
+               "--threads", str(args.threads), "--seconds", str(args.seconds),
+               "--products", str(args.products), "--write-ratio", str(args.write_ratio)]
+    env = {**os.environ, **(settings or {}), "DATABASE_URL": url}
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    return name, json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--postgres-url", default=os.getenv("BENCH_POSTGRES_URL"))
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--write-ratio", type=float, default=0.05)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args)
+        return
+
+    directory = tempfile.mkdtemp()
+    results = [
+        run("sqlite tuned", "sqlite:///" + os.path.join(directory, "tuned.db"), args),
+        run("sqlite default", "sqlite:///" + os.path.join(directory, "default.db"), args, SQLITE_DEFAULTS),
+    ]
+    if args.postgres_url:
+        results.append(run("postgres", args.postgres_url, args))
+
+    print(f"load: {args.threads} threads for {args.seconds:g}s, {args.products} products, "
+          f"{args.write_ratio:.0%} writes")
+    print(f"{'':16}{'reads/s':>10}{'writes/s':>10}{'read p50':>10}{'read p99':>10}"
+          f"{'write p50':>11}{'write p99':>11}{'errors':>8}")
+    for name, r in results:
+        print(f"{name:16}{r['reads_per_s']:>10.0f}{r['writes_per_s']:>10.0f}"
+              f"{r['read_ms'][0]:>10.2f}{r['read_ms'][1]:>10.2f}"
+              f"{r['write_ms'][0]:>11.2f}{r['write_ms'][1]:>11.2f}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
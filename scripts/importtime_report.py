@@ -0,0 +1,91 @@
+"""
+Import-time report and cold-start budget check.
+
+Runs `python -X importtime -c "import api.index"` in a fresh interpreter,
+prints the slowest modules by cumulative import time and exits non-zero if
+the total goes over the budget or if a module that should be lazy-loaded
+shows up at import time.
+
+Usage:
+    python scripts/importtime_report.py [--budget-ms 1500] [--top 25]
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_TIME_BUDGET_MS", "1500"))
+
+# Modules that must only be imported when a request actually needs them
+LAZY_MODULES = [
+    "google.oauth2",
+    "google.auth.transport.requests",
+    "requests",
+    "passlib.context",
+    "bcrypt",
+    "jose",
+    "PIL",
+]
+
+
+def run_importtime(target):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {target}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr, file=sys.stderr)
+        raise SystemExit(f"Importing {target} failed")
+    return result.stderr
+
+
+def parse(stderr):
+    """
+    Parse `-X importtime` output into (module, self_us, cumulative_us) rows.
+    """
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--target", default="api.index")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    rows = parse(run_importtime(args.target))
+    total_ms = sum(self_us for _, self_us, _ in rows) / 1000
+
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for name, self_us, cumulative_us in sorted(rows, key=lambda r: r[2], reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:14.1f} {self_us / 1000:9.1f}  {name}")
+    print(f"\nTotal import time for {args.target}: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+
+    failures = []
+    imported = {name for name, _, _ in rows}
+    eager = [m for m in LAZY_MODULES if m in imported]
+    if eager:
+        failures.append(f"modules that should be lazy were imported eagerly: {', '.join(eager)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms is over the {args.budget_ms:.0f} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Shared fixtures. The app reads DATABASE_URL when app.database is imported,
+so it is pointed at a fresh SQLite file before any app module loads.
+"""
+import os
+import tempfile
+import uuid
+
+_directory = tempfile.mkdtemp(prefix="inventory-tests-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_directory, 'test.db')}"
+
+import pytest  # noqa: E402
+
+from app.database import SessionLocal, init_db  # noqa: E402
+from app.models import Product  # noqa: E402
+
+
+@pytest.fixture(scope="session", autouse=True)
+def schema():
+    init_db()
+
+
+@pytest.fixture
+def db():
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture
+def make_product(db):
+    """
+    Insert a product with a unique SKU (and, unless given, a unique type so
+    per-type totals don't mix between tests).
+    """
+    def make(**values):
+        values.setdefault("sku", f"T-{uuid.uuid4().hex[:12]}")
+        values.setdefault("name", values["sku"])
+        values.setdefault("type", f"type-{uuid.uuid4().hex[:8]}")
+        values.setdefault("quantity", 10)
+        values.setdefault("price", 2.0)
+        product = Product(**values)
+        db.add(product)
+        db.commit()
+        db.refresh(product)
+        return product
+    return make
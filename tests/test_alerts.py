@@ -0,0 +1,61 @@
+import pytest
+
+from app import alerts
+from app.alerts import LOW_STOCK, RESTOCKED, AlertDispatcher
+from app.crud import set_reorder_threshold, update_product_quantity
+from app.database import SessionLocal
+from app.models import Product
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """
+    Alerts delivered through a MemorySink, read once the dispatcher drains.
+    """
+    dispatcher = AlertDispatcher(["memory"])
+    dispatcher.start()
+    sink = dispatcher.sink("memory")
+    monkeypatch.setattr(alerts, "alert_dispatcher", dispatcher)
+
+    def drain():
+        dispatcher.stop()
+        return [(alert["type"], alert["quantity"], alert["previous_quantity"]) for alert in sink.alerts]
+    yield drain
+    dispatcher.stop()
+
+
+def test_alerts_fire_only_when_crossing_the_threshold(db, make_product, sent):
+    product = make_product(quantity=15, reorder_threshold=10)
+
+    update_product_quantity(db, product.id, 12)  # still above
+    update_product_quantity(db, product.id, 5)   # crosses down
+    update_product_quantity(db, product.id, 3)   # still low
+    update_product_quantity(db, product.id, 10)  # back to the threshold, no longer low
+
+    assert sent() == [(LOW_STOCK, 5, 12), (RESTOCKED, 10, 3)]
+
+
+def test_raising_the_threshold_can_make_a_product_low(db, make_product, sent):
+    product = make_product(quantity=8, reorder_threshold=5)
+
+    set_reorder_threshold(db, product.id, 10)
+
+    assert sent() == [(LOW_STOCK, 8, 8)]
+
+
+def test_relative_updates_and_rollbacks(db, make_product, sent):
+    product = make_product(quantity=12, reorder_threshold=10)
+
+    session = SessionLocal()
+    try:
+        alerts.track_stock_change(session, product.id, -5)
+        session.query(Product).filter(Product.id == product.id).update({Product.quantity: Product.quantity - 5})
+        session.rollback()
+        alerts.track_stock_change(session, product.id, -4)
+        session.query(Product).filter(Product.id == product.id).update({Product.quantity: Product.quantity - 4})
+        session.commit()
+    finally:
+        session.close()
+
+    # The rolled back change neither alerts nor skews the committed one's previous quantity
+    assert sent() == [(LOW_STOCK, 8, 12)]
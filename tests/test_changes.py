@@ -0,0 +1,58 @@
+import uuid
+
+from app.changes import get_product_changes
+from app.crud import create_product, delete_product, update_product_quantity
+from app.schemas import ProductCreate
+
+
+def create(db, quantity=1):
+    sku = f"C-{uuid.uuid4().hex[:12]}"
+    return create_product(db, ProductCreate(name=sku, type="changes", sku=sku, quantity=quantity, price=1.0))
+
+
+def sync(db, since, limit):
+    """
+    Page until has_more is false; returns every page and the final token.
+    """
+    pages = []
+    while True:
+        page = get_product_changes(db, since, limit)
+        pages.append(page)
+        since = page["next"]
+        if not page["has_more"]:
+            return pages, since
+
+
+def test_pages_cover_every_change_once(db):
+    _, since = sync(db, None, 500)
+
+    products = [create(db) for _ in range(5)]
+    update_product_quantity(db, products[0].id, 7)   # moves to the end of the feed
+    delete_product(db, products[1].id)
+
+    pages, token = sync(db, since, 2)
+
+    changed = [product.id for page in pages for product in page["changes"]]
+    deleted = [row["id"] for page in pages for row in page["deleted"]]
+    assert len(changed) == len(set(changed))
+    assert sorted(changed) == sorted(p.id for p in products if p.id != products[1].id)
+    assert deleted == [products[1].id]
+    # The updated product is listed once, with its new quantity
+    assert [p.quantity for page in pages for p in page["changes"] if p.id == products[0].id] == [7]
+    assert all(len(page["changes"]) + len(page["deleted"]) <= 2 for page in pages)
+
+    # Caught up: nothing more until the next write
+    assert get_product_changes(db, token, 2) == {"changes": [], "deleted": [], "next": token, "has_more": False}
+
+
+def test_token_resumes_after_the_last_change_seen(db):
+    _, since = sync(db, None, 500)
+    first = create(db)
+    page = get_product_changes(db, since, 500)
+    assert [p.id for p in page["changes"]] == [first.id]
+
+    second = create(db)
+    update_product_quantity(db, first.id, 9)
+    page = get_product_changes(db, page["next"], 500)
+
+    assert [p.id for p in page["changes"]] == [second.id, first.id]
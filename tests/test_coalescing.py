@@ -0,0 +1,56 @@
+import threading
+
+from app.coalescing import QuantityCoalescer
+
+
+def test_updates_in_one_window_are_written_together(make_product):
+    product = make_product(quantity=1)
+    coalescer = QuantityCoalescer(0.05)
+    coalescer.start()
+    try:
+        futures = [coalescer.submit(product.id, quantity) for quantity in (2, 3, 4)]
+        results = [future.result(timeout=5) for future in futures]
+    finally:
+        coalescer.stop()
+
+    assert [result.quantity for result in results] == [4, 4, 4]
+    assert coalescer.rows_written == 1
+
+
+def test_submissions_outside_start_and_stop_are_refused(make_product):
+    product = make_product(quantity=1)
+    coalescer = QuantityCoalescer(0.05)
+    assert coalescer.submit(product.id, 2) is None
+
+    coalescer.start()
+    coalescer.stop()
+
+    assert coalescer.submit(product.id, 3) is None
+
+
+def test_stop_resolves_everything_it_accepted(make_product):
+    product = make_product(quantity=1)
+    coalescer = QuantityCoalescer(0.01)
+    coalescer.start()
+    accepted = []
+    stopping = threading.Event()
+
+    def scanner():
+        quantity = 0
+        while not stopping.is_set():
+            quantity += 1
+            future = coalescer.submit(product.id, quantity)
+            if future is None:
+                return
+            accepted.append(future)
+
+    threads = [threading.Thread(target=scanner) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    coalescer.stop()
+    stopping.set()
+    for thread in threads:
+        thread.join()
+
+    assert accepted
+    assert all(future.result(timeout=5).id == product.id for future in accepted)
@@ -0,0 +1,105 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from jose import jwt
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from app.auth import ALGORITHM, SECRET_KEY
+from app.idempotency import DatabaseIdempotencyStore, IdempotencyCache, IdempotencyMiddleware
+
+
+def token(username):
+    return jwt.encode({
+        "sub": username, "type": "access", "jti": uuid.uuid4().hex,
+        "exp": datetime.now(timezone.utc) + timedelta(minutes=5),
+    }, SECRET_KEY, algorithm=ALGORITHM)
+
+
+@pytest.fixture
+def calls():
+    return []
+
+
+@pytest.fixture
+def client(calls):
+    async def create(request):
+        calls.append(await request.json())
+        if len(calls) == 1 and request.query_params.get("fail_first"):
+            return JSONResponse({"detail": "boom"}, status_code=500)
+        return JSONResponse({"call": len(calls)}, status_code=201)
+
+    app = IdempotencyMiddleware(
+        Starlette(routes=[Route("/things", create, methods=["POST"])]),
+        cache=IdempotencyCache(),
+        database=DatabaseIdempotencyStore(),
+        max_body_bytes=1024,
+    )
+    return TestClient(app)
+
+
+def headers(key, username="alice"):
+    return {"Idempotency-Key": key, "Authorization": f"Bearer {token(username)}"}
+
+
+def test_retry_replays_the_stored_response(client, calls):
+    key = uuid.uuid4().hex
+    first = client.post("/things", json={"n": 1}, headers=headers(key))
+    # A new token for the same user, as after a refresh
+    retry = client.post("/things", json={"n": 1}, headers=headers(key))
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true"
+    assert len(calls) == 1
+
+
+def test_keys_are_scoped_to_the_user(client, calls):
+    key = uuid.uuid4().hex
+    client.post("/things", json={"n": 1}, headers=headers(key, "alice"))
+    other = client.post("/things", json={"n": 1}, headers=headers(key, "bob"))
+
+    assert "idempotent-replayed" not in other.headers
+    assert len(calls) == 2
+
+
+def test_reused_key_with_a_different_body_is_rejected(client, calls):
+    key = uuid.uuid4().hex
+    client.post("/things", json={"n": 1}, headers=headers(key))
+    response = client.post("/things", json={"n": 2}, headers=headers(key))
+
+    assert response.status_code == 422
+    assert len(calls) == 1
+
+
+def test_server_error_releases_the_claim(client, calls):
+    key = uuid.uuid4().hex
+    failed = client.post("/things?fail_first=1", json={"n": 1}, headers=headers(key))
+    assert failed.status_code == 500
+
+    # Runs again rather than getting a 409 for a claim still in progress
+    retry = client.post("/things?fail_first=1", json={"n": 1}, headers=headers(key))
+    assert retry.status_code == 201
+    assert "idempotent-replayed" not in retry.headers
+    assert len(calls) == 2
+
+
+def test_oversized_body_is_refused(client, calls):
+    response = client.post("/things", content=b"x" * 2048, headers=headers(uuid.uuid4().hex))
+
+    assert response.status_code == 413
+    assert calls == []
+
+
+def test_expired_claim_can_be_taken_over():
+    key = uuid.uuid4().hex
+    store = DatabaseIdempotencyStore()
+
+    assert DatabaseIdempotencyStore(claim_timeout_seconds=0).claim(key, "fingerprint")
+    # The first worker died without saving or releasing; its lease has run out
+    assert store.claim(key, "fingerprint")
+    # The new claim holds until its own lease runs out
+    assert not store.claim(key, "fingerprint")
@@ -0,0 +1,61 @@
+import threading
+
+import pytest
+from fastapi import HTTPException
+
+from app.crud import create_reservation, release_reservation, update_product_quantity
+from app.database import SessionLocal
+from app.models import Product
+
+
+def test_concurrent_holds_never_oversell(db, make_product):
+    product = make_product(quantity=10)
+    attempts = 30
+    barrier = threading.Barrier(attempts)
+    outcomes = []
+
+    def hold():
+        session = SessionLocal()
+        try:
+            barrier.wait()
+            create_reservation(session, product.id, 1, ttl_seconds=60)
+            outcomes.append("held")
+        except HTTPException as e:
+            outcomes.append(e.status_code)
+        finally:
+            session.close()
+
+    threads = [threading.Thread(target=hold) for _ in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert outcomes.count("held") == 10
+    assert outcomes.count(409) == attempts - 10
+    db.expire_all()
+    assert db.get(Product, product.id).reserved_quantity == 10
+
+
+def test_quantity_update_below_reserved_is_rejected(db, make_product):
+    product = make_product(quantity=10)
+    create_reservation(db, product.id, 4, ttl_seconds=60)
+
+    with pytest.raises(HTTPException) as error:
+        update_product_quantity(db, product.id, 3)
+    assert error.value.status_code == 409
+
+    assert update_product_quantity(db, product.id, 4).quantity == 4
+
+
+def test_release_returns_the_held_units(db, make_product):
+    product = make_product(quantity=5)
+    reservation = create_reservation(db, product.id, 5, ttl_seconds=60)
+    with pytest.raises(HTTPException):
+        create_reservation(db, product.id, 1, ttl_seconds=60)
+
+    release_reservation(db, reservation.id)
+
+    db.expire_all()
+    assert db.get(Product, product.id).reserved_quantity == 0
+    assert create_reservation(db, product.id, 1, ttl_seconds=60).quantity == 1
@@ -0,0 +1,86 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import rollups
+from app.crud import create_product, delete_product, update_product_quantity
+from app.models import InventoryRollup, InventoryTotal
+from app.rollups import RollupWriter, apply_deltas, bucket_start
+from app.schemas import ProductCreate
+
+
+def new_type():
+    return f"type-{uuid.uuid4().hex[:8]}"
+
+
+def totals(db, product_type):
+    db.expire_all()
+    total = db.get(InventoryTotal, product_type)
+    return (total.units, round(total.value, 2), total.skus) if total else None
+
+
+def bucket(db, granularity, moment, product_type):
+    row = db.query(InventoryRollup).filter(
+        InventoryRollup.granularity == granularity,
+        InventoryRollup.bucket == bucket_start(moment, granularity),
+        InventoryRollup.type == product_type,
+    ).one()
+    return (row.units, round(row.value, 2), row.skus)
+
+
+def test_deltas_accumulate_into_totals_and_buckets(db):
+    product_type = new_type()
+    now = datetime(2026, 3, 1, 10, 15, tzinfo=timezone.utc)
+
+    apply_deltas({product_type: [10, 25.0, 2]}, now)
+    apply_deltas({product_type: [-4, -10.0, 0]}, now + timedelta(minutes=30))
+
+    assert totals(db, product_type) == (6, 15.0, 2)
+    assert bucket(db, "hour", now, product_type) == (6, 15.0, 2)
+    assert bucket(db, "day", now, product_type) == (6, 15.0, 2)
+
+    # The next hour gets its own row; the finished one keeps its last value
+    apply_deltas({product_type: [1, 2.5, 1]}, now + timedelta(hours=1))
+    assert bucket(db, "hour", now, product_type) == (6, 15.0, 2)
+    assert bucket(db, "hour", now + timedelta(hours=1), product_type) == (7, 17.5, 3)
+    assert bucket(db, "day", now, product_type) == (7, 17.5, 3)
+
+
+@pytest.fixture
+def writer(monkeypatch):
+    """
+    A RollupWriter that only applies deltas when the test flushes it.
+    """
+    writer = RollupWriter()
+    monkeypatch.setattr(rollups, "rollup_writer", writer)
+    monkeypatch.setattr(rollups, "ROLLUPS_ENABLED", True)
+    return writer
+
+
+def test_committed_writes_reach_the_totals(db, writer):
+    product_type = new_type()
+
+    kept = create_product(db, ProductCreate(name="A", type=product_type, sku=uuid.uuid4().hex, quantity=4, price=2.5))
+    gone = create_product(db, ProductCreate(name="B", type=product_type, sku=uuid.uuid4().hex, quantity=3, price=1.0))
+    update_product_quantity(db, kept.id, 10)
+    delete_product(db, gone.id)
+    # Nothing is applied until the writer flushes
+    assert totals(db, product_type) is None
+
+    writer.flush()
+
+    assert totals(db, product_type) == (10, 25.0, 1)
+    assert bucket(db, "hour", datetime.now(timezone.utc), product_type) == (10, 25.0, 1)
+
+
+def test_rolled_back_writes_are_not_counted(db, writer):
+    product_type = new_type()
+    product = create_product(db, ProductCreate(name="A", type=product_type, sku=uuid.uuid4().hex, quantity=4, price=1.0))
+
+    rollups.track_inventory_change(db, product_type, 100, 100.0)
+    db.rollback()
+    update_product_quantity(db, product.id, 6)
+    writer.flush()
+
+    assert totals(db, product_type) == (6, 6.0, 1)